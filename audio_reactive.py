@@ -0,0 +1,287 @@
+import sys
+import math
+import time
+import threading
+from collections import namedtuple
+import numpy as np
+import pygame
+from beat_analysis import ANALYSIS_RATE, FRAME_SIZE, HOP_SIZE, read_wav, resample
+
+# Frequency bands the energies and onsets are measured in, in Hz: bass, mid, high
+BANDS = [(20, 250), (250, 2000), (2000, 8000)]
+
+RING_SECONDS = 2           # Samples kept in the ring buffer
+MAX_CATCH_UP = 32          # Most hops analysed in one go, older ones are skipped after a stall
+DYNAMIC_RANGE_DB = 30      # Energies are shown from this far below the recent peak of the band
+PEAK_DECAY_DB = 6          # dB per second the peak of a band falls back when the music gets quieter
+MIN_PEAK_DB = -50          # Quieter than this is silence
+RELEASE = 4                # Energy per second an energy falls back after a peak, rises are immediate
+ONSET_HISTORY = 43         # Hops of spectral flux an onset is compared with, about half a second
+ONSET_SENSITIVITY = 2.0    # Standard deviations above the mean flux of the history for an onset
+MIN_FLUX = 2.0             # Smaller changes in the spectrum are never onsets
+ONSET_GAP = 0.1            # Seconds after an onset before the same band can have another one
+
+# What the game reads each frame. song_time is the end of the last analysed window, energies go from 0
+# (quiet) to 1 (as loud as the band recently got) per band, onsets counts the onsets of each band so far,
+# a reader sees an onset as a count that changed since it last looked.
+AudioSnapshot = namedtuple('AudioSnapshot', 'song_time energies onsets')
+
+
+# Mono float32 samples of a track at ANALYSIS_RATE. WAV files are read directly, anything else is
+# decoded by the mixer, which has to be started.
+def decode_track(path):
+    if path.lower().endswith('.wav'):
+        samples, rate = read_wav(path)
+        return resample(samples, rate, ANALYSIS_RATE)
+
+    rate, size, channels = pygame.mixer.get_init()
+    raw = pygame.sndarray.array(pygame.mixer.Sound(path))
+    if raw.ndim == 1:
+        raw = raw[:, None]
+    mono = np.empty(len(raw), np.float32)
+    for start in range(0, len(raw), 1 << 18):
+        chunk = raw[start:start + (1 << 18)].astype(np.float32).mean(axis=1)
+        if raw.dtype.kind == 'u':
+            chunk -= 2 ** (raw.dtype.itemsize * 8 - 1)
+        if raw.dtype.kind in 'iu':
+            chunk /= 2 ** (raw.dtype.itemsize * 8 - 1)
+        mono[start:start + len(chunk)] = chunk
+    return resample(mono, rate, ANALYSIS_RATE)
+
+
+# The most recent samples of a stream. Samples are numbered from the start of the stream, written counts
+# every sample ever written. Writing and reading may happen on different threads.
+class SampleRing:
+    def __init__(self, size):
+        self.buffer = np.zeros(size, np.float32)
+        self.size = size
+        self.written = 0
+        self.lock = threading.Lock()
+
+    # Append samples, only the last size of them are kept when more are written at once
+    def write(self, samples):
+        count = len(samples)
+        samples = samples[-self.size:]
+        with self.lock:
+            start = (self.written + count - len(samples)) % self.size
+            first = min(len(samples), self.size - start)
+            self.buffer[start:start + first] = samples[:first]
+            self.buffer[:len(samples) - first] = samples[first:]
+            self.written += count
+
+    # Copy of samples [end - count, end), zeros for samples that were never written or are overwritten
+    def read(self, end, count):
+        out = np.zeros(count, np.float32)
+        with self.lock:
+            first = max(end - count, self.written - self.size, 0)
+            if first >= end:
+                return out
+            start = first % self.size
+            part = min(end - first, self.size - start)
+            out[count - (end - first):count - (end - first) + part] = self.buffer[start:start + part]
+            out[count - (end - first) + part:] = self.buffer[:end - first - part]
+        return out
+
+
+# Analyses the music in a background thread. The samples that have been played so far, by clock(), are
+# fed into a ring buffer; every HOP_SIZE samples a Hann-windowed FFT of the last FRAME_SIZE samples gives the
+# energy of every band and its spectral flux, which is compared with the recent flux to find onsets.
+# The game loop only reads self.snapshot, a new one is published after every round of analysis.
+# Give the track as a file (decoded on the thread) or as samples, or feed() samples from another source.
+class AudioAnalyser:
+    def __init__(self, clock=None, track=None, samples=None, rate=ANALYSIS_RATE):
+        self.clock = clock  # Seconds of the track played so far
+        self.track = track
+        self.samples = samples
+        self.rate = rate
+        self.hop_time = HOP_SIZE / rate
+        self.ring = SampleRing(int(RING_SECONDS * rate))
+        self.fed = 0
+
+        # Spectrum bins of each band, as a matrix that sums the bins of every band at once
+        frequencies = np.fft.rfftfreq(FRAME_SIZE, 1 / rate)
+        self.band_matrix = np.array([(frequencies >= low) & (frequencies < high) for low, high in BANDS],
+                                    np.float32).T
+        self.window = np.hanning(FRAME_SIZE).astype(np.float32)
+        self.window_gain = self.window.sum() / 2  # A full scale sine wave peaks at 1 in the spectrum
+
+        bands = len(BANDS)
+        self.analysed = 0  # Samples up to here have been analysed
+        self.hops = 0
+        self.previous = None
+        self.peak_db = [MIN_PEAK_DB] * bands
+        self.energies = [0.0] * bands
+        self.flux_history = [[0.0] * ONSET_HISTORY for _ in range(bands)]
+        self.flux_sums = [0.0] * bands  # Sums of the flux history and of its squares, for mean and deviation
+        self.flux_squares = [0.0] * bands
+        self.last_onset = [-10 ** 9] * bands
+        self.onsets = [0] * bands
+        self.snapshot = AudioSnapshot(0.0, (0.0,) * bands, (0,) * bands)
+
+        self.error = None  # Why the track could not be decoded
+        self.busy = 0.0  # CPU seconds used by the analysis thread
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def feed(self, samples):
+        self.ring.write(np.asarray(samples, np.float32))
+
+    def run(self):
+        if self.track is not None:
+            try:
+                self.samples = decode_track(self.track)
+            except (pygame.error, OSError, ValueError) as error:
+                self.error = error
+                return
+        while not self.stopped.wait(self.hop_time):
+            start = time.thread_time()
+            if self.samples is not None and self.clock is not None:
+                position = min(int(self.clock() * self.rate), len(self.samples))
+                if position > self.fed:
+                    self.feed(self.samples[self.fed:position])
+                    self.fed = position
+            self.analyse()
+            self.busy += time.thread_time() - start
+
+    # Analyse every whole hop written since the last call and publish the result
+    def analyse(self):
+        written = self.ring.written
+        hops = (written - self.analysed) // HOP_SIZE
+        if hops <= 0:
+            return
+        if hops > MAX_CATCH_UP:
+            self.analysed += (hops - MAX_CATCH_UP) * HOP_SIZE
+            self.previous = None
+            hops = MAX_CATCH_UP
+        end = self.analysed + hops * HOP_SIZE
+        samples = self.ring.read(end, (hops - 1) * HOP_SIZE + FRAME_SIZE)
+        frames = np.lib.stride_tricks.as_strided(samples, (hops, FRAME_SIZE),
+                                                 (HOP_SIZE * samples.strides[0], samples.strides[0]))
+        spectrum = np.abs(np.fft.rfft(frames * self.window, axis=1)) / self.window_gain
+        band_db = 10 * np.log10(spectrum ** 2 @ self.band_matrix + 1e-12)
+
+        magnitudes = np.log1p(1000 * spectrum)
+        if self.previous is None:
+            self.previous = magnitudes[:1]
+        flux = np.maximum(np.diff(np.vstack([self.previous, magnitudes]), axis=0), 0) @ self.band_matrix
+        self.previous = magnitudes[-1:]
+
+        # The bands of one hop are only a few numbers, plain floats are faster than NumPy for them
+        band_db = band_db.tolist()
+        flux = flux.tolist()
+        decay = PEAK_DECAY_DB * self.hop_time
+        release = RELEASE * self.hop_time
+        gap = ONSET_GAP / self.hop_time
+        for hop in range(hops):
+            filled = min(self.hops, ONSET_HISTORY)
+            slot = self.hops % ONSET_HISTORY
+            for band in range(len(BANDS)):
+                # Energies relative to the recent peak of their band
+                db = band_db[hop][band]
+                peak = self.peak_db[band] = max(db, self.peak_db[band] - decay, MIN_PEAK_DB)
+                level = min(max((db - peak + DYNAMIC_RANGE_DB) / DYNAMIC_RANGE_DB, 0.0), 1.0)
+                self.energies[band] = max(level, self.energies[band] - release)
+
+                # Onsets stand out from the flux of the last half second
+                value = flux[hop][band]
+                if filled:
+                    mean = self.flux_sums[band] / filled
+                    deviation = math.sqrt(max(self.flux_squares[band] / filled - mean * mean, 0.0))
+                    if value > mean + ONSET_SENSITIVITY * deviation and value > MIN_FLUX and \
+                            self.hops - self.last_onset[band] >= gap:
+                        self.onsets[band] += 1
+                        self.last_onset[band] = self.hops
+                history = self.flux_history[band]
+                if filled == ONSET_HISTORY:
+                    self.flux_sums[band] -= history[slot]
+                    self.flux_squares[band] -= history[slot] * history[slot]
+                history[slot] = value
+                self.flux_sums[band] += value
+                self.flux_squares[band] += value * value
+            self.hops += 1
+
+        self.analysed = end
+        self.snapshot = AudioSnapshot(end / self.rate, tuple(self.energies), tuple(self.onsets))
+
+    # CPU used by the analysis as a fraction of the time it has been running
+    def load(self, elapsed):
+        return self.busy / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+# Drums for testing: a kick on every beat, a hi-hat between beats and a quiet chord all the time
+def test_signal(seconds, bpm=120, rate=ANALYSIS_RATE, seed=1):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    signal = 0.05 * (np.sin(2 * np.pi * 440 * t) + np.sin(2 * np.pi * 554 * t))
+    beat = 60 / bpm
+    kick_time = np.arange(int(0.15 * rate)) / rate
+    kick = 0.8 * np.sin(2 * np.pi * (50 + 60 * np.exp(-kick_time * 30)) * kick_time) * np.exp(-kick_time * 20)
+    hat = 0.3 * np.diff(rng.standard_normal(int(0.03 * rate) + 1)) * np.exp(-np.arange(int(0.03 * rate)) / rate * 150)
+    kicks = np.arange(0, seconds, beat)
+    for start in kicks:
+        index = int(start * rate)
+        part = signal[index:index + len(kick)]
+        part += kick[:len(part)]
+        index = int((start + beat / 2) * rate)
+        part = signal[index:index + len(hat)]
+        part += hat[:len(part)]
+    return signal.astype(np.float32), kicks
+
+
+if __name__ == '__main__':
+    # python audio_reactive.py [seconds] [track]
+    # Plays the track (or test drums) into the analyser in real time while a 60 FPS loop reads the
+    # snapshots, then reports how late frames were, the CPU used by the analysis and the onsets found.
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    kicks = None
+    if len(sys.argv) > 2:
+        pygame.mixer.init()
+        samples = decode_track(sys.argv[2])[:int(seconds * ANALYSIS_RATE)]
+    else:
+        samples, kicks = test_signal(seconds)
+
+    start = time.perf_counter()
+    analyser = AudioAnalyser(lambda: time.perf_counter() - start, samples=samples).start()
+    frame_times = []
+    ages = []
+    bass_onsets = []
+    seen = analyser.snapshot.onsets
+    frame = 0
+    last = time.perf_counter()
+    while last - start < seconds:
+        snapshot = analyser.snapshot
+        if snapshot.onsets[0] != seen[0]:
+            bass_onsets.append(snapshot.song_time)
+        seen = snapshot.onsets
+        ages.append(last - start - snapshot.song_time)
+        frame += 1
+        time.sleep(max(0.0, start + frame / 60 - time.perf_counter()))
+        now = time.perf_counter()
+        frame_times.append(now - last)
+        last = now
+    elapsed = time.perf_counter() - start
+    analyser.close()
+
+    frame_times = np.array(frame_times) * 1000
+    print('%d frames in %.1f s, frame time p50 %.1f ms, p99 %.1f ms, %d over 20 ms' %
+          (len(frame_times), elapsed, np.percentile(frame_times, 50), np.percentile(frame_times, 99),
+           np.sum(frame_times > 20)))
+    print('analysis: %d hops, %.1f%% of a CPU, snapshot age p50 %.1f ms, p99 %.1f ms' %
+          (analyser.hops, analyser.load(elapsed) * 100, np.percentile(ages, 50) * 1000, np.percentile(ages, 99) * 1000))
+    print('onsets per band: %s' % ', '.join('%d-%d Hz %d' % (low, high, count)
+                                             for (low, high), count in zip(BANDS, analyser.snapshot.onsets)))
+    if kicks is not None:
+        kicks = kicks[kicks < analyser.snapshot.song_time]
+        found = [min(abs(onset - kick) for onset in bass_onsets) for kick in kicks] if bass_onsets else []
+        print('%d of %d kicks found as bass onsets within 50 ms, %d other bass onsets' %
+              (sum(error < 0.05 for error in found), len(kicks),
+               len(bass_onsets) - sum(error < 0.05 for error in found)))
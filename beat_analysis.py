@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import wave
+import hashlib
+import numpy as np
+from beat_clock import BeatClock
+
+SIDECAR_SUFFIX = '.beats.json'  # Analysis of a track is stored next to it, e.g. Epoch.mp3.beats.json
+
+ANALYSIS_RATE = 22050   # Audio is resampled to this rate before analysis
+FRAME_SIZE = 1024       # Samples per FFT
+HOP_SIZE = 256          # Samples between FFTs, about 12 ms
+CHUNK_FRAMES = 2048     # FFTs done at once, keeps memory use low for long tracks
+MIN_BPM = 60
+MAX_BPM = 200
+PREFERRED_BPM = 120     # Tempo guesses close to this win when the beat could also be read as double or half
+
+
+# Tempo and beats of a track, all times in seconds from the start of the track
+class BeatGrid:
+    def __init__(self, bpm, offset, beats, onsets):
+        self.bpm = bpm
+        self.offset = offset    # First beat
+        self.beats = beats
+        self.onsets = onsets
+
+    def beat_clock(self, good_phases, good_window_ms):
+        return BeatClock(self.bpm, good_phases, good_window_ms, self.offset, self.beats)
+
+    def to_dict(self):
+        return {'bpm': self.bpm, 'offset': self.offset, 'beats': self.beats, 'onsets': self.onsets}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['bpm'], data['offset'], data['beats'], data['onsets'])
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Mono samples between -1 and 1 and the sample rate of a PCM WAV file
+def read_wav(path):
+    with wave.open(path, 'rb') as file:
+        channels = file.getnchannels()
+        width = file.getsampwidth()
+        rate = file.getframerate()
+        data = file.readframes(file.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(data, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(data, '<i2').astype(np.float32) / 2 ** 15
+    elif width == 3:
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16
+        values[values >= 2 ** 23] -= 2 ** 24
+        samples = values.astype(np.float32) / 2 ** 23
+    elif width == 4:
+        samples = np.frombuffer(data, '<i4').astype(np.float32) / 2 ** 31
+    else:
+        raise ValueError('Unsupported sample width %d in %s' % (width, path))
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def resample(samples, rate, target_rate):
+    if rate == target_rate:
+        return samples
+    count = int(len(samples) * target_rate / rate)
+    return np.interp(np.arange(count) * (rate / target_rate), np.arange(len(samples)), samples).astype(np.float32)
+
+
+# Spectral flux: how much louder each frequency got since the previous frame, summed, one value per hop
+def onset_envelope(samples):
+    count = 1 + (len(samples) - FRAME_SIZE) // HOP_SIZE
+    if count < 2:
+        raise ValueError('Track is too short to analyse')
+    frames = np.lib.stride_tricks.as_strided(samples, (count, FRAME_SIZE),
+                                             (HOP_SIZE * samples.strides[0], samples.strides[0]))
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    envelope = np.zeros(count, dtype=np.float32)
+    previous = None
+    for start in range(0, count, CHUNK_FRAMES):
+        spectrum = np.log1p(1000 * np.abs(np.fft.rfft(frames[start:start + CHUNK_FRAMES] * window, axis=1)))
+        if previous is not None:
+            spectrum = np.vstack([previous, spectrum])
+            offset = start - 1
+        else:
+            offset = start
+        flux = np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)
+        envelope[offset + 1:offset + 1 + len(flux)] = flux
+        previous = spectrum[-1:]
+
+    # Only keep what stands out from the surrounding half second
+    width = int(0.5 * ANALYSIS_RATE / HOP_SIZE) | 1
+    local_mean = np.convolve(envelope, np.ones(width) / width, mode='same')
+    envelope = np.maximum(envelope - local_mean, 0)
+    peak = envelope.max()
+    return envelope / peak if peak > 0 else envelope
+
+
+# Beat length in envelope frames, from the autocorrelation of the envelope
+def estimate_period(envelope, frame_rate):
+    centred = envelope - envelope.mean()
+    size = 2 * len(centred)
+    autocorrelation = np.fft.irfft(np.abs(np.fft.rfft(centred, size)) ** 2, size)[:len(centred)]
+
+    lags = np.arange(int(60 * frame_rate / MAX_BPM), int(60 * frame_rate / MIN_BPM) + 1)
+    bpms = 60 * frame_rate / lags
+    weights = np.exp(-0.5 * np.log2(bpms / PREFERRED_BPM) ** 2)
+    best = lags[np.argmax(autocorrelation[lags] * weights)]
+
+    # Parabola through the peak and its neighbours for a lag between whole frames
+    left, middle, right = autocorrelation[best - 1:best + 2]
+    curve = left - 2 * middle + right
+    return best + (0.5 * (left - right) / curve if curve < 0 else 0.0)
+
+
+# Period and start of the beat grid close to period that lines up with the most onsets.
+# A small error in the period adds up over a whole track, so periods around it are tried as well.
+def fit_grid(envelope, period):
+    # Allow an onset to be a frame off the grid
+    spread = np.maximum(envelope, np.maximum(np.roll(envelope, 1), np.roll(envelope, -1)))
+    best_score, best_period, best_offset = -1.0, period, 0
+    for candidate in period + np.linspace(-1, 1, 201):
+        offsets = np.arange(int(np.ceil(candidate)))
+        beats = np.arange(int((len(envelope) - 1 - offsets[-1]) / candidate) + 1)
+        positions = np.round(offsets[:, None] + beats[None, :] * candidate).astype(int)
+        scores = spread[positions].mean(axis=1)
+        if scores.max() > best_score:
+            best_score, best_period, best_offset = scores.max(), candidate, offsets[np.argmax(scores)]
+    return best_period, best_offset
+
+
+# Move every beat of the grid to the strongest onset close to it
+def snap_beats(envelope, offset, period):
+    reach = max(1, int(0.1 * period))
+    beats = []
+    position = offset
+    while position < len(envelope):
+        centre = int(round(position))
+        start = max(centre - reach, 0)
+        window = envelope[start:centre + reach + 1]
+        beats.append(start + int(np.argmax(window)) if window.max() > 0 else centre)
+        position += period
+    return np.array(beats)
+
+
+def pick_onsets(envelope):
+    threshold = envelope.mean() + envelope.std()
+    peaks = (envelope[1:-1] > threshold) & (envelope[1:-1] >= envelope[:-2]) & (envelope[1:-1] > envelope[2:])
+    return np.flatnonzero(peaks) + 1
+
+
+def analyse(path):
+    samples, rate = read_wav(path)
+    samples = resample(samples, rate, ANALYSIS_RATE)
+    envelope = onset_envelope(samples)
+    frame_rate = ANALYSIS_RATE / HOP_SIZE
+    period, offset = fit_grid(envelope, estimate_period(envelope, frame_rate))
+
+    # A flux frame reacts to an onset around the middle of its FFT window
+    latency = FRAME_SIZE / 2 / ANALYSIS_RATE
+    beats = snap_beats(envelope, offset, period) / frame_rate + latency
+    onsets = pick_onsets(envelope) / frame_rate + latency
+    return BeatGrid(60 * frame_rate / period, float(beats[0]), beats.tolist(), onsets.tolist())
+
+
+def sidecar_path(track):
+    return track + SIDECAR_SUFFIX
+
+
+def save_beat_grid(grid, track):
+    data = grid.to_dict()
+    data['hash'] = file_hash(track)
+    with open(sidecar_path(track), 'w') as file:
+        json.dump(data, file)
+
+
+# Cached analysis of track, None if there is none or the track changed since it was analysed
+def load_beat_grid(track):
+    path = sidecar_path(track)
+    if not os.path.exists(path) or not os.path.exists(track):
+        return None
+    with open(path) as file:
+        data = json.load(file)
+    if data.get('hash') != file_hash(track):
+        return None
+    return BeatGrid.from_dict(data)
+
+
+# Analyse wav_path and cache the result for track, the file that is played (the WAV itself by default).
+# Nothing is analysed when the cached analysis is still valid.
+def analyse_track(wav_path, track=None):
+    track = track or wav_path
+    grid = load_beat_grid(track)
+    if grid is None:
+        grid = analyse(wav_path)
+        save_beat_grid(grid, track)
+    return grid
+
+
+if __name__ == '__main__':
+    # python beat_analysis.py <wav file> [track that is played, e.g. Epoch.mp3]
+    start = time.perf_counter()
+    grid = analyse_track(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print('%.2f BPM, first beat at %.3f s, %d beats, %d onsets (%.2f s)' %
+          (grid.bpm, grid.offset, len(grid.beats), len(grid.onsets), time.perf_counter() - start))
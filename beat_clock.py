@@ -0,0 +1,33 @@
+from bisect import bisect_right
+
+
+# Beat grid of a song. Times are seconds since the song started. The beats are evenly spaced
+# unless beat_times are given, which is used between the first and the last of those times.
+class BeatClock:
+    def __init__(self, bpm, good_phases=(0, 0.5), good_window_ms=50, offset=0.0, beat_times=None):
+        self.bpm = bpm
+        self.beat_length = 60 / bpm
+        self.good_phases = list(good_phases)    # Positions within a beat where a hit is good, 0 is on the beat
+        self.good_window_ms = good_window_ms    # How far from a good position a hit may be and still be good
+        self.offset = offset                    # Time of the first beat
+        self.beat_times = list(beat_times) if beat_times else []
+
+    def beats(self, time):
+        if len(self.beat_times) > 1 and self.beat_times[0] <= time < self.beat_times[-1]:
+            index = bisect_right(self.beat_times, time) - 1
+            start = self.beat_times[index]
+            return index + (time - start) / (self.beat_times[index + 1] - start)
+        return (time - self.offset) / self.beat_length
+
+    # Position within the current beat, from 0 up to 1
+    def phase(self, time):
+        return self.beats(time) % 1
+
+    # Milliseconds from the nearest good position, negative when early
+    def timing_ms(self, time):
+        phase = self.phase(time)
+        distances = [(phase - good + 0.5) % 1 - 0.5 for good in self.good_phases]
+        return min(distances, key=abs) * self.beat_length * 1000
+
+    def is_good(self, time):
+        return abs(self.timing_ms(time)) <= self.good_window_ms + 1e-6
@@ -0,0 +1,50 @@
+import time
+import random
+import pygame
+from simulation import Simulation, KeyState
+from vector_simulation import VectorSimulation
+
+# Frame time of the ball phases (paddle collisions, wall check, movement) against the number of balls,
+# for the per-object loop in Simulation and the NumPy arrays in VectorSimulation.
+
+BALL_COUNTS = [1, 10, 100, 250, 500, 1000]
+PLAYERS = 12
+FRAMES = 100
+
+
+def setup(simulation_class, ball_count):
+    rng = random.Random(1)
+    simulation = simulation_class()
+    for _ in range(PLAYERS - len(simulation.paddles)):
+        simulation.add_paddle(simulation.PADDLE_VELOCITY, pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d,
+                              rng.uniform(0, simulation.WIDTH - simulation.PADDLE_WIDTH),
+                              rng.uniform(0, simulation.HEIGHT - simulation.PADDLE_HEIGHT),
+                              simulation.PADDLE_WIDTH, simulation.PADDLE_HEIGHT)
+    for _ in range(ball_count - len(simulation.balls)):
+        ball = simulation.add_ball(rng.choice([-1, 1]) * rng.uniform(1, 3),
+                                   rng.uniform(0, simulation.WIDTH), rng.uniform(0, simulation.HEIGHT),
+                                   simulation.BALL_WIDTH, simulation.BALL_WIDTH)
+        ball.angle = rng.uniform(-2, 2)
+    return simulation
+
+
+def frame_time(simulation_class, ball_count):
+    simulation = setup(simulation_class, ball_count)
+    keys = KeyState()
+    simulation.move_paddles(keys)  # Warm up
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        simulation.check_ball_hits_paddle()
+        simulation.check_ball_hits_wall()
+        simulation.move_paddles(keys)
+        simulation.move_balls()
+    return (time.perf_counter() - start) / FRAMES
+
+
+if __name__ == '__main__':
+    print('%d players, %d frames per measurement' % (PLAYERS, FRAMES))
+    print('%8s %14s %14s %8s' % ('balls', 'objects (ms)', 'numpy (ms)', 'speedup'))
+    for count in BALL_COUNTS:
+        objects = frame_time(Simulation, count)
+        vector = frame_time(VectorSimulation, count)
+        print('%8d %14.3f %14.3f %7.1fx' % (count, objects * 1000, vector * 1000, objects / vector))
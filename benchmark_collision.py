@@ -0,0 +1,62 @@
+import sys
+import time
+import random
+from simulation import Simulation, KeyState
+from vector_simulation import VectorSimulation
+from spatial_grid import GridSimulation
+
+# Balls fired straight at the right paddle at 1x to 20x the normal speed, from random distances and
+# heights where they must hit it. Counts the balls that pass through the paddle with the discrete
+# test and with CONTINUOUS_COLLISION, and the time per tick of both.
+# Exits with an error if a swept ball passes through a paddle.
+
+MULTIPLIERS = range(1, 21)
+TRIALS = 200
+
+
+def fire(simulation_class, continuous, multiplier, rng):
+    simulation = type(simulation_class.__name__, (simulation_class,), {'CONTINUOUS_COLLISION': continuous})()
+    paddle = simulation.paddles[1]
+    ball = simulation.balls[0]
+    ball.x = paddle.x - ball.width - rng.uniform(0, 300)
+    ball.y = rng.randint(paddle.y - ball.height + 1, paddle.y + paddle.height - 1)
+    ball.velocity = simulation.BALL_VELOCITY * multiplier
+    inputs = KeyState()
+    ticks = 0
+    start = time.perf_counter()
+    while ball.velocity > 0 and ball.x <= paddle.x + paddle.width and not simulation.game_over:
+        simulation.tick(inputs)
+        ticks += 1
+    return ball.velocity < 0, ticks, time.perf_counter() - start
+
+
+def measure(simulation_class, continuous, multiplier):
+    rng = random.Random(multiplier)
+    hits = 0
+    ticks = 0
+    elapsed = 0.0
+    for _ in range(TRIALS):
+        hit, trial_ticks, trial_time = fire(simulation_class, continuous, multiplier, rng)
+        hits += hit
+        ticks += trial_ticks
+        elapsed += trial_time
+    return TRIALS - hits, elapsed / ticks
+
+
+if __name__ == '__main__':
+    failed = False
+    print('%d balls per speed, that should all hit the paddle' % TRIALS)
+    print('%5s %12s %12s %14s %14s' % ('speed', 'discrete', 'continuous', 'discrete (us)', 'continuous (us)'))
+    for multiplier in MULTIPLIERS:
+        discrete_missed, discrete_time = measure(Simulation, False, multiplier)
+        continuous_missed, continuous_time = measure(Simulation, True, multiplier)
+        print('%4dx %12d %12d %14.1f %14.1f' % (multiplier, discrete_missed, continuous_missed,
+                                                discrete_time * 1e6, continuous_time * 1e6))
+        failed |= continuous_missed > 0
+
+    # The other simulations sweep the same way
+    for simulation_class in (VectorSimulation, GridSimulation):
+        missed = sum(measure(simulation_class, True, multiplier)[0] for multiplier in (1, 10, 20))
+        print('%s continuous at 1x, 10x, 20x: %d passed through' % (simulation_class.__name__, missed))
+        failed |= missed > 0
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,75 @@
+import os
+import time
+import random
+import pygame
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from pong_extended import Pong
+
+# Per frame cost of drawing the rings around players with pygame.draw.circle against blitting
+# the pre-drawn ring sprites, and of fading a lit up side with tuples against the fade palette.
+
+PLAYER_COUNTS = [2, 12, 50, 200]
+FRAMES = 200
+
+
+def draw_circles(pong):
+    for paddle in pong.paddles:
+        centre = (paddle.x + int(0.5 * pong.PADDLE_WIDTH), paddle.y + int(0.5 * pong.PADDLE_WIDTH))
+        pygame.draw.circle(pong.screen, pong.CIRCLE_COLOUR, centre, pong.PLAYER_CIRCLE_SIZE)
+        pygame.draw.circle(pong.screen, pong.CIRCLE_COLOUR, centre, int(pong.circle_size), pong.CIRCLE_WIDTH)
+
+
+def blit_circles(pong):
+    radius = int(pong.circle_size)
+    for paddle in pong.paddles:
+        centre = (paddle.x + int(0.5 * pong.PADDLE_WIDTH), paddle.y + int(0.5 * pong.PADDLE_WIDTH))
+        pong.player_circles.draw(pong.screen, centre, pong.PLAYER_CIRCLE_SIZE)
+        pong.ring_circles.draw(pong.screen, centre, radius)
+
+
+def time_rings(pong, draw):
+    start = time.perf_counter()
+    for frame in range(FRAMES):
+        pong.circle_size = pong.CIRCLE_MIN_SIZE + frame % (pong.CIRCLE_MAX_SIZE - pong.CIRCLE_MIN_SIZE)
+        draw(pong)
+    return (time.perf_counter() - start) / FRAMES
+
+
+def time_fade(pong, fade):
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        fade(pong)
+    return (time.perf_counter() - start) / FRAMES
+
+
+def fade_tuples(pong):
+    colour = (255, 255, 255)
+    fade_colour = (pong.FADE, pong.FADE, pong.FADE)
+    while colour[0] >= 0:
+        colour = tuple(x1 - x2 for x1, x2 in zip(colour, fade_colour))
+
+
+def fade_palette(pong):
+    pong.start_light_up_right(True)
+    while pong.light_up_right:
+        pong.adjust_light_up()
+
+
+if __name__ == '__main__':
+    pong = Pong()
+    rng = random.Random(1)
+    print('%d frames per measurement' % FRAMES)
+    print('%8s %16s %16s' % ('players', 'draw.circle (ms)', 'sprites (ms)'))
+    for count in PLAYER_COUNTS:
+        while len(pong.paddles) < count:
+            pong.add_paddle(pong.PADDLE_VELOCITY, pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d,
+                            rng.uniform(0, pong.WIDTH - pong.PADDLE_WIDTH),
+                            rng.uniform(0, pong.HEIGHT - pong.PADDLE_HEIGHT),
+                            pong.PADDLE_WIDTH, pong.PADDLE_HEIGHT)
+        print('%8d %16.3f %16.3f' % (count, time_rings(pong, draw_circles) * 1000,
+                                     time_rings(pong, blit_circles) * 1000))
+
+    print('full fade out (us): tuples %.1f, palette %.1f' % (time_fade(pong, fade_tuples) * 1e6,
+                                                             time_fade(pong, fade_palette) * 1e6))
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import queue
+import signal
+import random
+import multiprocessing
+import numpy as np
+from simulation import Simulation, KeyState
+from checkpoint import Checkpointer, Standby, lock_path
+
+# Kills the process playing a court in the middle of a rally and measures how long a standby process takes
+# to carry on with it. Both courts are played by bots, so the game is the same whatever the timing and the
+# state the standby resumed from is checked against the same court played in this process.
+# One more trial lets the rally end on its own before the kill, the standby has to stop then.
+# Fails when a standby resumed from a wrong state, took longer than BUDGET or did not stop.
+# python benchmark_failover.py [trials]
+
+TRIALS = 10
+BUDGET = 2 / 60  # Seconds from the kill to the standby playing the court, two frames
+FRAME_RATE = 60
+TICKS_AFTER_TAKEOVER = 30  # Ticks the standby plays after taking over, it checkpoints them itself
+SAVES = 2000  # Checkpoints timed to measure what saving costs the primary
+KILL_AFTER = (0.5, 6.0)  # Seconds of play before the kill, long enough for the first hits of a rally
+STANDBY_TIMEOUT = 10  # Seconds a standby may take to report before it counts as hung
+
+
+class Court(Simulation):
+    BOT_PLAYERS = (0, 1)
+    BOT_DIFFICULTY = 'hard'
+
+
+# Nobody moves the paddles, the ball leaves the court after a few hundred ticks
+class UnplayedCourt(Simulation):
+    pass
+
+
+# The court as the primary, one tick per frame in real time, or as fast as it goes for an unplayed court
+def play_primary(name, seed, ready, court_class):
+    court = court_class(seed)
+    Checkpointer(court, name)
+    ready.set()
+    inputs = KeyState()
+    start = time.perf_counter()
+    while not court.game_over:
+        court.tick(inputs)
+        if court_class is Court:
+            time.sleep(max(0.0, start + court.frame / FRAME_RATE - time.perf_counter()))
+    court.checkpoints.close()
+
+
+# The same court set up ahead as the standby. Reports when the primary was found gone, when the court
+# was playing again, the checkpoint it resumed from and the state it resumed with.
+def play_standby(name, seed, results):
+    court = Court(seed)
+    standby = Standby(name)
+    results.put('waiting')
+    checkpoint = standby.wait()
+    detected = time.monotonic()
+    if checkpoint is None:
+        standby.close()
+        results.put(None)
+        return
+    standby.take_over(court, checkpoint)
+    resumed = time.monotonic()
+    state = court.get_state()
+
+    # Carry on as the new primary for a while
+    inputs = KeyState()
+    for _ in range(TICKS_AFTER_TAKEOVER):
+        if court.game_over:
+            break
+        court.tick(inputs)
+        time.sleep(1 / FRAME_RATE)
+    sequence = court.checkpoints.sequence
+    court.checkpoints.close()
+    results.put((detected, resumed, checkpoint.sequence, checkpoint.written, state, sequence))
+
+
+# Every part of the state, the score included, except the accumulator that takes_over() adds the elapsed time to
+def same_state(state, reference):
+    return all(state[name] == reference[name] for name in state if name != 'accumulator')
+
+
+# Kills the primary at a random time, or with rally_ends waits for its rally to end first. Returns the
+# measurements of a takeover, None when the standby stopped because the rally was over, 'hung' when the
+# standby did not report in time.
+def trial(number, rng, rally_ends=False):
+    name = 'pong-failover-%d-%d' % (os.getpid(), number)
+    seed = rng.getrandbits(32)
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    court_class = UnplayedCourt if rally_ends else Court
+    primary = multiprocessing.Process(target=play_primary, args=(name, seed, ready, court_class), daemon=True)
+    primary.start()
+    ready.wait()
+    standby = multiprocessing.Process(target=play_standby, args=(name, seed, results), daemon=True)
+    standby.start()
+    results.get()
+
+    if rally_ends:
+        primary.join()
+    else:
+        time.sleep(rng.uniform(*KILL_AFTER))
+    killed = time.monotonic()
+    if primary.is_alive():
+        os.kill(primary.pid, signal.SIGKILL)
+    primary.join()
+    try:
+        result = results.get(timeout=STANDBY_TIMEOUT)
+    except queue.Empty:
+        standby.kill()
+        result = 'hung'
+    standby.join()
+    os.remove(lock_path(name))
+    if result is None or result == 'hung':
+        return result
+
+    detected, resumed, sequence, written, state, last_sequence = result
+    reference = Court(seed)
+    inputs = KeyState()
+    while reference.frame < state['frame']:
+        reference.tick(inputs)
+    return {
+        'detect': detected - killed,
+        'latency': resumed - killed,
+        'checkpoint_age': killed - written,
+        'matches': same_state(state, reference.get_state()),
+        'checkpoints_after': last_sequence - sequence,
+        'hits': state['good_hits'] + state['bad_hits'],
+    }
+
+
+# Seconds one checkpoint of a court costs the primary
+def save_time():
+    court = Court(1)
+    name = 'pong-failover-%d-save' % os.getpid()
+    checkpointer = Checkpointer(court, name)
+    for _ in range(SAVES):
+        checkpointer.save(court)
+    checkpointer.close()
+    os.remove(lock_path(name))
+    return checkpointer.save_time / SAVES
+
+
+if __name__ == '__main__':
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else TRIALS
+    rng = random.Random(1)
+    results = [trial(number, rng) for number in range(trials)]
+    hung = results.count('hung')
+    takeovers = [result for result in results if result is not None and result != 'hung']
+
+    print('%d trials, %d takeovers, %d rallies were already over, %d standbys hung' %
+          (trials, len(takeovers), trials - len(takeovers) - hung, hung))
+    ended = trial(trials, rng, rally_ends=True)
+    print('rally ended before the kill: %s' % ('standby stopped' if ended is None else
+                                               'standby hung' if ended == 'hung' else 'standby took over'))
+    failed = hung > 0 or ended is not None
+    if takeovers:
+        latencies = np.array([result['latency'] for result in takeovers]) * 1000
+        print('kill to standby playing: p50 %.2f ms, max %.2f ms (found gone after %.2f ms on average)' %
+              (np.percentile(latencies, 50), latencies.max(),
+               np.mean([result['detect'] for result in takeovers]) * 1000))
+        print('newest checkpoint was %.1f ms old at the kill on average' %
+              (np.mean([result['checkpoint_age'] for result in takeovers]) * 1000))
+        print('resumed state matches the court: %d of %d, with %s hits scored before the kill' %
+              (sum(result['matches'] for result in takeovers), len(takeovers),
+               '/'.join(str(result['hits']) for result in takeovers)))
+        print('the standby wrote %s checkpoints after taking over' %
+              '/'.join(str(result['checkpoints_after']) for result in takeovers))
+        failed = failed or latencies.max() > BUDGET * 1000 or not all(result['matches'] for result in takeovers)
+    print('a checkpoint costs the primary %.1f us' % (save_time() * 1e6))
+    sys.exit(1 if failed else 0)
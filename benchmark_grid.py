@@ -0,0 +1,59 @@
+import time
+import random
+import pygame
+from simulation import Simulation, KeyState
+from spatial_grid import GridSimulation
+
+# Ball/paddle pair tests per frame when testing every pair (Simulation) against only testing
+# pairs that share a grid cell (GridSimulation), for teams of different sizes.
+
+PLAYER_COUNTS = [2, 12, 50]
+BALLS = 4
+FRAMES = 300
+KEYS = [KeyState(), KeyState([pygame.K_w, pygame.K_d]), KeyState([pygame.K_s, pygame.K_a]),
+        KeyState([pygame.K_UP, pygame.K_LEFT]), KeyState([pygame.K_DOWN, pygame.K_RIGHT])]
+
+
+def setup(simulation_class, player_count):
+    rng = random.Random(1)
+    simulation = simulation_class()
+    for index in range(player_count - len(simulation.paddles)):
+        keys = [pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d] if index % 2 else \
+            [pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT]
+        simulation.add_paddle(simulation.PADDLE_VELOCITY, *keys,
+                              rng.uniform(0, simulation.WIDTH - simulation.PADDLE_WIDTH),
+                              rng.uniform(0, simulation.HEIGHT - simulation.PADDLE_HEIGHT),
+                              simulation.PADDLE_WIDTH, simulation.PADDLE_HEIGHT)
+    for _ in range(BALLS - len(simulation.balls)):
+        ball = simulation.add_ball(rng.choice([-1, 1]) * rng.uniform(1, 3),
+                                   rng.uniform(0, simulation.WIDTH), rng.uniform(0, simulation.HEIGHT),
+                                   simulation.BALL_WIDTH, simulation.BALL_WIDTH)
+        ball.angle = rng.uniform(-2, 2)
+    return simulation
+
+
+# Returns the time per frame and the pair tests per frame
+def run(simulation_class, player_count):
+    simulation = setup(simulation_class, player_count)
+    rng = random.Random(2)
+    inputs = [rng.choice(KEYS) for _ in range(FRAMES)]
+    pair_tests = 0
+    start = time.perf_counter()
+    for keys in inputs:
+        simulation.check_ball_hits_paddle()
+        simulation.move_paddles(keys)
+        simulation.move_balls()
+        pair_tests += len(simulation.balls) * len(simulation.paddles)
+    elapsed = time.perf_counter() - start
+    if simulation_class is GridSimulation:
+        pair_tests = simulation.pair_tests
+    return elapsed / FRAMES, pair_tests / FRAMES
+
+
+if __name__ == '__main__':
+    print('%d balls, %d frames per measurement' % (BALLS, FRAMES))
+    print('%8s %12s %12s %12s %12s' % ('players', 'all pairs', 'grid pairs', 'all (ms)', 'grid (ms)'))
+    for count in PLAYER_COUNTS:
+        all_time, all_pairs = run(Simulation, count)
+        grid_time, grid_pairs = run(GridSimulation, count)
+        print('%8d %12.1f %12.1f %12.3f %12.3f' % (count, all_pairs, grid_pairs, all_time * 1000, grid_time * 1000))
@@ -0,0 +1,64 @@
+import os
+import time
+import random
+import pygame
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from pong_extended import Pong
+from framebuffer import FramebufferRenderer
+
+# Per frame cost of getting a frame of the court as pixels: drawing with pygame (and scaling it down
+# for the LED sizes, like LedSink does) against drawing straight into a NumPy framebuffer of that size.
+
+SIZES = [(1200, 600), (120, 60), (240, 120), (480, 240)]
+PLAYER_COUNTS = [2, 50]
+FRAMES = 200
+
+
+def setup(player_count):
+    rng = random.Random(1)
+    pong = Pong(seed=1)
+    while len(pong.paddles) < player_count:
+        pong.add_paddle(pong.PADDLE_VELOCITY, pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d,
+                        rng.uniform(0, pong.WIDTH - pong.PADDLE_WIDTH),
+                        rng.uniform(0, pong.HEIGHT - pong.PADDLE_HEIGHT),
+                        pong.PADDLE_WIDTH, pong.PADDLE_HEIGHT)
+    pong.start_light_up_left(True)
+    return pong
+
+
+def time_frames(pong, draw):
+    elapsed = 0.0
+    for frame in range(FRAMES):
+        pong.circle_size = pong.CIRCLE_MIN_SIZE + frame % (pong.CIRCLE_MAX_SIZE - pong.CIRCLE_MIN_SIZE)
+        if frame % 20 == 0:
+            pong.start_light_up_right(frame % 40 == 0)
+        pong.adjust_light_up()
+        pong.update_visuals()
+        start = time.perf_counter()
+        draw()
+        elapsed += time.perf_counter() - start
+    return elapsed / FRAMES
+
+
+def pygame_frame(pong, size):
+    def draw():
+        pong.draw()
+        if size != (pong.WIDTH, pong.HEIGHT):
+            pygame.surfarray.pixels3d(pygame.transform.smoothscale(pong.screen, size))
+        else:
+            pygame.surfarray.pixels3d(pong.screen)
+    return draw
+
+
+if __name__ == '__main__':
+    print('%d frames per measurement' % FRAMES)
+    print('%8s %10s %12s %12s' % ('players', 'size', 'pygame (ms)', 'numpy (ms)'))
+    for count in PLAYER_COUNTS:
+        pong = setup(count)
+        for size in SIZES:
+            renderer = FramebufferRenderer(pong, *size)
+            renderer.texts = pong.speed_texts
+            print('%8d %10s %12.3f %12.3f' % (count, '%dx%d' % size, time_frames(pong, pygame_frame(pong, size)) * 1000,
+                                              time_frames(pong, renderer.render) * 1000))
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+
+# Cold start of the game: every run is a new Python process that imports pong_extended, sets up a Pong
+# with the window and shows the first frame. Prints the median time of each startup phase.
+# python benchmark_startup.py [runs]
+
+RUNS = 10
+
+CHILD = '''
+import json
+import pong_extended
+pong = pong_extended.Pong(seed=1)
+pong.present()
+pong.music_loader.join()
+times = dict(pong.startup_times)
+times['first frame after'] = pong.startup_mark - pong_extended.STARTED
+print(json.dumps(times))
+'''
+
+
+def cold_start():
+    environment = dict(os.environ)
+    environment.setdefault('SDL_VIDEODRIVER', 'dummy')
+    environment.setdefault('SDL_AUDIODRIVER', 'dummy')
+    environment['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    output = subprocess.run([sys.executable, '-c', CHILD], env=environment, capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    results = [cold_start() for _ in range(runs)]
+    print('median of %d cold starts' % runs)
+    for phase in results[0]:
+        print('%-20s %8.1f ms' % (phase, np.median([result.get(phase, 0.0) for result in results]) * 1000))
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import random
+import tracemalloc
+import numpy as np
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import pygame
+import pong
+import pong_extended
+from profiler import FrameProfiler
+from simulation import KeyState, Ball
+from audio_reactive import AudioAnalyser, test_signal
+
+# Frames of both games, pong.py and pong_extended.py, with the same scripted keys in every scenario.
+# Every phase of a frame is timed like Pong.PROFILE does, and the memory a frame allocates is measured
+# with tracemalloc in a separate run. Results are compared with a JSON baseline and the run fails when
+# a frame or phase got slower, or a frame allocates more, than the thresholds allow.
+# python benchmark_suite.py [baseline.json] [--save]
+# Without a baseline file, or with --save, the results are written to it as the new baseline.
+
+BASELINE = 'benchmark_baseline.json'  # Machine-local, not in git: times only compare on the same machine
+FRAMES = 300             # Timed frames per scenario
+WARMUP_FRAMES = 30
+ALLOCATION_FRAMES = 60   # Frames traced by tracemalloc, which makes them a lot slower
+MANY_BALLS = 100
+SPEED_TEXT_VALUES = 97   # Different speeds shown in turn, more than Pong.SPEED_TEXT_CACHE_SIZE
+
+THRESHOLD = 0.25         # Fraction a time may grow over the baseline before it is a regression
+MIN_PHASE_MS = 0.05      # Phases faster than this in the baseline are too noisy to judge
+ALLOCATION_THRESHOLD = 0.25
+ALLOCATION_SLACK_KB = 4  # Allowed growth of small allocations on top of ALLOCATION_THRESHOLD
+
+# Phases of a frame of each game, pong.py draws straight from its frame() method
+PHASES = {
+    'pong': ['poll_events', 'check_ball_hits_paddle', 'check_ball_hits_wall', 'check_circle_keys',
+             'adjust_light_up', 'draw_light_up', 'draw_players', 'draw_circles', 'move_paddle', 'move_balls',
+             'draw_balls'],
+    'pong_extended': [phase for phase in pong_extended.Pong.PROFILED_PHASES if phase != 'wait_for_next_frame'] +
+                     ['move_paddles', 'move_balls', 'update_speed_left', 'update_speed_right'],
+}
+
+SCENARIOS = ['one ball', 'many balls', 'light up', 'speed text', 'audio reactive']
+EXTENDED_ONLY = ['speed text', 'audio reactive']  # pong.py shows no speeds and does not follow the music
+
+
+# Keys held in a frame: every player goes up, down, left and right in turn, and the circles and
+# balls are sped up with space and slowed down again with c
+def scripted_keys(frame):
+    step = frame // 30 % 4
+    pressed = [(pygame.K_w, pygame.K_UP), (pygame.K_s, pygame.K_DOWN),
+               (pygame.K_a, pygame.K_LEFT), (pygame.K_d, pygame.K_RIGHT)][step]
+    if frame % 120 < 5:
+        pressed += (pygame.K_SPACE,)
+    elif 60 <= frame % 120 < 65:
+        pressed += (pygame.K_c,)
+    return KeyState(pressed)
+
+
+# Stands in for pygame.key.get_pressed(), which pong.py reads itself
+class ScriptedKeyboard:
+    def __init__(self):
+        self.keys = KeyState()
+        self.get_pressed_before = pygame.key.get_pressed
+
+    def get_pressed(self):
+        return self.keys
+
+    def __enter__(self):
+        pygame.key.get_pressed = self.get_pressed
+        return self
+
+    def __exit__(self, *exception):
+        pygame.key.get_pressed = self.get_pressed_before
+
+
+# Both games end when a ball leaves the court, here it is put back in the middle before the wall check
+def keep_balls_in_court(game):
+    for ball in game.balls:
+        if ball.x > game.WIDTH or ball.x < 0 or ball.y > game.HEIGHT - game.BALL_WIDTH or ball.y < 0:
+            ball.x = game.WIDTH / 2 - game.BALL_WIDTH / 2
+            ball.y = game.HEIGHT / 2 - game.BALL_WIDTH / 2
+
+
+def setup(variant, scenario):
+    random.seed(1)
+    np.random.seed(1)
+    if variant == 'pong':
+        game = pong.Pong()
+        new_ball = lambda velocity, x, y: game.balls.append(pong.Ball(velocity, x, y, game.BALL_WIDTH,
+                                                                      game.BALL_WIDTH)) or game.balls[-1]
+    else:
+        game = pong_extended.Pong(seed=1)
+        game.speed_text_probe = Ball(1, 0, 0, game.BALL_WIDTH, game.BALL_WIDTH)
+        new_ball = lambda velocity, x, y: game.add_ball(velocity, x, y, game.BALL_WIDTH, game.BALL_WIDTH)
+
+    if scenario == 'audio reactive':
+        # Test drums played in real time into the analysis thread, which runs while the frames are timed
+        start = time.perf_counter()
+        game.audio = AudioAnalyser(lambda: time.perf_counter() - start, samples=test_signal(60)[0]).start()
+
+    if scenario == 'many balls':
+        rng = random.Random(1)
+        while len(game.balls) < MANY_BALLS:
+            ball = new_ball(rng.choice([-1, 1]) * rng.randint(2, 6), rng.uniform(100, game.WIDTH - 100),
+                            rng.uniform(100, game.HEIGHT - 100))
+            ball.angle = rng.uniform(-2, 2)
+    return game
+
+
+# What a scenario does before the frame is drawn, besides the scripted keys
+def script_frame(game, variant, scenario, frame):
+    keep_balls_in_court(game)
+    if scenario == 'light up':
+        if not game.light_up_left:
+            game.start_light_up_left(frame % 3 != 0)
+        if not game.light_up_right:
+            game.start_light_up_right(frame % 5 != 0)
+
+
+def run_frame(game, variant, scenario, frame, keys):
+    if variant == 'pong':
+        game.poll_events()
+        game.frame()
+        return
+    game.poll_events()
+    game.step(game.TICK, keys)
+    if scenario == 'speed text':
+        # A new speed on both sides every frame, as if the ball was hit every frame
+        probe = game.speed_text_probe
+        probe.velocity = 1 + frame % SPEED_TEXT_VALUES * 0.1
+        game.update_speed_left(probe)
+        game.update_speed_right(probe)
+    game.present()
+
+
+def play(game, variant, scenario, frames, keyboard, first_frame=0, profiler=None, on_frame_start=None):
+    for frame in range(first_frame, first_frame + frames):
+        keyboard.keys = scripted_keys(frame)
+        script_frame(game, variant, scenario, frame)
+        if profiler is not None:
+            profiler.frame_start = time.perf_counter()  # The scripting above is not part of the frame
+        if on_frame_start is not None:
+            on_frame_start()
+        run_frame(game, variant, scenario, frame, keyboard.keys)
+        if profiler is not None:
+            profiler.end_frame()
+
+
+# Frames per second, frame and phase times in milliseconds and the memory allocated per frame
+def measure(variant, scenario):
+    with ScriptedKeyboard() as keyboard:
+        game = setup(variant, scenario)
+        play(game, variant, scenario, WARMUP_FRAMES, keyboard)
+
+        profiler = FrameProfiler(PHASES[variant], window=FRAMES)
+        unwrapped = {name: getattr(game, name) for name in PHASES[variant]}
+        for name, method in unwrapped.items():
+            setattr(game, name, profiler.wrap(name, method))
+        play(game, variant, scenario, FRAMES, keyboard, WARMUP_FRAMES, profiler)
+        for name, method in unwrapped.items():
+            setattr(game, name, method)
+
+        # Peak of the memory allocated while drawing each frame and what is still held after all of them
+        peaks = []
+        frame_start = []
+
+        def start_tracing_frame():
+            tracemalloc.reset_peak()
+            frame_start.append(tracemalloc.get_traced_memory()[0])
+
+        tracemalloc.start()
+        blocks_before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        first = WARMUP_FRAMES + FRAMES
+        for frame in range(first, first + ALLOCATION_FRAMES):
+            play(game, variant, scenario, 1, keyboard, frame, on_frame_start=start_tracing_frame)
+            peaks.append(tracemalloc.get_traced_memory()[1] - frame_start[-1])
+        blocks_after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        tracemalloc.stop()
+        if getattr(game, 'audio', None) is not None:
+            game.audio.close()
+
+    percentiles = profiler.percentiles()
+    frame_total = profiler.history[:, -1]
+    return {
+        'fps': FRAMES / frame_total.sum(),
+        'frame_ms': dict(zip(['p50', 'p95', 'p99'], percentiles.pop('frame_total'))),
+        'phases_ms': {name: dict(zip(['p50', 'p95', 'p99'], values)) for name, values in percentiles.items()},
+        'peak_kb_per_frame': float(np.median(peaks)) / 1024,
+        'blocks_retained': blocks_after - blocks_before,
+    }
+
+
+def run_suite():
+    results = {}
+    for variant in PHASES:
+        for scenario in SCENARIOS:
+            if scenario in EXTENDED_ONLY and variant == 'pong':
+                continue
+            results['%s/%s' % (variant, scenario)] = measure(variant, scenario)
+    return results
+
+
+# Differences from the baseline that are beyond the thresholds, as readable lines
+def regressions(results, baseline):
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result['frame_ms']['p50'] > before['frame_ms']['p50'] * (1 + THRESHOLD):
+            found.append('%s: frame p50 %.3f ms, was %.3f ms' % (name, result['frame_ms']['p50'],
+                                                                 before['frame_ms']['p50']))
+        for phase, times in result['phases_ms'].items():
+            old = before['phases_ms'].get(phase)
+            if old is not None and old['p50'] >= MIN_PHASE_MS and times['p50'] > old['p50'] * (1 + THRESHOLD):
+                found.append('%s: %s p50 %.3f ms, was %.3f ms' % (name, phase, times['p50'], old['p50']))
+        allowed = before['peak_kb_per_frame'] * (1 + ALLOCATION_THRESHOLD) + ALLOCATION_SLACK_KB
+        if result['peak_kb_per_frame'] > allowed:
+            found.append('%s: %.1f KB allocated per frame, was %.1f KB' % (name, result['peak_kb_per_frame'],
+                                                                         before['peak_kb_per_frame']))
+    return found
+
+
+def print_results(results):
+    print('%d frames per scenario, %d traced for allocations' % (FRAMES, ALLOCATION_FRAMES))
+    print('%-28s %8s %9s %9s %12s %8s' % ('scenario', 'fps', 'p50 (ms)', 'p99 (ms)', 'KB / frame', 'blocks'))
+    for name, result in results.items():
+        print('%-28s %8.0f %9.3f %9.3f %12.1f %8d' % (name, result['fps'], result['frame_ms']['p50'],
+                                                      result['frame_ms']['p99'], result['peak_kb_per_frame'],
+                                                      result['blocks_retained']))
+    for name, result in results.items():
+        phases = sorted(result['phases_ms'].items(), key=lambda item: -item[1]['p50'])
+        print('%s: %s' % (name, ', '.join('%s %.3f' % (phase, times['p50']) for phase, times in phases[:4]
+                                           if times['p50'] > 0)))
+
+
+if __name__ == '__main__':
+    arguments = [argument for argument in sys.argv[1:] if argument != '--save']
+    baseline_path = arguments[0] if arguments else BASELINE
+    results = run_suite()
+    print_results(results)
+
+    if '--save' in sys.argv or not os.path.exists(baseline_path):
+        with open(baseline_path, 'w') as file:
+            json.dump(results, file, indent=1)
+        print('baseline written to %s' % baseline_path)
+        sys.exit(0)
+
+    with open(baseline_path) as file:
+        found = regressions(results, json.load(file))
+    if found:
+        print('regressions against %s:' % baseline_path)
+        print('\n'.join(found))
+        sys.exit(1)
+    print('no regressions against %s (threshold %d%%)' % (baseline_path, THRESHOLD * 100))
@@ -0,0 +1,291 @@
+import sys
+import math
+import time
+import random
+import numpy as np
+from collections import deque
+from vector_simulation import round_rect
+
+# Handicaps of the bot: fraction of the paddle velocity it moves at, standard deviation in pixels of its
+# guess where the ball will be and ticks before it guesses again
+DIFFICULTIES = {
+    'easy': (0.5, 40.0, 30),
+    'medium': (0.75, 20.0, 15),
+    'hard': (1.0, 0.0, 1),
+}
+
+DECISION_BUDGET = 0.001  # Seconds a bot may spend deciding on its move every tick, at the 99th percentile
+DECISION_WINDOW = 1000  # Number of decision times kept for the percentiles
+
+
+# Where a paddle wants to be, for arrays of paddles and the ball each of them watches. A ball coming
+# at the paddle is followed along the path Ball.move_ball() takes (velocity and round(angle) pixels
+# every tick) to where it reaches the paddle's home line. When it would leave the court over the top
+# or bottom before that, the paddle goes out to meet it `margin` ticks before it does. Balls that
+# arrive more than lookahead ticks from now are only followed up and down. Without an incoming ball
+# the paddle goes home and drifts to the middle of the court by centre of the way every tick.
+# Returns the target x and y of the paddle's top left corner and the ticks until the ball arrives,
+# inf when it does not come.
+def predict_targets(home_x, paddle_y, ball_x, ball_y, velocity, angle, lookahead, margin, centre, court):
+    gap = np.where(velocity > 0, home_x - court.BALL_WIDTH - ball_x, home_x + court.PADDLE_WIDTH - ball_x)
+    step_y = np.round(angle)
+    with np.errstate(divide='ignore', invalid='ignore'):  # Standing balls and balls going straight
+        ticks = np.ceil(gap / velocity)
+        wall = np.where(step_y < 0, ball_y // -step_y,
+                        np.where(step_y > 0, (court.HEIGHT - court.BALL_WIDTH - ball_y) // step_y, np.inf))
+        incoming = np.isfinite(ticks) & (ticks >= 0)
+        meet = np.maximum(np.minimum(ticks, wall + 1 - margin), 0)
+        early = meet < ticks
+        meet_x = np.where(velocity > 0, ball_x + velocity * meet + court.BALL_WIDTH,
+                          ball_x + velocity * meet - court.PADDLE_WIDTH)
+        near = meet <= lookahead
+
+    target_x = np.where(incoming & early & near, meet_x, home_x)
+    ball_target = ball_y + step_y * np.minimum(meet, lookahead) + (court.BALL_WIDTH - court.PADDLE_HEIGHT) / 2
+    resting = paddle_y + centre * ((court.HEIGHT - court.PADDLE_HEIGHT) / 2 - paddle_y)
+    return target_x, np.where(incoming, ball_target, resting), np.where(incoming, ticks, np.inf)
+
+
+# predict_targets() for one paddle and one ball in plain Python, for the bot in the game
+def predict_target(home_x, paddle_y, ball_x, ball_y, velocity, angle, lookahead, margin, centre, court):
+    resting = paddle_y + centre * ((court.HEIGHT - court.PADDLE_HEIGHT) / 2 - paddle_y)
+    if velocity == 0:
+        return home_x, resting, math.inf
+    if velocity > 0:
+        ticks = math.ceil((home_x - court.BALL_WIDTH - ball_x) / velocity)
+    else:
+        ticks = math.ceil((home_x + court.PADDLE_WIDTH - ball_x) / velocity)
+    if ticks < 0:
+        return home_x, resting, math.inf
+
+    step_y = round(angle)
+    if step_y < 0:
+        wall = ball_y // -step_y
+    elif step_y > 0:
+        wall = (court.HEIGHT - court.BALL_WIDTH - ball_y) // step_y
+    else:
+        wall = math.inf
+    meet = max(min(ticks, wall + 1 - margin), 0)
+    target_x = home_x
+    if meet < ticks and meet <= lookahead:
+        target_x = ball_x + velocity * meet + (court.BALL_WIDTH if velocity > 0 else -court.PADDLE_WIDTH)
+    return target_x, ball_y + step_y * min(meet, lookahead) + (court.BALL_WIDTH - court.PADDLE_HEIGHT) / 2, ticks
+
+
+# Moves paddles towards their targets like the keys would: at most `speed` pixels along each axis
+# per tick and kept on the board
+def step_towards(x, y, target_x, target_y, speed, court):
+    dx = np.clip(np.round(target_x - x), -speed, speed)
+    dy = np.clip(np.round(target_y - y), -speed, speed)
+    return (np.clip(x + dx, 0, court.WIDTH - court.PADDLE_WIDTH),
+            np.clip(y + dy, 0, court.HEIGHT - court.PADDLE_HEIGHT))
+
+
+# Predicts where the ball meets the paddle, see predict_targets()
+class PredictivePolicy:
+    def __init__(self, lookahead=1000, margin=10, centre=0.05):
+        self.lookahead = lookahead
+        self.margin = margin
+        self.centre = centre
+
+    def __repr__(self):
+        return 'PredictivePolicy(lookahead=%d, margin=%d, centre=%g)' % (self.lookahead, self.margin, self.centre)
+
+
+# Policies tried by best_policies()
+CANDIDATES = [PredictivePolicy(lookahead, margin, centre)
+              for lookahead in (10, 60, 1000) for margin in (0, 10, 30) for centre in (0, 0.05)]
+
+# Best of the candidates for every difficulty, picked with python bot.py
+BEST_POLICIES = {
+    'easy': PredictivePolicy(1000, 10, 0),
+    'medium': PredictivePolicy(60, 30, 0),
+    'hard': PredictivePolicy(60, 30, 0.05),
+}
+
+
+# Plays a paddle for the computer, set it as paddle.controller (Simulation.BOT_PLAYERS does).
+# The move only depends on the state of the simulation and the frame number, so recordings of games
+# against the bot play back the same and set_state() needs nothing from it.
+class BotController:
+    REPLAYABLE = True  # Replays move the paddle the same way, see replay.Recorder
+
+    def __init__(self, simulation, player, difficulty='medium', policy=None):
+        self.simulation = simulation
+        self.player = player
+        self.policy = policy or BEST_POLICIES[difficulty]
+        self.speed_fraction, self.error, self.interval = DIFFICULTIES[difficulty]
+        paddle = simulation.paddles[player]
+        self.home_x = paddle.x  # Where the paddle returns to after being pushed back by a hit
+        self.guess_key = None
+        self.guess = 0.0
+
+        self.decision_times = deque(maxlen=DECISION_WINDOW)
+
+    # Error in the guess where the ball goes, a new guess every `interval` ticks and after every hit.
+    # Drawn from the game's random state, the frame number and the ball angles, so it follows from the
+    # state of the game like everything else.
+    def guess_error(self):
+        if not self.error:
+            return 0.0
+        simulation = self.simulation
+        key = (simulation.frame // self.interval,) + tuple(ball.angle for ball in simulation.balls)
+        if key != self.guess_key:
+            self.guess_key = key
+            seed = hash(key + (self.player, simulation.random.getstate()))
+            self.guess = random.Random(seed).gauss(0, self.error)
+        return self.guess
+
+    def move_paddle(self, paddle, board_height, board_width):
+        start = time.perf_counter()
+        simulation = self.simulation
+        policy = self.policy
+
+        # Go for the ball that arrives first
+        target_x, target_y, first = self.home_x, None, math.inf
+        for ball in simulation.balls:
+            x, y, ticks = predict_target(self.home_x, paddle.y, ball.x, ball.y, ball.velocity, ball.angle,
+                                         policy.lookahead, policy.margin, policy.centre, simulation)
+            if target_y is None or ticks < first:
+                target_x, target_y, first = x, y, ticks
+        if target_y is None:
+            target_y = paddle.y
+        target_y += self.guess_error()
+
+        speed = max(int(paddle.velocity * self.speed_fraction), 1)
+        x = paddle.x + min(max(round(target_x - paddle.x), -speed), speed)
+        y = paddle.y + min(max(round(target_y - paddle.y), -speed), speed)
+        paddle.x = min(max(x, 0), board_width - paddle.width)
+        paddle.y = min(max(y, 0), board_height - paddle.height)
+
+        self.decision_times.append(time.perf_counter() - start)
+
+    # Milliseconds taken by the last decisions
+    def decision_percentiles(self, percentiles=(50, 99)):
+        times = sorted(self.decision_times)
+        if not times:
+            return {percentile: 0.0 for percentile in percentiles}
+        return {percentile: times[min(len(times) - 1, int(len(times) * percentile / 100))] * 1000
+                for percentile in percentiles}
+
+
+# Plays `episodes` rallies of every policy at once with NumPy, the bot on the right against a partner
+# on the left that plays policy `partner` at 'hard'. Follows the rules of court (a Simulation class)
+# with one ball and discrete collisions. Returns the mean number of hits per rally of every policy,
+# rallies are stopped after max_ticks.
+def evaluate_policies(policies, difficulty='medium', episodes=64, max_ticks=3600, seed=0, court=None,
+                      partner=None):
+    if court is None:
+        from simulation import Simulation as court
+    partner = partner or BEST_POLICIES['hard']
+    rng = np.random.default_rng(seed)
+    count = len(policies) * episodes
+    lookahead = np.repeat([policy.lookahead for policy in policies], episodes).astype(float)
+    margin = np.repeat([policy.margin for policy in policies], episodes).astype(float)
+    centre = np.repeat([policy.centre for policy in policies], episodes).astype(float)
+    speed_fraction, error, interval = DIFFICULTIES[difficulty]
+    speed = max(int(court.PADDLE_VELOCITY * speed_fraction), 1)
+    partner_speed = max(int(court.PADDLE_VELOCITY * DIFFICULTIES['hard'][0]), 1)
+
+    # Paddles and ball where Simulation puts them, column 0 is the partner and column 1 the bot
+    home_x = np.array([100, court.WIDTH - court.PADDLE_WIDTH - 100])
+    paddle_x = np.tile(home_x, (count, 1)).astype(np.int64)
+    paddle_y = np.full((count, 2), round_rect(court.HEIGHT / 2 - court.PADDLE_HEIGHT / 2), np.int64)
+    ball_x = np.full(count, round_rect(court.WIDTH / 2 - court.BALL_WIDTH / 2), np.int64)
+    ball_y = np.full(count, round_rect(court.HEIGHT / 2 - court.BALL_WIDTH / 2), np.int64)
+    velocity = np.full(count, float(court.BALL_VELOCITY))
+    angle = np.full(count, float(court.BALL_ANGLE))
+    playing = np.ones(count, bool)
+    hits = np.zeros(count, np.int64)
+    noise = np.zeros(count)
+
+    for tick in range(max_ticks):
+        # Hits, the partner's paddle is tried first like in Simulation.check_ball_hits_paddle()
+        hit = np.zeros(count, bool)
+        for side in (0, 1):
+            touching = (playing & ~hit & (ball_x < paddle_x[:, side] + court.PADDLE_WIDTH) &
+                        (paddle_x[:, side] < ball_x + court.BALL_WIDTH) &
+                        (ball_y < paddle_y[:, side] + court.PADDLE_HEIGHT) &
+                        (paddle_y[:, side] < ball_y + court.BALL_WIDTH))
+            if touching.any():
+                velocity[touching] = -velocity[touching]
+                ball_x[touching] = round_rect(ball_x[touching] + velocity[touching] * 10)
+                paddle_x[touching, side] = round_rect(paddle_x[touching, side] - velocity[touching] * 10)
+                angle[touching] = (court.ANGLE_POSITION * ((court.HEIGHT / 2 - ball_y[touching]) / (court.HEIGHT / 2)) +
+                                   court.ANGLE_RANDOM * (rng.random(touching.sum()) - 0.5)) * np.abs(velocity[touching])
+                hits += touching
+                hit |= touching
+
+        playing &= ~((ball_x > court.WIDTH) | (ball_x < 0) | (ball_y > court.HEIGHT - court.BALL_WIDTH) | (ball_y < 0))
+        if not playing.any():
+            break
+
+        # New guesses every interval frames and after a hit, like BotController.guess_error()
+        if error and (court.frame + tick) % interval == 0:
+            noise = rng.normal(0, error, count)
+        elif error and hit.any():
+            noise[hit] = rng.normal(0, error, hit.sum())
+        for side, policy, side_speed, side_noise in ((0, partner, partner_speed, 0.0),
+                                                     (1, (lookahead, margin, centre), speed, noise)):
+            if isinstance(policy, PredictivePolicy):
+                policy = (policy.lookahead, policy.margin, policy.centre)
+            target_x, target_y, _ = predict_targets(home_x[side], paddle_y[:, side], ball_x, ball_y, velocity,
+                                                    angle, *policy, court)
+            x, y = step_towards(paddle_x[:, side], paddle_y[:, side], target_x, target_y + side_noise,
+                                side_speed, court)
+            paddle_x[playing, side] = x[playing]
+            paddle_y[playing, side] = y[playing]
+
+        ball_x[playing] = round_rect(ball_x[playing] + velocity[playing])
+        ball_y[playing] += np.round(angle[playing]).astype(np.int64)
+
+    return hits.reshape(len(policies), episodes).mean(axis=1)
+
+
+# The candidate with the most hits per rally for every difficulty
+def best_policies(candidates=CANDIDATES, episodes=64, max_ticks=3600, seed=0):
+    best = {}
+    for difficulty in DIFFICULTIES:
+        scores = evaluate_policies(candidates, difficulty, episodes, max_ticks, seed)
+        best[difficulty] = (candidates[int(np.argmax(scores))], scores)
+    return best
+
+
+if __name__ == '__main__':
+    # python bot.py [episodes]
+    # Picks the best candidate policy for every difficulty with the batch evaluation, checks it
+    # against rallies played by the bot in Simulation and times the bot's decisions.
+    from simulation import Simulation
+
+    episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    max_ticks = 3600
+    start = time.perf_counter()
+    best = best_policies(episodes=episodes, max_ticks=max_ticks)
+    elapsed = time.perf_counter() - start
+    rallies = len(CANDIDATES) * episodes * len(DIFFICULTIES)
+    print('%d rallies of up to %d ticks in %.2f s (%.0f rallies/s)' % (rallies, max_ticks, elapsed, rallies / elapsed))
+    for difficulty, (policy, scores) in best.items():
+        print('%-7s %s, %.1f hits per rally (candidates %.1f to %.1f)' %
+              (difficulty, policy, scores.max(), scores.min(), scores.max()))
+
+    over_budget = False
+    for difficulty, (policy, scores) in best.items():
+        hits = []
+        decision_times = []
+        start = time.perf_counter()
+        for episode in range(episodes):
+            simulation = Simulation(seed=episode)
+            simulation.paddles[0].controller = BotController(simulation, 0, 'hard', BEST_POLICIES['hard'])
+            bot = simulation.paddles[1].controller = BotController(simulation, 1, difficulty, policy)
+            simulation.run_rally(max_ticks=max_ticks)
+            hits.append(simulation.good_hits + simulation.bad_hits)
+            decision_times.extend(bot.decision_times)
+        elapsed = time.perf_counter() - start
+        bot.decision_times = decision_times
+        decision = bot.decision_percentiles()
+        over_budget |= decision[99] > DECISION_BUDGET * 1000
+        print('%-7s in Simulation: %.1f hits per rally, %.1f rallies/s, decisions p50 %.3f ms p99 %.3f ms' %
+              (difficulty, np.mean(hits), episodes / elapsed, decision[50], decision[99]))
+    if over_budget:
+        print('decisions take longer than %.1f ms' % (DECISION_BUDGET * 1000))
+        sys.exit(1)
@@ -0,0 +1,228 @@
+import os
+import time
+import zlib
+import fcntl
+import struct
+import tempfile
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+from replay import STATE, PADDLE, BALL, RANDOM, pack_state, unpack_state
+
+# Layout of the shared memory block of a court: the header, then two slots that checkpoints are written to
+# in turn, so the previous checkpoint stays whole while the next one is written, also when the writer dies
+# half way. A slot is its SLOT header followed by the state packed like replay.pack_state().
+MAGIC = b'PONGCKP2'  # 2: the score is part of the state
+HEADER = struct.Struct('<8sIIii')  # magic, slot size, ball capacity, pid of the primary, closed
+OWNER_OFFSET = 16
+CLOSED_OFFSET = 20
+SLOT = struct.Struct('<IQddI')  # crc32 of the rest of the slot, sequence, monotonic time written, song time, state size
+
+MAX_BALLS = 64  # Balls a block has room for when the court has fewer
+POLL_INTERVAL = 0.05  # Seconds between looks for a court that has not started yet
+
+# A checkpoint read from a block: written is the time.monotonic() it was written at, state is packed
+Checkpoint = namedtuple('Checkpoint', 'sequence written song_time state')
+
+
+def state_size(players, balls):
+    return STATE.size + players * PADDLE.size + balls * BALL.size + RANDOM.size
+
+
+# Lock file held by the process playing a court. The system lets go of it when the process ends,
+# however it ends, which is what a standby waits for.
+def lock_path(name):
+    return os.path.join(tempfile.gettempdir(), name + '.lock')
+
+
+# Shared memory that stays when the process that made it dies, it is only removed by close(unlink=True)
+def open_memory(name, size=None):
+    if size is None:
+        memory = shared_memory.SharedMemory(name=name)
+    else:
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+    resource_tracker.unregister(memory._name, 'shared_memory')
+    return memory
+
+
+# The shared memory block of a court, made with players and balls, or attached to by name without them
+class CheckpointBlock:
+    def __init__(self, name, players=None, balls=MAX_BALLS):
+        self.name = name
+        if players is None:
+            self.memory = open_memory(name)
+            magic, self.slot_size, self.balls, _, _ = HEADER.unpack_from(self.memory.buf)
+            if magic != MAGIC:
+                self.memory.close()
+                raise ValueError('%s is not a court checkpoint block' % name)
+        else:
+            self.balls = balls
+            self.slot_size = SLOT.size + state_size(players, balls)
+            self.memory = open_memory(name, HEADER.size + 2 * self.slot_size)
+            HEADER.pack_into(self.memory.buf, 0, MAGIC, self.slot_size, balls, 0, 0)
+
+    @property
+    def owner(self):
+        return struct.unpack_from('<i', self.memory.buf, OWNER_OFFSET)[0]
+
+    @owner.setter
+    def owner(self, pid):
+        struct.pack_into('<i', self.memory.buf, OWNER_OFFSET, pid)
+
+    # Set by the primary when the court ended normally, there is nothing to take over then
+    @property
+    def closed(self):
+        return bool(struct.unpack_from('<i', self.memory.buf, CLOSED_OFFSET)[0])
+
+    @closed.setter
+    def closed(self, closed):
+        struct.pack_into('<i', self.memory.buf, CLOSED_OFFSET, int(closed))
+
+    def write(self, sequence, song_time, state):
+        buffer = self.memory.buf
+        offset = HEADER.size + sequence % 2 * self.slot_size
+        end = offset + SLOT.size + len(state)
+        buffer[offset + SLOT.size:end] = state
+        SLOT.pack_into(buffer, offset, 0, sequence, time.monotonic(), song_time, len(state))
+        struct.pack_into('<I', buffer, offset, zlib.crc32(buffer[offset + 4:end]))
+
+    # Newest whole checkpoint, None when there is none. Each slot is copied before it is checked, a slot
+    # that is being written at the same time does not match its checksum and the other one is used.
+    def read(self):
+        latest = None
+        for slot in range(2):
+            offset = HEADER.size + slot * self.slot_size
+            data = bytes(self.memory.buf[offset:offset + self.slot_size])
+            checksum, sequence, written, song_time, size = SLOT.unpack_from(data)
+            if sequence == 0 or size > self.slot_size - SLOT.size:
+                continue
+            if zlib.crc32(data[4:SLOT.size + size]) != checksum:
+                continue
+            if latest is None or sequence > latest.sequence:
+                latest = Checkpoint(sequence, written, song_time, data[SLOT.size:SLOT.size + size])
+        return latest
+
+    def close(self, unlink=False):
+        self.memory.close()
+        if unlink:
+            CheckpointBlock.unlink(self.name)
+
+    @staticmethod
+    def unlink(name):
+        try:
+            shared_memory.SharedMemory(name=name).unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Writes the whole state of simulation to the shared memory block `name` after every `interval` ticks and
+# at the end of the rally, as the primary of the court. Attach it to a Simulation by creating it, the
+# simulation calls save() after every tick. Only one primary can play a court at a time.
+class Checkpointer:
+    def __init__(self, simulation, name, interval=1, block=None, lock=None, sequence=None):
+        self.name = name
+        self.interval = interval
+        if lock is None:
+            lock = open(lock_path(name), 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                raise RuntimeError('Court %s is already played by another process' % name)
+        self.lock = lock
+
+        # A block left by a court that stopped is used again, so a standby attached to it keeps working
+        if block is None:
+            balls = max(MAX_BALLS, len(simulation.balls))
+            try:
+                block = CheckpointBlock(name, len(simulation.paddles), balls)
+            except FileExistsError:
+                try:
+                    block = CheckpointBlock(name)
+                except ValueError:
+                    # Left by another version of the game
+                    CheckpointBlock.unlink(name)
+                    block = CheckpointBlock(name, len(simulation.paddles), balls)
+                if block.slot_size != SLOT.size + state_size(len(simulation.paddles), block.balls):
+                    block.close(unlink=True)
+                    block = CheckpointBlock(name, len(simulation.paddles), balls)
+        self.block = block
+        if sequence is None:
+            latest = block.read()
+            sequence = latest.sequence if latest is not None else 0
+        self.sequence = sequence  # Of the last checkpoint written
+        block.owner = os.getpid()
+        block.closed = False
+
+        self.save_time = 0.0
+        simulation.checkpoints = self
+
+    # Called by Simulation.tick
+    def save(self, simulation):
+        if simulation.frame % self.interval and not simulation.game_over:
+            return
+        start = time.perf_counter()
+        if len(simulation.balls) > self.block.balls:
+            raise ValueError('The checkpoint block of %s has room for %d balls' % (self.name, self.block.balls))
+        self.sequence += 1
+        self.block.write(self.sequence, simulation.tick_time, pack_state(simulation.get_state()))
+        self.save_time += time.perf_counter() - start
+
+    # The court ended normally: standbys stop waiting for it and the block is removed
+    def close(self):
+        self.block.closed = True
+        self.block.close(unlink=True)
+        self.lock.close()
+
+
+# Waits to take over the court `name` when the process playing it dies in the middle of a rally.
+# Make the simulation that will carry on with the court before waiting, so taking over only has to
+# restore the state.
+class Standby:
+    def __init__(self, name):
+        self.name = name
+        self.lock = open(lock_path(name), 'a')
+        self.block = None
+        self.played = False  # A primary held the lock while this standby waited
+
+    # Block until no process plays the court any more. Returns the newest checkpoint when the court
+    # stopped in the middle of a rally, None when it ended normally.
+    def wait(self):
+        while True:
+            try:
+                fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.played = True
+                fcntl.flock(self.lock, fcntl.LOCK_EX)
+            if self.block is None:
+                try:
+                    self.block = CheckpointBlock(self.name)
+                except FileNotFoundError:
+                    # A primary that ends normally removes the block before it lets go of the lock
+                    if self.played:
+                        return None
+            if self.block is not None:
+                if self.block.closed:
+                    return None
+                checkpoint = self.block.read()
+                if checkpoint is not None:
+                    return None if unpack_state(checkpoint.state)['game_over'] else checkpoint
+            # The court has not started yet
+            fcntl.flock(self.lock, fcntl.LOCK_UN)
+            time.sleep(POLL_INTERVAL)
+
+    # Restore the checkpoint into simulation and become the primary of the court. The game time since the
+    # checkpoint was written is added to the accumulator, so the court catches up with the real time
+    # on its next step(). Returns that time in seconds.
+    def take_over(self, simulation, checkpoint, interval=1):
+        elapsed = time.monotonic() - checkpoint.written
+        state = unpack_state(checkpoint.state)
+        state['accumulator'] += elapsed
+        simulation.set_state(state)
+        Checkpointer(simulation, self.name, interval, self.block, self.lock, checkpoint.sequence)
+        return elapsed
+
+    # Stop waiting without taking over
+    def close(self):
+        if self.block is not None:
+            self.block.close()
+        self.lock.close()
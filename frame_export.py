@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import queue
+import subprocess
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import pygame
+
+# raw: RGB bytes of every frame appended to one file, play or encode it with
+#      ffmpeg -f rawvideo -pix_fmt rgb24 -s <width>x<height> -r 60 -i <file> out.mp4
+# pipe: the same bytes piped into an encoder, ENCODER by default
+# npz: compressed chunks of NPZ_CHUNK frames with their frame numbers, <path>_00000.npz and so on
+# png: one image per frame in the directory path
+FORMATS = ['raw', 'pipe', 'npz', 'png']
+ENCODER = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '{width}x{height}',
+           '-r', '{rate}', '-i', '-', '-pix_fmt', 'yuv420p', '{path}']
+NPZ_CHUNK = 60
+CLOSE_POLL = 0.1  # Seconds between looks at whether the writer process is still alive while closing
+
+
+# Records frames from the game loop without stalling it. Frames are copied into one of a ring of
+# preallocated slots in shared memory and a writer process saves them from there. When the writer
+# falls behind and every slot is taken, submit() waits at most `wait` seconds for one and otherwise
+# drops the frame, so recording costs the game loop one copy of a frame at most.
+# Frames have `channels` bytes per pixel and order gives the bytes holding red, green and blue.
+# Copying whole 32-bit pixels is much faster than picking out three bytes of each, so for
+# framebuffer.FramebufferRenderer.rgbx and 32-bit surfaces the writer reorders the bytes instead.
+class FrameExporter:
+    def __init__(self, path, width, height, format='raw', slots=8, rate=60, wait=0.0, command=None,
+                 channels=3, order=(0, 1, 2)):
+        if format not in FORMATS:
+            raise ValueError('Unknown export format %r, use one of %s' % (format, ', '.join(FORMATS)))
+        self.shape = (height, width, channels)
+        self.wait = wait
+        size = height * width * channels
+        self.memory = shared_memory.SharedMemory(create=True, size=size * slots)
+        self.slots = [np.ndarray(self.shape, np.uint8, self.memory.buf, index * size) for index in range(slots)]
+
+        self.filled = multiprocessing.Queue()   # (slot, frame number) to write, None to stop
+        self.free = multiprocessing.Queue()     # Slots the writer is done with
+        self.results = multiprocessing.Queue()
+        for index in range(slots):
+            self.free.put(index)
+
+        self.frames = 0     # Frames submitted, including dropped ones
+        self.frames_dropped = 0
+        self.frames_written = 0     # Known after close()
+        self.submit_time = 0.0
+        self.process = multiprocessing.Process(
+            target=write_frames, args=(self.memory.name, self.shape, order, slots, path, format, rate, command,
+                                       self.filled, self.free, self.results), daemon=True)
+        self.process.start()
+
+    def take_slot(self):
+        try:
+            if self.wait > 0:
+                return self.free.get(timeout=self.wait)
+            return self.free.get_nowait()
+        except queue.Empty:
+            return None
+
+    # Export a (height, width, channels) uint8 frame, returns False if it was dropped
+    def submit(self, frame):
+        start = time.perf_counter()
+        number = self.frames
+        self.frames += 1
+        slot = self.take_slot()
+        if slot is None:
+            self.frames_dropped += 1
+            self.submit_time += time.perf_counter() - start
+            return False
+        np.copyto(self.slots[slot], frame)
+        self.filled.put((slot, number))
+        self.submit_time += time.perf_counter() - start
+        return True
+
+    # Export a pygame surface of the same size with `channels` bytes per pixel, see surface_order()
+    def submit_surface(self, surface):
+        buffer = surface.get_buffer()
+        rows = np.frombuffer(buffer, np.uint8).reshape(self.shape[0], surface.get_pitch())
+        submitted = self.submit(rows[:, :self.shape[1] * self.shape[2]].reshape(self.shape))
+        del rows, buffer  # Unlocks the surface
+        return submitted
+
+    # Wait until every frame handed over is written. Raises what stopped the writer, if it failed.
+    def close(self):
+        self.filled.put(None)
+        try:
+            while True:
+                alive = self.process.is_alive()
+                try:
+                    written, error = self.results.get(timeout=CLOSE_POLL)
+                    break
+                except queue.Empty:
+                    if not alive:
+                        raise RuntimeError('The frame writer died with exit code %s' % self.process.exitcode)
+            self.process.join()
+            if error is not None:
+                raise error
+            self.frames_written = written
+        finally:
+            self.slots = []
+            self.memory.close()
+            self.memory.unlink()
+
+
+# Bytes of red, green and blue in the pixels of a surface
+def surface_order(surface):
+    if sys.byteorder == 'little':
+        return tuple(shift // 8 for shift in surface.get_shifts()[:3])
+    return tuple(surface.get_bytesize() - 1 - shift // 8 for shift in surface.get_shifts()[:3])
+
+
+# Writer process: saves the frames in the slots named on the filled queue and hands the slots back.
+# Puts the number of frames written on results, or the error that stopped it.
+def write_frames(memory_name, shape, order, slots, path, format, rate, command, filled, free, results):
+    try:
+        results.put((save_frames(memory_name, shape, order, slots, path, format, rate, command, filled, free), None))
+    except (OSError, ValueError, pygame.error) as error:
+        results.put((0, error))
+
+
+def save_frames(memory_name, shape, order, slots, path, format, rate, command, filled, free):
+    memory = shared_memory.SharedMemory(name=memory_name)
+    size = shape[0] * shape[1] * shape[2]
+    frames = [np.ndarray(shape, np.uint8, memory.buf, index * size) for index in range(slots)]
+    height, width = shape[:2]
+    rgb = tuple(order) == (0, 1, 2) and shape[2] == 3
+    order = list(order)
+
+    output = encoder = None
+    if format == 'raw':
+        output = open(path, 'wb')
+    elif format == 'pipe':
+        arguments = [argument.format(width=width, height=height, rate=rate, path=path)
+                     for argument in (command or ENCODER)]
+        encoder = subprocess.Popen(arguments, stdin=subprocess.PIPE)
+        output = encoder.stdin
+    elif format == 'png':
+        os.makedirs(path, exist_ok=True)
+    chunk = np.zeros((NPZ_CHUNK, height, width, 3), np.uint8) if format == 'npz' else None
+    numbers = []
+    chunks = 0
+    written = 0
+    last = None     # Last frame written to a video stream and its number
+    frame = None
+
+    while True:
+        message = filled.get()
+        if message is None:
+            break
+        slot, number = message
+        frame = frames[slot] if rgb else frames[slot][:, :, order]
+        if output is not None:
+            # Repeat the last frame for dropped ones so the video keeps time with the game
+            if last is not None:
+                for _ in range(number - last[1] - 1):
+                    output.write(last[0])
+            data = frame.tobytes()
+            free.put(slot)
+            output.write(data)
+            last = (data, number)
+        elif format == 'npz':
+            chunk[len(numbers)] = frame
+            free.put(slot)
+            numbers.append(number)
+            if len(numbers) == NPZ_CHUNK:
+                np.savez_compressed('%s_%05d.npz' % (path, chunks), frames=chunk, numbers=np.array(numbers))
+                chunks += 1
+                numbers = []
+        else:
+            image = pygame.image.frombuffer(frame.tobytes(), (width, height), 'RGB')
+            free.put(slot)
+            pygame.image.save(image, os.path.join(path, 'frame_%06d.png' % number))
+        written += 1
+
+    if numbers:
+        np.savez_compressed('%s_%05d.npz' % (path, chunks), frames=chunk[:len(numbers)], numbers=np.array(numbers))
+    if output is not None:
+        output.close()
+    if encoder is not None:
+        encoder.wait()
+    del frames, frame
+    memory.close()
+    return written
+
+
+if __name__ == '__main__':
+    # python frame_export.py <path> [raw|pipe|npz|png] [seconds]
+    # Plays headless at 60 frames per second while exporting every frame, and reports the cost.
+    import tempfile
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from pong_extended import Pong
+    from framebuffer import FramebufferRenderer
+    from simulation import KeyState
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.mkdtemp(), 'session')
+    format = sys.argv[2] if len(sys.argv) > 2 else 'raw'
+    frames = int(float(sys.argv[3]) * 60) if len(sys.argv) > 3 else 600
+
+    pong = Pong(seed=1)
+    renderer = FramebufferRenderer(pong)
+    renderer.texts = pong.speed_texts
+    exporter = FrameExporter(path, pong.WIDTH, pong.HEIGHT, format, channels=4)
+    submit_times = []
+    start = time.perf_counter()
+    for frame in range(frames):
+        pong.tick(KeyState())
+        if pong.game_over:
+            pong.set_state(Pong(seed=frame, screen=pong.screen).get_state())
+        renderer.render()
+        before = time.perf_counter()
+        exporter.submit(renderer.rgbx)
+        submit_times.append(time.perf_counter() - before)
+        time.sleep(max(0.0, start + (frame + 1) / 60 - time.perf_counter()))
+    before = time.perf_counter()
+    exporter.close()
+    flushed = time.perf_counter() - before
+
+    submit_times = np.array(submit_times) * 1000
+    print('%s to %s: %d frames, %d dropped, %d written, %.2f s to flush at the end' %
+          (format, path, exporter.frames, exporter.frames_dropped, exporter.frames_written, flushed))
+    print('submit() per frame: mean %.3f ms p99 %.3f ms max %.3f ms' %
+          (submit_times.mean(), np.percentile(submit_times, 99), submit_times.max()))
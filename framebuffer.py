@@ -0,0 +1,146 @@
+import pygame
+import numpy as np
+
+
+# Draws a Simulation straight into a (height, width, 3) uint8 array, without SDL surfaces, e.g. for the
+# LED output or recording headless courts. The court is scaled to the size of the framebuffer.
+# Pixels are stored as one little-endian uint32 (red, green, blue, unused byte) so a colour is filled
+# in with a single integer, self.frame and self.rgbx are RGB and RGBX views of the same memory.
+# Everything is drawn with slice assignments and masks made up front, so no arrays are allocated
+# while drawing a frame. At the court's own size the picture is the same as Pong.draw().
+class FramebufferRenderer:
+    COLOUR = (255, 255, 255)
+    CIRCLE_COLOUR = (26, 235, 235)
+    CIRCLE_WIDTH = 8
+    PLAYER_CIRCLE_SIZE = 40
+    TEXT_MASKS = 128  # Speed texts kept as masks
+
+    def __init__(self, simulation, width=None, height=None):
+        self.simulation = simulation
+        self.width = width or simulation.WIDTH
+        self.height = height or simulation.HEIGHT
+        self.scale_x = self.width / simulation.WIDTH
+        self.scale_y = self.height / simulation.HEIGHT
+        self.pixels = np.zeros((self.height, self.width), dtype='<u4')
+        self.rgbx = self.pixels.view(np.uint8).reshape(self.height, self.width, 4)
+        self.frame = self.rgbx[:, :, :3]
+
+        # Pong's colours and sizes when drawing a Pong
+        self.colour_value = getattr(simulation, 'COLOUR', self.COLOUR)
+        self.circle_colour_value = getattr(simulation, 'CIRCLE_COLOUR', self.CIRCLE_COLOUR)
+        self.circle_width = getattr(simulation, 'CIRCLE_WIDTH', self.CIRCLE_WIDTH)
+        self.player_circle_size = getattr(simulation, 'PLAYER_CIRCLE_SIZE', self.PLAYER_CIRCLE_SIZE)
+
+        # Same lines as Pong, as slices of the framebuffer
+        width, height = simulation.WIDTH, simulation.HEIGHT
+        self.lines = [self.rect_slices(*rect) for rect in (
+            (width / 2, 0, 5, height), (width / 3, 0, 3, height), (2 * width / 3, 0, 3, height),
+            (0, 0, 5, height), (width - 5, 0, 5, height), (0, height - 5, width, 5), (0, 0, width, 5))]
+        self.half = self.rect_slices(width / 2, 0, width / 2, height)[1].start
+
+        # Circle masks for every ring size the pulse can reach
+        self.circles = {}
+        self.circle(self.player_circle_size, 0)
+        for radius in range(int(simulation.CIRCLE_MIN_SIZE - simulation.CIRCLE_SPEED),
+                            int(simulation.CIRCLE_MAX_SIZE + simulation.CIRCLE_SPEED) + 1):
+            self.circle(radius, self.circle_width)
+
+        # Text drawn over the court: returns (surface, centre in court coordinates) pairs, see Pong.speed_texts
+        self.texts = None
+        self.text_masks = {}
+
+    @staticmethod
+    def colour(colour):
+        return colour[0] | colour[1] << 8 | colour[2] << 16
+
+    # Framebuffer rows and columns covered by a rect in court coordinates, at least one pixel wide
+    def rect_slices(self, x, y, width, height):
+        x, y = int(x + 0.5 if x >= 0 else x - 0.5), int(y + 0.5 if y >= 0 else y - 0.5)  # Like pygame.Rect
+        left = int(x * self.scale_x)
+        top = int(y * self.scale_y)
+        right = max(int((x + int(width)) * self.scale_x), left + 1)
+        bottom = max(int((y + int(height)) * self.scale_y), top + 1)
+        return (slice(min(max(top, 0), self.height), min(max(bottom, 0), self.height)),
+                slice(min(max(left, 0), self.width), min(max(right, 0), self.width)))
+
+    # (height, width) mask of a circle drawn by pygame.draw.circle and the offset of its top left
+    # corner from the centre, at the framebuffer scale
+    def circle(self, radius, width):
+        key = (radius, width)
+        circle = self.circles.get(key)
+        if circle is None:
+            scaled_radius = max(int(round(radius * self.scale_x)), 1)
+            scaled_width = max(int(round(width * self.scale_x)), 1) if width else 0
+            size = 2 * scaled_radius + 2
+            surface = pygame.Surface((size, size))
+            pygame.draw.circle(surface, (255, 255, 255), (scaled_radius + 1, scaled_radius + 1), scaled_radius,
+                               scaled_width)
+            mask = (pygame.surfarray.array2d(surface) != 0).T
+            circle = self.circles[key] = (mask, -scaled_radius - 1)
+        return circle
+
+    # Mask of a text surface at the framebuffer scale, its transparent pixels are left out
+    def text_mask(self, surface):
+        mask = self.text_masks.get(surface)
+        if mask is None:
+            if len(self.text_masks) >= self.TEXT_MASKS:
+                self.text_masks.clear()
+            opaque = pygame.surfarray.array_colorkey(surface).T != 0
+            rows = (np.arange(max(int(opaque.shape[0] * self.scale_y), 1)) / self.scale_y).astype(int)
+            columns = (np.arange(max(int(opaque.shape[1] * self.scale_x), 1)) / self.scale_x).astype(int)
+            mask = self.text_masks[surface] = opaque[rows[:, None], columns[None, :]]
+        return mask
+
+    # Copy colour where mask is set, with the mask's top left corner at (left, top), clipped to the frame
+    def draw_mask(self, mask, left, top, colour):
+        height, width = mask.shape
+        first_x, first_y = max(left, 0), max(top, 0)
+        last_x, last_y = min(left + width, self.width), min(top + height, self.height)
+        if first_x >= last_x or first_y >= last_y:
+            return
+        np.copyto(self.pixels[first_y:last_y, first_x:last_x], colour,
+                  where=mask[first_y - top:last_y - top, first_x - left:last_x - left])
+
+    def draw_circle(self, centre, radius, width, colour):
+        mask, offset = self.circle(radius, width)
+        self.draw_mask(mask, int(centre[0] * self.scale_x) + offset, int(centre[1] * self.scale_y) + offset,
+                       colour)
+
+    def draw_rect(self, rect, colour):
+        self.pixels[self.rect_slices(rect.x, rect.y, rect.width, rect.height)] = colour
+
+    # Draw the whole court into self.frame, in the same order as Pong.draw()
+    def render(self):
+        simulation = self.simulation
+        pixels = self.pixels
+        white = self.colour(self.colour_value)
+        pixels[...] = 0
+
+        # What Pong shows this frame, see Pong.update_visuals()
+        if simulation.light_up_right:
+            pixels[:, self.half:] = self.colour(getattr(simulation, 'shown_colour_right',
+                                                        simulation.light_up_colour_right))
+        if simulation.light_up_left:
+            pixels[:, :self.half] = self.colour(getattr(simulation, 'shown_colour_left',
+                                                        simulation.light_up_colour_left))
+
+        for line in self.lines:
+            pixels[line] = white
+
+        if self.texts is not None:
+            for surface, (x, y) in self.texts():
+                width, height = surface.get_size()
+                self.draw_mask(self.text_mask(surface), int((x - width / 2) * self.scale_x),
+                               int((y - height / 2) * self.scale_y), white)
+
+        circle_colour = self.colour(self.circle_colour_value)
+        radius = int(getattr(simulation, 'shown_circle_size', simulation.circle_size))
+        for paddle in simulation.paddles:
+            centre = (paddle.x + int(0.5 * simulation.PADDLE_WIDTH), paddle.y + int(0.5 * simulation.PADDLE_WIDTH))
+            self.draw_circle(centre, self.player_circle_size, 0, circle_colour)
+            self.draw_circle(centre, radius, self.circle_width, circle_colour)
+            self.draw_rect(paddle, white)
+
+        for ball in simulation.balls:
+            self.draw_rect(ball, white)
+        return self.frame
@@ -0,0 +1,311 @@
+import sys
+import time
+import socket
+import struct
+import threading
+import pygame
+import numpy as np
+
+# Packets in the spirit of Art-Net/E1.31, but only carrying the pixels that changed.
+# Every packet has a header followed by runs: first pixel, pixel count, then RGB bytes.
+# A frame can take several packets, the last one has END_OF_FRAME set. Every KEYFRAME_INTERVAL
+# frames all pixels are sent, so a receiver that lost packets catches up.
+MAGIC = b'LEDF'
+HEADER = struct.Struct('<4sIIdHB')  # magic, sequence, frame, send time, run count, flags
+RUN = struct.Struct('<IH')  # first pixel, pixel count
+KEYFRAME = 1
+END_OF_FRAME = 2
+
+MAX_PACKET = 1400  # Bytes, stays below a normal ethernet MTU
+MERGE_GAP = 4  # Unchanged pixels between two runs that are sent anyway to save a run header
+KEYFRAME_INTERVAL = 60
+RECONNECT_INTERVAL = 1.0  # Seconds between attempts to connect over TCP while there is no connection
+SEND_TIMEOUT = 1.0  # Seconds a TCP receiver may stall a frame before it counts as failed
+
+
+# Average blocks of an (height, width, 3) frame down to (rows, columns, 3)
+def downsample(frame, columns, rows):
+    row_starts = (np.arange(rows) * frame.shape[0]) // rows
+    column_starts = (np.arange(columns) * frame.shape[1]) // columns
+    sums = np.add.reduceat(np.add.reduceat(frame.astype(np.uint32), row_starts, axis=0), column_starts, axis=1)
+    counts = np.diff(np.append(row_starts, frame.shape[0]))[:, None, None] * \
+        np.diff(np.append(column_starts, frame.shape[1]))[None, :, None]
+    return (sums // counts).astype(np.uint8)
+
+
+# (first pixel, pixel count) of every run of changed pixels, runs closer than MERGE_GAP are joined
+def changed_runs(previous, current):
+    changed = (previous != current).any(axis=1)
+    edges = np.diff(np.concatenate(([0], changed.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) > 1:
+        keep = np.concatenate(([True], starts[1:] - ends[:-1] > MERGE_GAP))
+        starts = starts[keep]
+        ends = np.concatenate((ends[:-1][keep[1:]], ends[-1:]))
+    return list(zip(starts.tolist(), (ends - starts).tolist()))
+
+
+# Sends frames to an LED controller from a background thread. submit() only copies the frame and
+# hands it over, scaling down and sending happens in the thread, mostly while the game loop waits
+# for its next frame. If the sender is still busy with the previous frame that one is dropped.
+# A frame that cannot be sent (receiver gone or not up yet, connection reset, receiver stalled for
+# SEND_TIMEOUT) is counted in frames_failed and the error kept in last_error; over TCP the sink
+# connects from the thread, again after every failure, and the next frame sent is a keyframe.
+class LedSink:
+    def __init__(self, address, columns, rows, protocol='udp'):
+        self.address = address
+        self.columns = columns
+        self.rows = rows
+        self.protocol = protocol
+
+        self.pending = None
+        self.pending_time = 0.0
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.running = True
+
+        self.frames = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.frames_failed = 0
+        self.send_errors = 0
+        self.connections = 0  # TCP connections made, the first one included
+        self.last_error = None
+        self.sequence = 0
+        self.previous = None
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if protocol == 'udp' else None
+        self.next_connect = 0.0  # time.monotonic() of the next attempt to connect while disconnected
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Hand over a pygame surface, called from the game loop
+    def submit(self, surface):
+        self.hand_over(surface.copy())
+
+    # Hand over an (rows, columns, 3) or larger (height, width, 3) uint8 frame
+    def submit_array(self, frame):
+        self.hand_over(frame.copy())
+
+    def hand_over(self, frame):
+        with self.lock:
+            if self.pending is not None:
+                self.frames_dropped += 1
+            self.pending = frame
+            self.pending_time = time.time()
+            self.frames += 1
+        self.ready.set()
+
+    def run(self):
+        while self.running:
+            self.ready.wait()
+            with self.lock:
+                frame, sent_time = self.pending, self.pending_time
+                self.pending = None
+                self.ready.clear()
+            if frame is None:
+                continue
+            if self.socket is None and not self.connect():
+                self.frames_failed += 1
+                continue
+            try:
+                self.send_frame(self.led_pixels(frame).reshape(-1, 3), sent_time)
+            except OSError as error:
+                self.send_failed(error)
+
+    # The receiver missed (part of) a frame: start again from a keyframe and connect again over TCP
+    def send_failed(self, error):
+        self.frames_failed += 1
+        self.send_errors += 1
+        self.last_error = error
+        self.previous = None
+        if self.protocol != 'udp':
+            self.socket.close()
+            self.socket = None
+            self.next_connect = time.monotonic() + RECONNECT_INTERVAL
+
+    def connect(self):
+        if time.monotonic() < self.next_connect:
+            return False
+        try:
+            self.socket = socket.create_connection(self.address, RECONNECT_INTERVAL)
+            self.socket.settimeout(SEND_TIMEOUT)
+        except OSError as error:
+            self.send_errors += 1
+            self.last_error = error
+            self.next_connect = time.monotonic() + RECONNECT_INTERVAL
+            return False
+        self.connections += 1
+        return True
+
+    # Scale a surface or array down to the LED matrix, areas of the frame are averaged
+    def led_pixels(self, frame):
+        if isinstance(frame, pygame.Surface):
+            small = pygame.transform.smoothscale(frame, (self.columns, self.rows))
+            return pygame.surfarray.array3d(small).swapaxes(0, 1)
+        if frame.shape[:2] != (self.rows, self.columns):
+            return downsample(frame, self.columns, self.rows)
+        return frame
+
+    def send_frame(self, pixels, sent_time):
+        keyframe = self.previous is None or self.frames_sent % KEYFRAME_INTERVAL == 0
+        runs = [(0, len(pixels))] if keyframe else changed_runs(self.previous, pixels)
+        self.previous = pixels.copy()
+
+        # Fill packets with runs, a run that does not fit in the rest of a packet is split
+        packet_runs = []
+        size = HEADER.size
+        for start, length in runs:
+            while length > 0:
+                room = (MAX_PACKET - size - RUN.size) // 3
+                if room <= 0:
+                    self.send_packet(packet_runs, pixels, sent_time, keyframe, False)
+                    packet_runs = []
+                    size = HEADER.size
+                    continue
+                count = min(length, room)
+                packet_runs.append((start, count))
+                size += RUN.size + 3 * count
+                start += count
+                length -= count
+        self.send_packet(packet_runs, pixels, sent_time, keyframe, True)
+        self.frames_sent += 1
+
+    def send_packet(self, runs, pixels, sent_time, keyframe, end_of_frame):
+        flags = (KEYFRAME if keyframe else 0) | (END_OF_FRAME if end_of_frame else 0)
+        data = [HEADER.pack(MAGIC, self.sequence, self.frames_sent, sent_time, len(runs), flags)]
+        for start, length in runs:
+            data.append(RUN.pack(start, length))
+            data.append(pixels[start:start + length].tobytes())
+        packet = b''.join(data)
+        if self.protocol == 'udp':
+            self.socket.sendto(packet, self.address)
+        else:
+            self.socket.sendall(struct.pack('<H', len(packet)) + packet)
+        self.sequence += 1
+        self.packets_sent += 1
+        self.bytes_sent += len(packet)
+
+    def close(self):
+        self.running = False
+        self.ready.set()
+        self.thread.join()
+        if self.socket is not None:
+            self.socket.close()
+
+
+# Stand-in for an LED controller: rebuilds the frames from the packets and measures latency
+class LedReceiver:
+    def __init__(self, address, columns, rows, protocol='udp'):
+        self.pixels = np.zeros((rows * columns, 3), dtype=np.uint8)
+        self.protocol = protocol
+        self.frames = 0
+        self.packets = 0
+        self.bytes = 0
+        self.lost_packets = 0
+        self.latencies = []
+        self.next_sequence = None
+        self.running = True
+
+        if protocol == 'udp':
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self.socket.bind(address)
+        else:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind(address)
+            self.server.listen(1)
+        self.address = (self.socket if protocol == 'udp' else self.server).getsockname()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def packets_received(self):
+        if self.protocol == 'udp':
+            self.socket.settimeout(0.2)
+            while self.running:
+                try:
+                    yield self.socket.recv(65536)
+                except socket.timeout:
+                    pass
+        else:
+            self.socket, _ = self.server.accept()
+            stream = self.socket.makefile('rb')
+            while self.running:
+                length = stream.read(2)
+                if len(length) < 2:
+                    return
+                yield stream.read(struct.unpack('<H', length)[0])
+
+    def run(self):
+        for packet in self.packets_received():
+            self.receive(packet)
+
+    def receive(self, packet):
+        magic, sequence, frame, sent_time, run_count, flags = HEADER.unpack_from(packet)
+        if magic != MAGIC:
+            return
+        if self.next_sequence is not None and sequence > self.next_sequence:
+            self.lost_packets += sequence - self.next_sequence
+        self.next_sequence = sequence + 1
+        offset = HEADER.size
+        for _ in range(run_count):
+            start, length = RUN.unpack_from(packet, offset)
+            offset += RUN.size
+            self.pixels[start:start + length] = np.frombuffer(packet, np.uint8, 3 * length, offset).reshape(-1, 3)
+            offset += 3 * length
+        self.packets += 1
+        self.bytes += len(packet)
+        if flags & END_OF_FRAME:
+            self.frames += 1
+            self.latencies.append(time.time() - sent_time)
+
+    def close(self):
+        self.running = False
+        self.thread.join(1)
+        self.socket.close()
+
+
+if __name__ == '__main__':
+    # python led_output.py [udp|tcp] [columns] [rows]
+    # Plays the game headless for 10 seconds of frames and sends them to a receiver on this machine.
+    import os
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from pong_extended import Pong
+    from simulation import KeyState
+
+    protocol = sys.argv[1] if len(sys.argv) > 1 else 'udp'
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+    rows = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+
+    receiver = LedReceiver(('127.0.0.1', 0), columns, rows, protocol)
+    sink = LedSink(receiver.address, columns, rows, protocol)
+    pong = Pong(seed=1)
+    submit_time = 0.0
+    start = time.perf_counter()
+    for frame in range(600):
+        pong.tick(KeyState())
+        if pong.game_over:
+            pong = Pong(seed=frame)
+        pong.draw()
+        before = time.perf_counter()
+        sink.submit(pong.screen)
+        submit_time += time.perf_counter() - before
+        time.sleep(max(0.0, start + (frame + 1) / 60 - time.perf_counter()))
+    time.sleep(0.5)
+    sink.close()
+    receiver.close()
+
+    latencies = np.array(receiver.latencies) * 1000
+    print('%s %dx%d: %d frames submitted, %d dropped, %d sent in %d packets (%.1f kB/s)' %
+          (protocol, columns, rows, sink.frames, sink.frames_dropped, sink.frames_sent, sink.packets_sent,
+           sink.bytes_sent / 10 / 1000))
+    print('received %d frames, %d packets lost, latency p50 %.2f ms p99 %.2f ms' %
+          (receiver.frames, receiver.lost_packets, np.percentile(latencies, 50), np.percentile(latencies, 99)))
+    if sink.frames_failed:
+        print('%d frames failed to send, last error: %s' % (sink.frames_failed, sink.last_error))
+    print('submit() cost in the game loop: %.3f ms per frame' % (submit_time / 600 * 1000))
+    print('last frame matches: %s' % np.array_equal(receiver.pixels, sink.previous))
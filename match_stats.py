@@ -0,0 +1,222 @@
+import os
+import sys
+import time
+import threading
+import numpy as np
+
+# One file per column in the store's directory, rows are only ever appended
+COLUMNS = {
+    'time': '<f8',          # Wall clock time of the hit, seconds since the epoch
+    'song_time': '<f8',     # Position in the song, Simulation.tick_time
+    'session': '<u4',
+    'player': '<u2',        # Index of the paddle in Simulation.paddles
+    'velocity': '<f4',      # Horizontal ball speed after the hit in pixels per tick
+    'angle': '<f4',
+    'speed': '<f4',         # Speed shown on the court, Simulation.hit_speed()
+    'beat_phase': '<f4',
+    'timing_ms': '<f4',     # From the nearest good beat position, negative when early
+    'good': 'u1',
+}
+
+# Kept up to date on every hit, so summaries of players and sessions never read the hit columns
+PLAYER_FIELDS = [('hits', '<u8'), ('good', '<u8'), ('velocity_sum', '<f8'), ('velocity_max', '<f8'),
+                 ('speed_sum', '<f8'), ('speed_max', '<f8'), ('timing_abs_sum', '<f8'),
+                 ('first_time', '<f8'), ('last_time', '<f8')]
+SESSION_FIELDS = [('start_row', '<u8'), ('end_row', '<u8'), ('start_time', '<f8'), ('seed', '<i8'),
+                  ('hits', '<u8'), ('good', '<u8'), ('speed_sum', '<f8')]
+
+CAPACITY = 4096     # Rows allocated in a new store, files double in size when full
+
+
+# Memory-mapped array in a file that grows by doubling; rows past the count in the header are unused
+class GrowingArray:
+    def __init__(self, path, dtype, capacity=CAPACITY):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        if not os.path.exists(path):
+            with open(path, 'wb') as file:
+                file.truncate(capacity * self.dtype.itemsize)
+        self.array = np.memmap(path, self.dtype, 'r+')
+
+    def reserve(self, count):
+        if count <= len(self.array):
+            return
+        capacity = len(self.array)
+        while capacity < count:
+            capacity *= 2
+        self.array.flush()
+        del self.array
+        with open(self.path, 'r+b') as file:
+            file.truncate(capacity * self.dtype.itemsize)
+        self.array = np.memmap(self.path, self.dtype, 'r+')
+
+
+# Every hit of every session in an append-only columnar log on disk, with per-player totals.
+# Attach it to a Simulation with attach(); queries only read the columns they need, as views of
+# the memory-mapped files, so a season of hits is summarised in milliseconds.
+class MatchStats:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock = threading.Lock()   # Courts stepped on a thread pool can share a store
+        self.columns = {name: GrowingArray(os.path.join(directory, name + '.col'), dtype)
+                        for name, dtype in COLUMNS.items()}
+        self.player_totals = GrowingArray(os.path.join(directory, 'players.agg'), PLAYER_FIELDS, 16)
+        self.session_table = GrowingArray(os.path.join(directory, 'sessions.tab'), SESSION_FIELDS, 64)
+        # Rows, sessions and players in use. Written after the rows themselves, so a store that was
+        # not closed properly ends at the last complete hit.
+        self.header = GrowingArray(os.path.join(directory, 'header.u8'), '<u8', 3)
+
+    @property
+    def rows(self):
+        return int(self.header.array[0])
+
+    @property
+    def sessions(self):
+        return int(self.header.array[1])
+
+    @property
+    def players(self):
+        return int(self.header.array[2])
+
+    # Record the hits of simulation from now on as a new session, returns its number
+    def attach(self, simulation):
+        with self.lock:
+            session = self.sessions
+            self.session_table.reserve(session + 1)
+            self.session_table.array[session] = (self.rows, self.rows, time.time(),
+                                                 -1 if simulation.seed is None else simulation.seed, 0, 0, 0)
+            self.header.array[1] = session + 1
+        simulation.stats = self
+        simulation.stats_session = session
+        return session
+
+    # Called by Simulation.hit_ball
+    def record_hit(self, simulation, ball, paddle, good):
+        player = next(index for index, other in enumerate(simulation.paddles) if other is paddle)
+        self.append(time=time.time(), song_time=simulation.tick_time, session=simulation.stats_session,
+                    player=player, velocity=abs(ball.velocity), angle=ball.angle, speed=simulation.hit_speed(ball),
+                    beat_phase=simulation.beat_phase(), timing_ms=simulation.beat_clock.timing_ms(simulation.tick_time),
+                    good=good)
+
+    def append(self, **hit):
+        with self.lock:
+            row = self.rows
+            for name, column in self.columns.items():
+                column.reserve(row + 1)
+                column.array[row] = hit[name]
+
+            player = hit['player']
+            if player >= self.players:
+                self.player_totals.reserve(player + 1)
+                self.header.array[2] = player + 1
+            totals = self.player_totals.array[player]
+            if totals['hits'] == 0:
+                totals['first_time'] = hit['time']
+            totals['hits'] += 1
+            totals['good'] += bool(hit['good'])
+            totals['velocity_sum'] += hit['velocity']
+            totals['velocity_max'] = max(totals['velocity_max'], hit['velocity'])
+            totals['speed_sum'] += hit['speed']
+            totals['speed_max'] = max(totals['speed_max'], hit['speed'])
+            totals['timing_abs_sum'] += abs(hit['timing_ms'])
+            totals['last_time'] = hit['time']
+
+            session = self.session_table.array[hit['session']]
+            session['end_row'] = row + 1
+            session['hits'] += 1
+            session['good'] += bool(hit['good'])
+            session['speed_sum'] += hit['speed']
+            self.header.array[0] = row + 1
+
+    # A hit column as a read-only view, or the hits of one session. Courts sharing a store add their
+    # hits in turn, so the rows of a session lie between its first and last row but need not be adjacent.
+    def column(self, name, session=None):
+        if session is None:
+            view = self.columns[name].array[:self.rows].view()
+            view.flags.writeable = False
+            return view
+        start, end = (int(row) for row in self.session_table.array[session][['start_row', 'end_row']].tolist())
+        rows = self.columns[name].array[start:end]
+        return np.array(rows[self.columns['session'].array[start:end] == session])
+
+    # Totals of every player from the running aggregates: hits, good ratio, mean and top speeds,
+    # mean distance from the beat
+    def player_summary(self):
+        totals = np.array(self.player_totals.array[:self.players])
+        hits = np.maximum(totals['hits'], 1)
+        return {
+            'hits': totals['hits'],
+            'good_ratio': totals['good'] / hits,
+            'mean_velocity': totals['velocity_sum'] / hits,
+            'max_velocity': totals['velocity_max'],
+            'mean_speed': totals['speed_sum'] / hits,
+            'max_speed': totals['speed_max'],
+            'mean_timing_ms': totals['timing_abs_sum'] / hits,
+        }
+
+    # Hits, good ratio and mean speed of every session. The totals are kept up to date for whole
+    # sessions, the hits of one player are counted from the columns.
+    def session_summary(self, player=None):
+        sessions = np.array(self.session_table.array[:self.sessions])
+        if player is None:
+            hits, good, speed = sessions['hits'], sessions['good'], sessions['speed_sum']
+        else:
+            mine = self.column('player') == player
+            session = self.column('session')[mine]
+            hits = np.bincount(session, minlength=self.sessions)
+            good = np.bincount(session, self.column('good')[mine], minlength=self.sessions)
+            speed = np.bincount(session, self.column('speed')[mine], minlength=self.sessions)
+        return {'start_time': sessions['start_time'], 'hits': hits.astype(np.int64),
+                'good_ratio': good / np.maximum(hits, 1), 'mean_speed': speed / np.maximum(hits, 1)}
+
+    def flush(self):
+        with self.lock:
+            for array in [*self.columns.values(), self.player_totals, self.session_table, self.header]:
+                array.array.flush()
+
+    def close(self):
+        self.flush()
+
+
+if __name__ == '__main__':
+    # python match_stats.py <directory> [sessions]
+    # Plays the given number of headless sessions with scripted players into the store, then times
+    # the queries over everything in it.
+    import random
+    from simulation import Simulation
+    from sweep import scripted_inputs
+
+    stats = MatchStats(sys.argv[1])
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    rng = random.Random(len(sys.argv[1]) + stats.rows)
+    start = time.perf_counter()
+    for _ in range(sessions):
+        simulation = Simulation(seed=rng.getrandbits(32))
+        stats.attach(simulation)
+        while not simulation.game_over and simulation.frame < 20000:
+            simulation.tick(scripted_inputs(simulation, rng))
+    if sessions:
+        print('played %d sessions in %.2f s' % (sessions, time.perf_counter() - start))
+    stats.flush()
+
+    start = time.perf_counter()
+    players = stats.player_summary()
+    player_time = time.perf_counter() - start
+    start = time.perf_counter()
+    per_session = stats.session_summary()
+    session_time = time.perf_counter() - start
+    start = time.perf_counter()
+    speeds = stats.column('speed')
+    good_speed = float(speeds[stats.column('good') == 1].mean()) if len(speeds) else 0.0
+    column_time = time.perf_counter() - start
+
+    print('%d hits in %d sessions' % (stats.rows, stats.sessions))
+    for player in range(stats.players):
+        print('player %d: %d hits, %.0f%% good, speed mean %.0f max %.0f, %.1f ms from the beat on average' %
+              (player, players['hits'][player], players['good_ratio'][player] * 100, players['mean_speed'][player],
+               players['max_speed'][player], players['mean_timing_ms'][player]))
+    print('mean speed of good hits %.1f' % good_speed)
+    print('queries: players %.3f ms, sessions %.3f ms, column scan %.3f ms' %
+          (player_time * 1000, session_time * 1000, column_time * 1000))
+    stats.close()
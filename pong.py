@@ -139,13 +139,15 @@ class Pong:
         self.space_pressed = False
         self.c_pressed = False
 
+        self.game_over = False  # Set when a ball leaves the field
+
     def check_ball_hits_wall(self):
         for ball in self.balls:
             if ball.x > self.WIDTH or ball.x < 0:
-                sys.exit(1)
+                self.game_over = True
 
             if ball.y > self.HEIGHT - self.BALL_WIDTH or ball.y < 0:
-                sys.exit(1)
+                self.game_over = True
                 # ball.angle = -ball.angle
 
     def check_ball_hits_paddle(self):
@@ -196,69 +198,103 @@ class Pong:
                 self.light_up_left = 0
             return False
 
-    def game_loop(self):
-        while True:
+    def poll_events(self):
+        for event in pygame.event.get():
+            # Add some extra ways to exit the game.
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                return False
+        return True
+
+    # Control circle speed
+    def check_circle_keys(self):
+        if not self.space_pressed and pygame.key.get_pressed()[pygame.K_SPACE]:
+            self.CIRCLE_SPEED = self.CIRCLE_SPEED * self.CIRCLE_SPEED_UP
+            self.space_pressed = True
+        elif self.space_pressed and not pygame.key.get_pressed()[pygame.K_SPACE]:
+            self.space_pressed = False
+
+        if not self.c_pressed and pygame.key.get_pressed()[pygame.K_c]:
+            self.CIRCLE_SPEED = self.CIRCLE_SPEED / self.CIRCLE_SPEED_UP
+            self.c_pressed = True
+        elif self.c_pressed and not pygame.key.get_pressed()[pygame.K_c]:
+            self.c_pressed = False
+
+    def draw_light_up(self):
+        if self.light_up_right:
+            pygame.draw.rect(self.screen, self.light_up_colour_right, self.light_up_rect_right)
+        if self.light_up_left:
+            pygame.draw.rect(self.screen, self.light_up_colour_left, self.light_up_rect_left)
+
+    # The circles of a paddle are drawn where it was before it moves, the paddle where it moved to
+    def draw_players(self):
+        # Determine new size circle around player
+        if self.circle_size < self.CIRCLE_MIN_SIZE or self.circle_size > self.CIRCLE_MAX_SIZE:
+            self.circle_direction = -self.circle_direction
+        self.circle_size += self.circle_direction * self.CIRCLE_SPEED
+
+        for paddle in self.paddles:
+            self.draw_circles(paddle)
+
+            # Update and draw players
+            self.move_paddle(paddle)
+            pygame.draw.rect(self.screen, self.COLOUR, paddle)
+
+    # Draw circles around a player
+    def draw_circles(self, paddle):
+        pygame.draw.circle(self.screen, (26, 235, 235),
+                           (paddle.x + int(0.5 * self.PADDLE_WIDTH), paddle.y + int(0.5 * self.PADDLE_WIDTH)),
+                           40)
+        pygame.draw.circle(self.screen, (26, 235, 235),
+                           (paddle.x + int(0.5 * self.PADDLE_WIDTH), paddle.y + int(0.5 * self.PADDLE_WIDTH)),
+                           int(self.circle_size), 8)
+
+    def draw_balls(self):
+        for ball in self.balls:
+            pygame.draw.rect(self.screen, self.COLOUR, ball)
 
-            for event in pygame.event.get():
-                # Add some extra ways to exit the game.
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                    return
-            self.check_ball_hits_paddle()
-
-            self.check_ball_hits_wall()
-
-            # Redraw the screen.
-            self.screen.fill((0, 0, 0))
-
-            # Control circle speed
-            if not self.space_pressed and pygame.key.get_pressed()[pygame.K_SPACE]:
-                self.CIRCLE_SPEED = self.CIRCLE_SPEED * self.CIRCLE_SPEED_UP
-                self.space_pressed = True
-            elif self.space_pressed and not pygame.key.get_pressed()[pygame.K_SPACE]:
-                self.space_pressed = False
-
-            if not self.c_pressed and pygame.key.get_pressed()[pygame.K_c]:
-                self.CIRCLE_SPEED = self.CIRCLE_SPEED / self.CIRCLE_SPEED_UP
-                self.c_pressed = True
-            elif self.c_pressed and not pygame.key.get_pressed()[pygame.K_c]:
-                self.c_pressed = False
-
-            # Update lit up sides
-            self.adjust_light_up()
-            if self.light_up_right:
-                pygame.draw.rect(self.screen, self.light_up_colour_right, self.light_up_rect_right)
-            if self.light_up_left:
-                pygame.draw.rect(self.screen, self.light_up_colour_left, self.light_up_rect_left)
-
-            # Determine new size circle around player
-            if self.circle_size < self.CIRCLE_MIN_SIZE or self.circle_size > self.CIRCLE_MAX_SIZE:
-                self.circle_direction = -self.circle_direction
-            self.circle_size += self.circle_direction * self.CIRCLE_SPEED
+    def move_paddle(self, paddle):
+        paddle.move_paddle(self.HEIGHT, self.WIDTH)
 
-            for paddle in self.paddles:
-                # Draw circles around players
-                pygame.draw.circle(self.screen, (26, 235, 235),
-                                   (paddle.x + int(0.5 * self.PADDLE_WIDTH), paddle.y + int(0.5 * self.PADDLE_WIDTH)),
-                                   40)
-                pygame.draw.circle(self.screen, (26, 235, 235),
-                                   (paddle.x + int(0.5 * self.PADDLE_WIDTH), paddle.y + int(0.5 * self.PADDLE_WIDTH)),
-                                   int(self.circle_size), 8)
-
-                # Update and draw players
-                paddle.move_paddle(self.HEIGHT, self.WIDTH)
-                pygame.draw.rect(self.screen, self.COLOUR, paddle)
-
-            # We know we're not ending the game so lets move the ball here.
-            for ball in self.balls:
-                ball.move_ball()
-                pygame.draw.rect(self.screen, self.COLOUR, ball)
-
-            pygame.draw.rect(self.screen, self.COLOUR, self.central_line)
-
-            pygame.display.flip()
+    def move_balls(self):
+        # We know we're not ending the game so lets move the ball here.
+        for ball in self.balls:
+            ball.move_ball()
+
+    # One frame of the game, without waiting for the next one
+    def frame(self):
+        self.check_ball_hits_paddle()
+
+        self.check_ball_hits_wall()
+        if self.game_over:
+            return
+
+        # Redraw the screen.
+        self.screen.fill((0, 0, 0))
+
+        self.check_circle_keys()
+
+        # Update lit up sides
+        self.adjust_light_up()
+        self.draw_light_up()
+
+        self.draw_players()
+        self.move_balls()
+        self.draw_balls()
+        pygame.draw.rect(self.screen, self.COLOUR, self.central_line)
+
+        pygame.display.flip()
+
+    # Play until a ball leaves the field, returns True, or ESC is pressed, returns False
+    def game_loop(self):
+        while True:
+            if not self.poll_events():
+                return False
+            self.frame()
+            if self.game_over:
+                return True
             self.clock.tick(60)
 
 
 if __name__ == '__main__':
     pong = Pong()
-    pong.game_loop()
\ No newline at end of file
+    sys.exit(1 if pong.game_loop() else 0)
\ No newline at end of file
@@ -1,98 +1,112 @@
-import sys
-import pygame
-import random
-import numpy as np
-
-
-class Paddle(pygame.Rect):
-    def __init__(self, velocity, up_key, down_key, left_key, right_key, *args, **kwargs):
-        self.velocity = velocity
-        self.up_key = up_key
-        self.down_key = down_key
-        self.left_key = left_key
-        self.right_key = right_key
-        super().__init__(*args, **kwargs)
-
-    def move_paddle(self, board_height, board_width):
-        keys_pressed = pygame.key.get_pressed()
-
-        if keys_pressed[self.up_key]:
-            if self.y - self.velocity > 0:
-                self.y -= self.velocity
-
-        if keys_pressed[self.down_key]:
-            if self.y + self.velocity < board_height - self.height:
-                self.y += self.velocity
-
-        if keys_pressed[self.left_key]:
-            if self.x + self.velocity > 0:
-                self.x -= self.velocity
-
-        if keys_pressed[self.right_key]:
-            if self.x + self.velocity < board_width - self.width:
-                self.x += self.velocity
-
+import time
 
-class Ball(pygame.Rect):
-    def __init__(self, velocity, *args, **kwargs):
-        self.velocity = velocity
-        self.angle = 0
-        super().__init__(*args, **kwargs)
+STARTED = time.perf_counter()  # Start of the startup report, before anything else is imported
 
-    def move_ball(self):
-        self.x += self.velocity
-        self.y += round(self.angle)
-
-    def change_velocity_ball(self, multiplier):
-        self.velocity = self.velocity * multiplier
-
-
-class Bar(pygame.Rect):
-    def __init__(self, velocity, *args, **kwargs):
-        self.velocity = velocity
-        self.angle = 1
-        super().__init__(*args, **kwargs)
-
-    def move_bar(self):
-        self.x += self.angle * self.velocity
+import sys
+import math
+import threading
+import pygame
+from simulation import Simulation
+from text_cache import SpeedTextCache, load_font
+from sprites import CircleSprites
+from beat_analysis import load_beat_grid
 
+# The modules of the optional features (LED output, framebuffer, export, statistics, sensors,
+# spectators, profiler and recording) are only imported when the feature is turned on
 
-class Pong:
-    BPM = 120       # Beats per minute
-    BPS = BPM/60
-    BPF = BPS/60
-    FPB = 1/BPF
-    good_timing = [27, 28, 29, 30, 0, 1, 2, 3, 12, 13, 14, 15, 16, 17, 18] # Frame which are counted as good
-    frame = -2
-    
-    HEIGHT = 600
-    WIDTH = 1200
+IMPORTED = time.perf_counter()
 
-    PADDLE_WIDTH = 50
-    PADDLE_HEIGHT = 50
-    PADDLE_VELOCITY = 8
-    BALL_WIDTH = 10
-    BALL_VELOCITY = 5
-    BALL_ANGLE = 0
 
-    BAR_SPEED = 5
-    BAR_X = 0
+# Open the window. There is one window per process, other courts draw to a Surface.
+# Only the display is started, pygame.init() would also open the sound device and look for joysticks;
+# the sound is started when the music is loaded.
+def open_display(width, height):
+    pygame.display.init()
+    return pygame.display.set_mode((width, height))
 
-    CIRCLE_SPEED = 2
-    CIRCLE_MAX_SIZE = 70
-    CIRCLE_MIN_SIZE = 50
-    CIRCLE_SPEED_UP = 1.5  # Change in speed when pressing space; speed = CIRCLE_SPEED_UP * speed
 
+# Draws a Simulation to a pygame window and feeds it keyboard input
+class Pong(Simulation):
     COLOUR = (255, 255, 255)
 
-    FADE = 10  # Adjust to change fade out speed, higher is faster
-    RATIO_GOOD = 4  # RATIO_GOOD times more likely to pass a good ball than a bad ball
-
-    def __init__(self):
-        pygame.init()  # Start the pygame instance.
-
-        # Setup the screen
-        self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT))
+    MAX_FRAME_TIME = 0.25  # Longest real time simulated per frame, so a stall does not cause a burst of ticks
+
+    CIRCLE_COLOUR = (26, 235, 235)
+    CIRCLE_WIDTH = 8
+    PLAYER_CIRCLE_SIZE = 40
+
+    SPEED_TEXT_CACHE_SIZE = 64  # Rendered speed numbers kept in memory
+
+    TRACK = "Epoch.mp3"  # Analyse it with beat_analysis.py to judge hits against its real beats instead of BPM
+
+    REPLAY_FILE = None  # Record the session to this file, play it back with replay.py
+    STATS_PATH = None  # Add every hit to the statistics in this directory, see match_stats.py
+
+    DIRTY_RECTS = False  # Only push the parts of the screen that changed instead of flipping the whole screen
+    FRAMEBUFFER = False  # Draw into a NumPy array with framebuffer.FramebufferRenderer instead of with pygame.draw
+
+    LED_ADDRESS = None  # (host, port) of the LED controller, frames are only sent when set
+    LED_PROTOCOL = 'udp'
+    LED_COLUMNS = 120
+    LED_ROWS = 60
+
+    EXPORT_PATH = None  # Record every frame shown to this file or directory, see frame_export.py
+    EXPORT_FORMAT = 'raw'
+    EXPORT_SLOTS = 8  # Frames that can wait for the writer before frames are dropped
+
+    SENSOR_ADDRESS = None  # (host, port) to receive tracked player positions on, the paddles follow them when set
+
+    SPECTATOR_ADDRESS = None  # (host, port) to serve the game state to spectator displays on, see spectator.py
+
+    CHECKPOINT_NAME = None  # Save the court to this shared memory block for a standby process, see checkpoint.py
+    CHECKPOINT_INTERVAL = 1  # Ticks between checkpoints
+
+    AUDIO_REACTIVE = False  # Pulse the rings and colour the lit up sides with the music, see audio_reactive.py
+    AUDIO_BRIGHTNESS_FLOOR = 0.5  # A lit up side is dimmed to this when its bands are quiet
+    AUDIO_KICK_DECAY = 0.85  # Per frame, how fast the jump of the rings and the flash after an onset fade
+
+    SPEED_FONT = 'Yu Gothic UI Semibold'
+    STARTUP_REPORT = False  # Print how long each part of starting up took when the first frame is shown
+
+    PROFILE = False  # Time every phase of a frame, see profiler.py
+    PROFILE_OVERLAY = False  # Show the frame timings on screen
+    PROFILE_TRACE = None  # Write the timings of every frame to this CSV file
+    PROFILE_OVERLAY_INTERVAL = 30  # Frames between updates of the overlay
+    PROFILED_PHASES = ['poll_events', 'check_ball_hits_paddle', 'check_ball_hits_wall', 'adjust_light_up',
+                       'update_visuals', 'draw_field', 'draw_court_side', 'draw_speed_text', 'draw_players',
+                       'update_display', 'wait_for_next_frame']
+
+    # screen is the surface the court is drawn on, the window is opened when it is not given
+    def __init__(self, seed=None, screen=None):
+        # Seconds taken by each part of starting up, in order, see startup_report()
+        self.startup_times = {'imports': IMPORTED - STARTED}
+        self.startup_mark = time.perf_counter()
+        self.first_frame_shown = False
+
+        super().__init__(seed)
+        self.mark_startup('simulation')
+
+        beat_grid = load_beat_grid(self.TRACK)
+        if beat_grid is not None:
+            self.beat_clock = beat_grid.beat_clock(self.GOOD_BEAT_PHASES, self.GOOD_TIMING_MS)
+        self.mark_startup('beat grid')
+
+        # Setup the screen. When the window is opened here the music is loaded on another thread
+        # while the rest is set up, start_music() waits for it. SDL subsystems are not thread safe,
+        # so the mixer is started on this thread and only the file is loaded on the other one.
+        self.music_loader = None
+        self.music_error = None
+        self.song_position = 0.0  # Seconds into the track the music starts at, later when taking over a court
+        if screen is None:
+            screen = open_display(self.WIDTH, self.HEIGHT)
+            self.mark_startup('display')
+            self.init_mixer()
+            self.mark_startup('mixer')
+            if self.music_error is None:
+                self.music_loader = threading.Thread(target=self.load_music, daemon=True)
+                self.music_loader.start()
+        pygame.font.init()
+        self.screen = screen
         self.clock = pygame.time.Clock()
 
         # Setup the field
@@ -104,247 +118,474 @@ class Pong:
         self.top_line = pygame.Rect(0, self.HEIGHT - 5, self.WIDTH, 5)
         self.bottom_line = pygame.Rect(0, 0, self.WIDTH, 5)
 
-        # Pointers around players
-        self.circle_size = self.CIRCLE_MIN_SIZE
-        self.circle_direction = 1
-
-        # Create the player objects.
-        self.paddles = []
-        self.balls = []
-        self.paddles.append(Paddle(  # The left paddle
-            self.PADDLE_VELOCITY,
-            pygame.K_w,
-            pygame.K_s,
-            pygame.K_a,
-            pygame.K_d,
-            100,
-            self.HEIGHT / 2 - self.PADDLE_HEIGHT / 2,
-            self.PADDLE_WIDTH,
-            self.PADDLE_HEIGHT
-        ))
-
-        self.paddles.append(Paddle(  # The right paddle
-            self.PADDLE_VELOCITY,
-            pygame.K_UP,
-            pygame.K_DOWN,
-            pygame.K_LEFT,
-            pygame.K_RIGHT,
-
-            self.WIDTH - self.PADDLE_WIDTH - 100,
-            self.HEIGHT / 2 - self.PADDLE_HEIGHT / 2,
-            self.PADDLE_WIDTH,
-            self.PADDLE_HEIGHT
-        ))
-
-        self.balls.append(Ball(
-            self.BALL_VELOCITY,
-            self.WIDTH / 2 - self.BALL_WIDTH / 2,
-            self.HEIGHT / 2 - self.BALL_WIDTH / 2,
-            self.BALL_WIDTH,
-            self.BALL_WIDTH
-        ))
-
-        # For lighting up right side of the field
-        self.light_up_right = 0
-        self.light_up_colour_right = (255, 255, 255)
-        self.fade_colour_right = (self.FADE, self.FADE, self.FADE)
+        # Lit up halves of the field
         self.light_up_rect_right = pygame.Rect(self.WIDTH / 2, 0, self.WIDTH / 2, self.HEIGHT)
-
-        # For lighting up left side of the field
-        self.light_up_left = 0
-        self.light_up_colour_left = (255, 0, 0)
-        self.fade_colour_left = (self.FADE, 0, 0)
         self.light_up_rect_left = pygame.Rect(0, 0, self.WIDTH / 2, self.HEIGHT)
 
-        # Keys for adjusting speed, helps to only apply once, not continuously
-        self.space_pressed = False
-        self.c_pressed = False
-
         # Text speed
-        self.speed_font = pygame.font.SysFont('Yu Gothic UI Semibold', 250)
-        self.speed_text_surface_left = self.speed_font.render('78', False, (255, 255, 255))
-        self.speed_text_surface_left = pygame.transform.rotate(self.speed_text_surface_left, 90)
+        self.speed_font = load_font(self.SPEED_FONT, 250)
+        self.mark_startup('font')
+        self.speed_text_cache = SpeedTextCache(self.speed_font, self.SPEED_TEXT_CACHE_SIZE)
+        self.speed_text_surface_left = self.speed_text_cache.get(self.speed_left, (255, 255, 255), 90)
         (self.width_speed_text, self.height_speed_text) = self.speed_text_surface_left.get_size()
 
-        self.speed_text_surface_right = self.speed_font.render('75', False, (255, 255, 255))
-        self.speed_text_surface_right = pygame.transform.rotate(self.speed_text_surface_right, -90)
-
-        self.speed_multiplier_for_text = 1
-
-    def check_ball_hits_wall(self):
+        self.speed_text_surface_right = self.speed_text_cache.get(self.speed_right, (255, 255, 255), -90)
+        self.speed_text_cache.warm_in_background(self.speed_text_keys())
+        self.mark_startup('speed text')
+
+        # Circles around players, every ring size the pulse can reach is drawn up front
+        self.player_circles = CircleSprites(self.CIRCLE_COLOUR)
+        self.player_circles.warm([self.PLAYER_CIRCLE_SIZE])
+        self.ring_circles = CircleSprites(self.CIRCLE_COLOUR, self.CIRCLE_WIDTH)
+        self.ring_circles.warm(range(int(self.CIRCLE_MIN_SIZE - self.CIRCLE_SPEED),
+                                     int(self.CIRCLE_MAX_SIZE + self.CIRCLE_SPEED) + 1))
+        self.mark_startup('sprites')
+
+        # Static field lines, black is transparent so they can be put over the lit up sides
+        self.field_lines = pygame.Surface((self.WIDTH, self.HEIGHT))
+        self.field_lines.set_colorkey((0, 0, 0))
+        for line in (self.central_line, self.left_third_line, self.right_third_line, self.left_line,
+                     self.right_line, self.top_line, self.bottom_line):
+            pygame.draw.rect(self.field_lines, self.COLOUR, line)
+
+        # Everything but the players and balls, only redrawn for the side that changed
+        self.court = pygame.Surface((self.WIDTH, self.HEIGHT))
+        self.court_state_left = None
+        self.court_state_right = None
+        self.player_rects = []  # Where players and balls were drawn last frame
+
+        self.pixels_pushed = 0  # Pixels sent to the display last frame
+        self.mark_startup('court')
+
+        self.led_sink = None
+        if self.LED_ADDRESS is not None:
+            from led_output import LedSink
+            self.led_sink = LedSink(self.LED_ADDRESS, self.LED_COLUMNS, self.LED_ROWS, self.LED_PROTOCOL)
+
+        # The LED frames are drawn at the LED size straight away
+        self.renderer = None
+        self.led_renderer = None
+        if self.FRAMEBUFFER:
+            from framebuffer import FramebufferRenderer
+            self.renderer = FramebufferRenderer(self)
+            self.renderer.texts = self.speed_texts
+            if self.led_sink is not None:
+                self.led_renderer = FramebufferRenderer(self, self.LED_COLUMNS, self.LED_ROWS)
+                self.led_renderer.texts = self.speed_texts
+
+        if self.STATS_PATH is not None:
+            from match_stats import MatchStats
+            MatchStats(self.STATS_PATH).attach(self)
+
+        # Frames are copied as whole 32-bit pixels, from the framebuffer or the screen
+        self.exporter = None
+        if self.EXPORT_PATH is not None:
+            from frame_export import FrameExporter, surface_order
+            if self.renderer is not None:
+                self.exporter = FrameExporter(self.EXPORT_PATH, self.WIDTH, self.HEIGHT, self.EXPORT_FORMAT,
+                                              self.EXPORT_SLOTS, channels=4)
+            else:
+                self.exporter = FrameExporter(self.EXPORT_PATH, self.WIDTH, self.HEIGHT, self.EXPORT_FORMAT,
+                                              self.EXPORT_SLOTS, channels=self.screen.get_bytesize(),
+                                              order=surface_order(self.screen))
+
+        self.sensor_input = None
+        if self.SENSOR_ADDRESS is not None:
+            from sensors import SensorInput, SensorController
+            self.sensor_input = SensorInput(len(self.paddles), self.SENSOR_ADDRESS)
+            for player, paddle in enumerate(self.paddles):
+                paddle.controller = SensorController(self.sensor_input, player)
+
+        if self.SPECTATOR_ADDRESS is not None:
+            from spectator import SpectatorFeed
+            SpectatorFeed(self.SPECTATOR_ADDRESS).attach(self)
+
+        # Started together with the music
+        self.audio = None
+        self.audio_onsets_seen = None
+        self.ring_kick = 0.0
+        self.light_flash = 0.0
+        self.audio_ring_size = None  # Ring size and channel scales of the last update_visuals(), None without music
+        self.audio_scales = None
+
+        # Replace the profiled methods by timed versions
+        self.profiler = None
+        self.profile_overlay = None
+        if self.PROFILE:
+            from profiler import FrameProfiler
+            self.profiler = FrameProfiler(self.PROFILED_PHASES, trace_path=self.PROFILE_TRACE)
+            for name in self.PROFILED_PHASES:
+                setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+            self.profile_font = pygame.font.Font(None, 20)
+        self.mark_startup('features')
+
+    # Add the time since the last mark to the startup report under phase
+    def mark_startup(self, phase):
+        now = time.perf_counter()
+        self.startup_times[phase] = self.startup_times.get(phase, 0.0) + now - self.startup_mark
+        self.startup_mark = now
+
+    # Lines of the startup report: every phase in milliseconds and the time from the start of the process
+    # (the import of this module) to the first frame. The music is loaded at the same time as the phases
+    # after 'display', only 'waiting for music' adds to the total.
+    def startup_report(self):
+        lines = ['%-20s %8.1f ms' % (phase, seconds * 1000) for phase, seconds in list(self.startup_times.items())]
+        lines.append('%-20s %8.1f ms' % ('first frame after', (self.startup_mark - STARTED) * 1000))
+        return lines
+
+    # The speed texts update_speed_left() and update_speed_right() are most likely to show next at the
+    # current ball speeds. The ball moves a whole number of pixels up or down, the angles closest to the
+    # current angle of a ball come first. At most SPEED_TEXT_CACHE_SIZE - 2 of them, so warming up never
+    # throws out the two texts shown now or what it rendered itself.
+    def speed_text_keys(self):
+        candidates = []
         for ball in self.balls:
-            if ball.x > self.WIDTH or ball.x < 0:
-                sys.exit(1)
-
-            if ball.y > self.HEIGHT - self.BALL_WIDTH or ball.y < 0:
-                sys.exit(1)
-                # ball.angle = -ball.angle
+            velocity = abs(ball.velocity)
+            steepest = int((self.ANGLE_POSITION + self.ANGLE_RANDOM / 2) * velocity) + 1
+            current = min(round(abs(ball.angle)), steepest)
+            candidates.extend((abs(angle - current), int(math.hypot(velocity, angle) * self.SPEED_SCALE))
+                              for angle in range(steepest + 1))
+        values = []
+        seen = set()
+        for _, value in sorted(candidates):
+            if value not in seen:
+                seen.add(value)
+                values.append(value)
+                if len(values) == self.SPEED_TEXT_CACHE_SIZE - 2:
+                    break
+        return [(value, (255, 255, 255), 90) for value in values]
+
+    def update_speed_left(self, ball):
+        super().update_speed_left(ball)
+        self.speed_text_surface_left = self.speed_text_cache.get(self.speed_left, (255, 255, 255), 90)
+
+    def update_speed_right(self, ball):
+        super().update_speed_right(ball)
+        self.speed_text_surface_right = self.speed_text_cache.get(self.speed_right, (255, 255, 255), 90)
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.speed_text_surface_left = self.speed_text_cache.get(self.speed_left, (255, 255, 255), 90)
+        self.speed_text_surface_right = self.speed_text_cache.get(self.speed_right, (255, 255, 255), 90)
+
+    def check_speed_keys(self, keys_pressed):
+        multiplier = self.speed_multiplier_for_text
+        super().check_speed_keys(keys_pressed)
+        if self.speed_multiplier_for_text != multiplier:
+            self.speed_text_cache.warm_in_background(self.speed_text_keys())
+
+    # Follow the latest analysis of the music with AUDIO_REACTIVE, once per frame shown: the rings grow with
+    # the bass and jump out on a bass onset, the colour channels of a lit up side are dimmed by the energy of
+    # a band (red bass, green mid, blue high) and flash to full brightness on a mid or high onset. Only what
+    # is shown changes, the game plays the same. Raises why the track could not be analysed, like
+    # start_music() when it cannot be played.
+    def update_visuals(self):
+        if self.audio is None:
+            return
+        if self.audio.error is not None:
+            raise self.audio.error
+
+        snapshot = self.audio.snapshot
+        seen = self.audio_onsets_seen or snapshot.onsets
+        self.audio_onsets_seen = snapshot.onsets
+        bass_onset, mid_onset, high_onset = [count != before for count, before in zip(snapshot.onsets, seen)]
+        self.ring_kick = 1.0 if bass_onset else self.ring_kick * self.AUDIO_KICK_DECAY
+        self.light_flash = 1.0 if mid_onset or high_onset else self.light_flash * self.AUDIO_KICK_DECAY
+
+        self.audio_ring_size = self.CIRCLE_MIN_SIZE + (self.CIRCLE_MAX_SIZE - self.CIRCLE_MIN_SIZE) * \
+            max(snapshot.energies[0], self.ring_kick)
+        floor = self.AUDIO_BRIGHTNESS_FLOOR
+        self.audio_scales = [floor + (1 - floor) * max(energy, self.light_flash) for energy in snapshot.energies]
+
+    # Ring size and colours of the lit up sides drawn now, by draw(), draw_dirty() and FramebufferRenderer.
+    # Without music they are the ones of the simulation.
+    @property
+    def shown_circle_size(self):
+        return self.circle_size if self.audio_ring_size is None else self.audio_ring_size
+
+    @property
+    def shown_colour_left(self):
+        return self.shown_colour(self.light_up_colour_left)
+
+    @property
+    def shown_colour_right(self):
+        return self.shown_colour(self.light_up_colour_right)
+
+    def shown_colour(self, colour):
+        if self.audio_scales is None:
+            return colour
+        return tuple(int(channel * scale) for channel, scale in zip(colour, self.audio_scales))
+
+    def draw(self):
+        self.draw_field()
+
+        # Project text
+        self.draw_speed_text(self.screen)
+
+        self.draw_players(self.screen)
+
+    def draw_field(self):
+        # Redraw the screen
+        self.screen.fill((0, 0, 0))
+
+        # Lit up sides
+        if self.light_up_right:
+            pygame.draw.rect(self.screen, self.shown_colour_right, self.light_up_rect_right)
+        if self.light_up_left:
+            pygame.draw.rect(self.screen, self.shown_colour_left, self.light_up_rect_left)
+
+        # Draw field
+        pygame.draw.rect(self.screen, self.COLOUR, self.central_line)
+        pygame.draw.rect(self.screen, self.COLOUR, self.left_third_line)
+        pygame.draw.rect(self.screen, self.COLOUR, self.right_third_line)
+        pygame.draw.rect(self.screen, self.COLOUR, self.left_line)
+        pygame.draw.rect(self.screen, self.COLOUR, self.right_line)
+        pygame.draw.rect(self.screen, self.COLOUR, self.top_line)
+        pygame.draw.rect(self.screen, self.COLOUR, self.bottom_line)
+
+    # Speed text surfaces and the centre of the court they are drawn around
+    def speed_texts(self):
+        return [(self.speed_text_surface_left, (self.WIDTH / 6, self.HEIGHT / 2)),
+                (self.speed_text_surface_right, (5 * self.WIDTH / 6, self.HEIGHT / 2))]
+
+    def draw_speed_text(self, surface):
+        for text, (x, y) in self.speed_texts():
+            width, height = text.get_size()
+            surface.blit(text, (x - width / 2, y - height / 2))
+
+    # Draw circles, players and balls, returns the rects that were drawn on
+    def draw_players(self, surface):
+        rects = []
+        radius = int(self.shown_circle_size)
+        for paddle in self.paddles:
+            # Draw circles around players
+            centre = (paddle.x + int(0.5 * self.PADDLE_WIDTH), paddle.y + int(0.5 * self.PADDLE_WIDTH))
+            rects.append(self.player_circles.draw(surface, centre, self.PLAYER_CIRCLE_SIZE))
+            rects.append(self.ring_circles.draw(surface, centre, radius))
+
+            # Draw players
+            rects.append(pygame.draw.rect(surface, self.COLOUR, paddle))
 
-    def check_ball_hits_paddle(self):
         for ball in self.balls:
-            for paddle in self.paddles:
-                if ball.colliderect(paddle):
-                    ball.velocity = -ball.velocity
-                    ball.x += ball.velocity * 10
-                    paddle.x -= ball.velocity * 10
-                    ball.angle = (((self.HEIGHT / 2 - ball.y) / (self.HEIGHT / 2)) + (np.random.random() - 0.5)) * abs(
-                        ball.velocity)
-
-                    if round(self.frame % self.FPB) in self.good_timing:
-                        if ball.x > self.WIDTH / 2 and not self.light_up_right:
-                            self.start_light_up_right(True)
-                            self.update_speed_left()
-                        elif not self.light_up_left:
-                            self.start_light_up_left(True)
-                            self.update_speed_right()
-                        break
-                    else:
-                        if ball.x > self.WIDTH / 2 and not self.light_up_right:
-                            self.start_light_up_right(False)
-                            self.update_speed_left()
-                        elif not self.light_up_left:
-                            self.start_light_up_left(False)
-                            self.update_speed_right()
-                        break
-
-
-    # Start to light up right side of the field
-    def start_light_up_right(self, good):
-        self.light_up_right = 1
-        if good:
-            self.light_up_colour_right = (255, 255, 255)
-            self.fade_colour_right = (self.FADE, self.FADE, self.FADE)
+            rects.append(pygame.draw.rect(surface, self.COLOUR, ball))
+        return rects
+
+    # Redraw one side of the court surface: lit up colour, field lines and speed text
+    def draw_court_side(self, rect, colour):
+        self.court.set_clip(rect)
+        self.court.fill(colour, rect)
+        self.court.blit(self.field_lines, rect, rect)
+        self.draw_speed_text(self.court)
+        self.court.set_clip(None)
+        self.screen.blit(self.court, rect, rect)
+
+    # Same picture as draw(), but only redraws what changed. Returns the rects that need to be pushed.
+    def draw_dirty(self):
+        dirty = []
+
+        # A side changes when it is lit up, fades or gets a new speed text
+        state_left = (self.shown_colour_left if self.light_up_left else None, self.speed_text_surface_left)
+        if state_left != self.court_state_left:
+            self.court_state_left = state_left
+            self.draw_court_side(self.light_up_rect_left, state_left[0] or (0, 0, 0))
+            dirty.append(self.light_up_rect_left)
+
+        state_right = (self.shown_colour_right if self.light_up_right else None, self.speed_text_surface_right)
+        if state_right != self.court_state_right:
+            self.court_state_right = state_right
+            self.draw_court_side(self.light_up_rect_right, state_right[0] or (0, 0, 0))
+            dirty.append(self.light_up_rect_right)
+
+        # Erase players and balls where they were last frame and draw them at their new place
+        for rect in self.player_rects:
+            self.screen.blit(self.court, rect, rect)
+        rects = self.draw_players(self.screen)
+        dirty.extend(self.player_rects)
+        dirty.extend(rects)
+        self.player_rects = rects
+        return dirty
+
+    def present(self):
+        if not self.first_frame_shown:
+            self.startup_mark = time.perf_counter()
+        self.update_visuals()
+        if self.renderer is not None:
+            frame = self.renderer.render()
+            pygame.surfarray.blit_array(self.screen, frame.swapaxes(0, 1))
+            if self.profiler is not None and self.PROFILE_OVERLAY:
+                self.draw_profile_overlay()
+            self.update_display()
+            self.pixels_pushed = self.WIDTH * self.HEIGHT
+        elif self.DIRTY_RECTS:
+            rects = self.draw_dirty()
+            if self.profiler is not None and self.PROFILE_OVERLAY:
+                rects.append(self.draw_profile_overlay())
+            self.update_display(rects)
+            self.pixels_pushed = sum(rect.width * rect.height for rect in rects)
         else:
-            self.light_up_colour_right = (255, 0, 0)
-            self.fade_colour_right = (self.FADE, 0, 0)
-
-    # Start to light up left side of the field
-    def start_light_up_left(self, good):
-        self.light_up_left = 1
-        if good:
-            self.light_up_colour_left = (255, 255, 255)
-            self.fade_colour_left = (self.FADE, self.FADE, self.FADE)
+            self.draw()
+            if self.profiler is not None and self.PROFILE_OVERLAY:
+                self.draw_profile_overlay()
+            self.update_display()
+            self.pixels_pushed = self.WIDTH * self.HEIGHT
+
+        if self.exporter is not None:
+            if self.renderer is not None:
+                self.exporter.submit(self.renderer.rgbx)
+            else:
+                self.exporter.submit_surface(self.screen)
+
+        if self.led_renderer is not None:
+            self.led_sink.submit_array(self.led_renderer.render())
+        elif self.led_sink is not None:
+            self.led_sink.submit(self.screen)
+
+        if not self.first_frame_shown:
+            self.first_frame_shown = True
+            self.mark_startup('first frame')
+            if self.STARTUP_REPORT:
+                print('\n'.join(self.startup_report()))
+
+    def update_display(self, rects=None):
+        if self.screen is not pygame.display.get_surface():
+            return  # Drawn off screen, e.g. only for the LED output
+        if rects is None:
+            pygame.display.flip()
         else:
-            self.light_up_colour_left = (255, 0, 0)
-            self.fade_colour_left = (self.FADE, 0, 0)
-
-
-    # Update lit up sides of the field
-    def adjust_light_up(self):
-        if self.light_up_right:
-            self.light_up_colour_right = \
-                tuple(x1 - x2 for x1, x2 in zip(self.light_up_colour_right, self.fade_colour_right))
-            if self.light_up_colour_right[0] < 0:
-                self.light_up_right = 0
-            return False
-        if self.light_up_left:
-            self.light_up_colour_left = \
-                tuple(x1 - x2 for x1, x2 in zip(self.light_up_colour_left, self.fade_colour_left))
-            if self.light_up_colour_left[0] < 0:
-                self.light_up_left = 0
+            pygame.display.update(rects)
+
+    # Frame timings in the top left corner, only rendered again every PROFILE_OVERLAY_INTERVAL frames
+    def draw_profile_overlay(self):
+        if self.profile_overlay is None or self.profiler.frames % self.PROFILE_OVERLAY_INTERVAL == 0:
+            lines = [self.profile_font.render(line, True, (255, 255, 0)) for line in self.profiler.summary()]
+            height = max(len(lines), len(self.PROFILED_PHASES) + 2) * self.profile_font.get_linesize()
+            self.profile_overlay = pygame.Surface((330, height + 10))
+            for index, line in enumerate(lines):
+                self.profile_overlay.blit(line, (5, 5 + index * self.profile_font.get_linesize()))
+        return self.screen.blit(self.profile_overlay, (10, 10))
+
+    def poll_events(self):
+        for event in pygame.event.get():
+            # Add some extra ways to exit the game.
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                return False
+        return True
+
+    # Wait until it is time for the next frame, returns the real time since the last frame in seconds
+    def wait_for_next_frame(self):
+        return self.clock.tick(60) / 1000
+
+    # Position in the song from a monotonic clock started together with the music, so hits are
+    # judged correctly whatever the frame rate. Ticks that catch up on a slow frame are placed
+    # back in time by the game time that is still left to simulate.
+    def audio_time(self):
+        return time.perf_counter() - self.song_start - max(self.accumulator - self.TICK, 0)
+
+    # Write out the recording and trace of the session
+    def end_session(self):
+        if self.led_sink is not None:
+            self.led_sink.close()
+        if self.sensor_input is not None:
+            self.sensor_input.close()
+        if self.exporter is not None:
+            self.exporter.close()
+        if self.stats is not None:
+            self.stats.close()
+        if self.spectators is not None:
+            self.spectators.close()
+        if self.audio is not None:
+            self.audio.close()
+        if self.checkpoints is not None:
+            self.checkpoints.close()
+        if self.recorder is not None:
+            self.recorder.save(self.REPLAY_FILE)
+        if self.profiler is not None:
+            self.profiler.close()
+        if self.audio is not None and self.audio.error is not None:
+            raise self.audio.error
+
+    # Start the sound, always on the main thread
+    def init_mixer(self):
+        try:
+            pygame.mixer.init()
+        except pygame.error as error:
+            self.music_error = error
+
+    # Decode the start of the track, on a background thread when the window is opened
+    def load_music(self):
+        start = time.perf_counter()
+        try:
+            pygame.mixer.music.load(self.TRACK)
+        except pygame.error as error:
+            self.music_error = error
+        self.startup_times['music (background)'] = time.perf_counter() - start
+
+    # Play the track and judge hits against it from now on
+    def start_music(self):
+        if self.music_loader is None:
+            if self.music_error is None:
+                self.init_mixer()
+            if self.music_error is None:
+                self.load_music()
+        else:
+            start = time.perf_counter()
+            self.music_loader.join()
+            self.startup_times['waiting for music'] = time.perf_counter() - start
+        if self.music_error is not None:
+            raise self.music_error
+        pygame.mixer.music.play(start=self.song_position)
+        self.song_start = time.perf_counter() - self.song_position
+        self.song_clock = self.audio_time
+        if self.AUDIO_REACTIVE:
+            from audio_reactive import AudioAnalyser
+            self.audio = AudioAnalyser(lambda: time.perf_counter() - self.song_start, self.TRACK).start()
+
+    # Wait as the standby of the court in CHECKPOINT_NAME and take it over when the process playing it stops
+    # in the middle of a rally; the music carries on where it was. Returns False when the court ended normally.
+    def take_over_court(self):
+        if self.CHECKPOINT_NAME is None:
+            raise ValueError('Set Pong.CHECKPOINT_NAME to the court to stand by for')
+        from checkpoint import Standby
+        standby = Standby(self.CHECKPOINT_NAME)
+        checkpoint = standby.wait()
+        if checkpoint is None:
+            standby.close()
             return False
+        elapsed = standby.take_over(self, checkpoint, self.CHECKPOINT_INTERVAL)
+        self.song_position = checkpoint.song_time + elapsed
+        return True
 
-
-    def update_speed_left(self):
-        speed = int(random.randint(70, 85) * self.speed_multiplier_for_text)
-        self.speed_text_surface_left = self.speed_font.render(str(speed), False, (255, 255, 255))
-        self.speed_text_surface_left = pygame.transform.rotate(self.speed_text_surface_left, 90)
-
-
-    def update_speed_right(self):
-        speed = int(random.randint(70, 85) * self.speed_multiplier_for_text)
-        self.speed_text_surface_right = self.speed_font.render(str(speed), False, (255, 255, 255))
-        self.speed_text_surface_right = pygame.transform.rotate(self.speed_text_surface_right, 90)
-
-
+    # Play until the rally is over, returns True, or ESC is pressed, returns False
     def game_loop(self):
-        pygame.mixer.music.load("Epoch.mp3")
-        pygame.mixer.music.play()
+        self.start_music()
+        if self.REPLAY_FILE:
+            from replay import Recorder
+            Recorder(self)
+        if self.CHECKPOINT_NAME is not None and self.checkpoints is None:
+            from checkpoint import Checkpointer
+            Checkpointer(self, self.CHECKPOINT_NAME, self.CHECKPOINT_INTERVAL)
+        dt = self.TICK
         while True:
 
-            for event in pygame.event.get():
-                # Add some extra ways to exit the game.
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                    return
-            self.check_ball_hits_paddle()
-
-            self.check_ball_hits_wall()
-
-            # Redraw the screen
-            self.screen.fill((0, 0, 0))
-
-            # Update lit up sides
-            self.adjust_light_up()
-            if self.light_up_right:
-                pygame.draw.rect(self.screen, self.light_up_colour_right, self.light_up_rect_right)
-            if self.light_up_left:
-                pygame.draw.rect(self.screen, self.light_up_colour_left, self.light_up_rect_left)
-
-            # Draw field
-            pygame.draw.rect(self.screen, self.COLOUR, self.central_line)
-            pygame.draw.rect(self.screen, self.COLOUR, self.left_third_line)
-            pygame.draw.rect(self.screen, self.COLOUR, self.right_third_line)
-            pygame.draw.rect(self.screen, self.COLOUR, self.left_line)
-            pygame.draw.rect(self.screen, self.COLOUR, self.right_line)
-            pygame.draw.rect(self.screen, self.COLOUR, self.top_line)
-            pygame.draw.rect(self.screen, self.COLOUR, self.bottom_line)
-
-            # Project text
-            (self.width_speed_text_l, self.height_speed_text_l) = self.speed_text_surface_left.get_size()
-            (self.width_speed_text_r, self.height_speed_text_r) = self.speed_text_surface_right.get_size()
-            self.screen.blit(self.speed_text_surface_left, (self.WIDTH / 6 - self.width_speed_text_l / 2,
-                                                            self.HEIGHT / 2 - self.height_speed_text_l / 2))
-            self.screen.blit(self.speed_text_surface_right, (5 * self.WIDTH / 6 - self.width_speed_text_r / 2,
-                                                             self.HEIGHT / 2 - self.height_speed_text_r / 2))
-
-            # Control circle speed
-            if not self.space_pressed and pygame.key.get_pressed()[pygame.K_SPACE]:
-                self.CIRCLE_SPEED = self.CIRCLE_SPEED * self.CIRCLE_SPEED_UP
-                for ball in self.balls:
-                    ball.change_velocity_ball(self.CIRCLE_SPEED_UP)
-                self.speed_multiplier_for_text = self.speed_multiplier_for_text * self.CIRCLE_SPEED_UP
-                self.space_pressed = True
-            elif self.space_pressed and not pygame.key.get_pressed()[pygame.K_SPACE]:
-                self.space_pressed = False
-
-            if not self.c_pressed and pygame.key.get_pressed()[pygame.K_c]:
-                self.CIRCLE_SPEED = self.CIRCLE_SPEED / self.CIRCLE_SPEED_UP
-                for ball in self.balls:
-                    ball.change_velocity_ball(1 / self.CIRCLE_SPEED_UP)
-                self.speed_multiplier_for_text = self.speed_multiplier_for_text / self.CIRCLE_SPEED_UP
-                self.c_pressed = True
-            elif self.c_pressed and not pygame.key.get_pressed()[pygame.K_c]:
-                self.c_pressed = False
-
-            # Determine new size circle around player
-            if self.circle_size < self.CIRCLE_MIN_SIZE or self.circle_size > self.CIRCLE_MAX_SIZE:
-                self.circle_direction = -self.circle_direction
-            self.circle_size += self.circle_direction * self.CIRCLE_SPEED
-
-            for paddle in self.paddles:
-                # Draw circles around players
-                pygame.draw.circle(self.screen, (26, 235, 235),
-                                   (paddle.x + int(0.5 * self.PADDLE_WIDTH), paddle.y + int(0.5 * self.PADDLE_WIDTH)),
-                                   40)
-                pygame.draw.circle(self.screen, (26, 235, 235),
-                                   (paddle.x + int(0.5 * self.PADDLE_WIDTH), paddle.y + int(0.5 * self.PADDLE_WIDTH)),
-                                   int(self.circle_size), 8)
-
-                # Update and draw players
-                paddle.move_paddle(self.HEIGHT, self.WIDTH)
-                pygame.draw.rect(self.screen, self.COLOUR, paddle)
-
-            # We know we're not ending the game so lets move the ball here.
-            for ball in self.balls:
-                ball.move_ball()
-                pygame.draw.rect(self.screen, self.COLOUR, ball)
-
-            self.frame += 1
+            if not self.poll_events():
+                self.end_session()
+                return False
 
-            pygame.display.flip()
-            self.clock.tick(60)
+            self.step(min(dt, self.MAX_FRAME_TIME), pygame.key.get_pressed())
+            if self.game_over:
+                self.end_session()
+                return True
+
+            self.present()
+            dt = self.wait_for_next_frame()
+            if self.profiler is not None:
+                self.profiler.end_frame()
 
 
 if __name__ == '__main__':
+    # python pong_extended.py [--standby]
+    # With --standby the game waits for the court in Pong.CHECKPOINT_NAME to stop and carries on with it
     pong = Pong()
-    pong.game_loop()
+    if '--standby' in sys.argv[1:] and not pong.take_over_court():
+        sys.exit(0)
+    sys.exit(1 if pong.game_loop() else 0)
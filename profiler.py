@@ -0,0 +1,67 @@
+import time
+import numpy as np
+
+
+# Times named phases of every frame. Functions are wrapped once, after that timing a call costs
+# two clock reads. The last `window` frames are kept for percentiles, and every frame can be
+# written to a CSV trace file. Phases may call each other, a nested phase is counted in both.
+class FrameProfiler:
+    def __init__(self, phases, window=600, trace_path=None):
+        self.phases = list(phases)
+        self.columns = {name: column for column, name in enumerate(self.phases)}
+        self.current = [0.0] * len(self.phases)
+        self.history = np.zeros((window, len(self.phases) + 1))  # Last column is the whole frame
+        self.frames = 0
+        self.frame_start = time.perf_counter()
+
+        self.trace = None
+        if trace_path:
+            self.trace = open(trace_path, 'w')
+            self.trace.write(','.join(['frame'] + self.phases + ['frame_total']) + '\n')
+
+    # function, but adds its run time to phase name of the current frame
+    def wrap(self, name, function):
+        column = self.columns[name]
+        current = self.current
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                current[column] += clock() - start
+        return timed
+
+    def end_frame(self):
+        now = time.perf_counter()
+        row = self.history[self.frames % len(self.history)]
+        row[:-1] = self.current
+        row[-1] = now - self.frame_start
+        self.frame_start = now
+
+        if self.trace is not None:
+            self.trace.write('%d,%s\n' % (self.frames, ','.join('%.4f' % (value * 1000) for value in row)))
+
+        for column in range(len(self.current)):
+            self.current[column] = 0.0
+        self.frames += 1
+
+    # Phase name -> milliseconds at each percentile over the recent frames, 'frame_total' for whole frames
+    def percentiles(self, percentiles=(50, 95, 99)):
+        filled = self.history[:min(self.frames, len(self.history))]
+        if len(filled) == 0:
+            return {}
+        values = np.percentile(filled, percentiles, axis=0) * 1000
+        return {name: tuple(values[:, column]) for column, name in enumerate(self.phases + ['frame_total'])}
+
+    def summary(self):
+        lines = ['%-24s %7s %7s %7s' % ('phase (ms)', 'p50', 'p95', 'p99')]
+        for name, (p50, p95, p99) in self.percentiles().items():
+            lines.append('%-24s %7.3f %7.3f %7.3f' % (name, p50, p95, p99))
+        return lines
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
@@ -0,0 +1,275 @@
+import sys
+import json
+import time
+import struct
+from array import array
+from bisect import bisect_right
+from simulation import Simulation, KeyState
+from beat_clock import BeatClock
+
+# Binary layout of a Simulation.get_state() snapshot
+STATE_FIELDS = [
+    ('frame', 'i'),
+    ('accumulator', 'd'),
+    ('game_over', '?'),
+    ('good_hits', 'I'),
+    ('bad_hits', 'I'),
+    ('circle_size', 'd'),
+    ('circle_direction', 'i'),
+    ('circle_speed', 'd'),
+    ('space_pressed', '?'),
+    ('c_pressed', '?'),
+    ('speed_left', 'i'),
+    ('speed_right', 'i'),
+    ('speed_multiplier_for_text', 'd'),
+    ('light_up_right', 'B'),
+    ('light_up_good_right', '?'),
+    ('light_up_step_right', 'i'),
+    ('light_up_left', 'B'),
+    ('light_up_good_left', '?'),
+    ('light_up_step_left', 'i'),
+]
+STATE = struct.Struct('<' + ''.join(fmt for _, fmt in STATE_FIELDS) + 'II')
+PADDLE = struct.Struct('<iid')
+BALL = struct.Struct('<iidd')
+RANDOM = struct.Struct('<i625I?d')
+
+# Layout of a recording: header, the court settings as JSON, key codes, one input mask per tick, the song
+# time of every tick, the keyframes, the beat clock hits were judged with, then the paddle positions
+MAGIC = b'PONGREC5'  # 5: paddles moved by controllers that do not replay are recorded
+HEADER = struct.Struct('<8sIIIIIII')  # magic, key count, bytes per input mask, ticks, keyframes, keyframe interval,
+                                      # size of the court settings, paddle positions
+KEYFRAME = struct.Struct('<II')     # tick, size of the packed state
+PADDLE_POSITION = struct.Struct('<IHii')  # tick, paddle, x, y
+BEAT_CLOCK = struct.Struct('<dddII')    # bpm, good window in ms, offset, good phase count, beat time count
+
+
+def pack_beat_clock(clock):
+    return BEAT_CLOCK.pack(clock.bpm, clock.good_window_ms, clock.offset, len(clock.good_phases),
+                           len(clock.beat_times)) + \
+        struct.pack('<%dd' % (len(clock.good_phases) + len(clock.beat_times)), *clock.good_phases, *clock.beat_times)
+
+
+def unpack_beat_clock(data, offset=0):
+    bpm, good_window_ms, clock_offset, phase_count, beat_count = BEAT_CLOCK.unpack_from(data, offset)
+    values = struct.unpack_from('<%dd' % (phase_count + beat_count), data, offset + BEAT_CLOCK.size)
+    return BeatClock(bpm, values[:phase_count], good_window_ms, clock_offset, values[phase_count:])
+
+
+# Settings of the court of a simulation in the config format of session.py: the simulation it uses and
+# every Simulation constant its class changed, so session.court_class() builds the same court again
+def court_settings(simulation):
+    from session import SIMULATIONS
+    court = type(simulation)
+    kind = next(kind for base in court.__mro__ for kind, simulation_class in SIMULATIONS.items()
+                if simulation_class is base)
+    constants = {name: getattr(court, name) for name in dir(Simulation)
+                 if name.isupper() and getattr(court, name) != getattr(Simulation, name)}
+    return {'simulation': kind, 'constants': constants}
+
+
+def pack_state(state):
+    version, internal, gauss = state['random']
+    data = [STATE.pack(*[state[name] for name, _ in STATE_FIELDS], len(state['paddles']), len(state['balls']))]
+    data.extend(PADDLE.pack(*paddle) for paddle in state['paddles'])
+    data.extend(BALL.pack(*ball) for ball in state['balls'])
+    data.append(RANDOM.pack(version, *internal, gauss is not None, gauss or 0.0))
+    return b''.join(data)
+
+
+def unpack_state(data):
+    values = STATE.unpack_from(data)
+    state = {name: value for (name, _), value in zip(STATE_FIELDS, values)}
+    paddle_count, ball_count = values[-2:]
+    offset = STATE.size
+    state['paddles'] = [PADDLE.unpack_from(data, offset + i * PADDLE.size) for i in range(paddle_count)]
+    offset += paddle_count * PADDLE.size
+    state['balls'] = [BALL.unpack_from(data, offset + i * BALL.size) for i in range(ball_count)]
+    offset += ball_count * BALL.size
+    random_values = RANDOM.unpack_from(data, offset)
+    state['random'] = (random_values[0], random_values[1:626], random_values[627] if random_values[626] else None)
+    return state
+
+
+# Records the input and song time of every tick of a simulation, plus a full snapshot every
+# keyframe_interval ticks. The first snapshot holds the random generator state, so the inputs and
+# song times are enough to play the game again. Paddles moved by a controller without REPLAYABLE set,
+# e.g. sensors.SensorController, follow live input the keys don't hold; where they were moved to is
+# recorded every tick and the replay puts them there.
+class Recorder:
+    def __init__(self, simulation, keyframe_interval=600):
+        self.keys = simulation.input_keys()
+        self.mask_bytes = (len(self.keys) + 7) // 8
+        self.keyframe_interval = keyframe_interval
+        self.inputs = bytearray()
+        self.times = array('d')
+        self.ticks = 0
+        self.keyframes = []
+        self.paddle_positions = bytearray()
+        self.beat_clock = simulation.beat_clock
+        self.settings = court_settings(simulation)
+        simulation.recorder = self
+
+    # Called by Simulation.tick() before the tick is simulated
+    def record(self, simulation, keys_pressed):
+        if self.ticks % self.keyframe_interval == 0:
+            self.keyframes.append((self.ticks, pack_state(simulation.get_state())))
+        mask = 0
+        for bit, key in enumerate(self.keys):
+            if keys_pressed[key]:
+                mask |= 1 << bit
+        self.inputs += mask.to_bytes(self.mask_bytes, 'little')
+        self.times.append(simulation.tick_time)
+        self.ticks += 1
+
+    # Called by Simulation.tick() after the paddles moved
+    def record_paddles(self, simulation):
+        for index, paddle in enumerate(simulation.paddles):
+            controller = paddle.controller
+            if controller is not None and not getattr(controller, 'REPLAYABLE', False):
+                self.paddle_positions += PADDLE_POSITION.pack(self.ticks - 1, index, paddle.x, paddle.y)
+
+    def replay(self):
+        return Replay(self.keys, bytes(self.inputs), list(self.times), list(self.keyframes), self.keyframe_interval,
+                      self.beat_clock, self.settings, bytes(self.paddle_positions))
+
+    def save(self, path):
+        settings = json.dumps(self.settings).encode()
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(self.keys), self.mask_bytes, self.ticks, len(self.keyframes),
+                                   self.keyframe_interval, len(settings),
+                                   len(self.paddle_positions) // PADDLE_POSITION.size))
+            file.write(settings)
+            file.write(struct.pack('<%di' % len(self.keys), *self.keys))
+            file.write(self.inputs)
+            file.write(struct.pack('<%dd' % self.ticks, *self.times))
+            for tick, data in self.keyframes:
+                file.write(KEYFRAME.pack(tick, len(data)))
+                file.write(data)
+            file.write(pack_beat_clock(self.beat_clock))
+            file.write(self.paddle_positions)
+
+
+# A recorded game that can be simulated again without a display, from the start or from any tick.
+# settings are the court settings of court_settings(), the court is played on a court built from them.
+# paddle_positions are the packed PADDLE_POSITION records of Recorder.record_paddles().
+class Replay:
+    def __init__(self, keys, inputs, times, keyframes, keyframe_interval, beat_clock, settings=None,
+                 paddle_positions=b''):
+        self.keys = keys
+        self.mask_bytes = (len(keys) + 7) // 8
+        self.inputs = inputs
+        self.times = times
+        self.keyframes = keyframes
+        self.keyframe_ticks = [tick for tick, _ in keyframes]
+        self.keyframe_interval = keyframe_interval
+        self.beat_clock = beat_clock
+        self.settings = settings
+        self.paddle_positions = {}  # tick: {paddle: (x, y)}
+        for offset in range(0, len(paddle_positions), PADDLE_POSITION.size):
+            tick, paddle, x, y = PADDLE_POSITION.unpack_from(paddle_positions, offset)
+            self.paddle_positions.setdefault(tick, {})[paddle] = (x, y)
+        self.recorded_paddles = sorted({paddle for positions in self.paddle_positions.values()
+                                        for paddle in positions})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic = data[:len(MAGIC)]
+        if magic != MAGIC:
+            if magic.startswith(MAGIC[:7]):
+                raise ValueError('%s was recorded by another version of the game and plays differently' % path)
+            raise ValueError('%s is not a recording' % path)
+        magic, key_count, mask_bytes, ticks, keyframe_count, keyframe_interval, settings_size, position_count = \
+            HEADER.unpack_from(data)
+        offset = HEADER.size
+        settings = json.loads(data[offset:offset + settings_size])
+        offset += settings_size
+        keys = list(struct.unpack_from('<%di' % key_count, data, offset))
+        offset += 4 * key_count
+        inputs = data[offset:offset + ticks * mask_bytes]
+        offset += ticks * mask_bytes
+        times = list(struct.unpack_from('<%dd' % ticks, data, offset))
+        offset += 8 * ticks
+        keyframes = []
+        for _ in range(keyframe_count):
+            tick, size = KEYFRAME.unpack_from(data, offset)
+            offset += KEYFRAME.size
+            keyframes.append((tick, data[offset:offset + size]))
+            offset += size
+        beat_clock = unpack_beat_clock(data, offset)
+        offset = len(data) - position_count * PADDLE_POSITION.size
+        return cls(keys, inputs, times, keyframes, keyframe_interval, beat_clock, settings, data[offset:])
+
+    def __len__(self):
+        return len(self.inputs) // self.mask_bytes
+
+    # The keys that were pressed during tick
+    def inputs_at(self, tick):
+        start = tick * self.mask_bytes
+        mask = int.from_bytes(self.inputs[start:start + self.mask_bytes], 'little')
+        return KeyState(key for bit, key in enumerate(self.keys) if mask >> bit & 1)
+
+    # Headless simulation class of the recorded court
+    def court_class(self):
+        if self.settings is None:
+            return Simulation
+        from session import court_class
+        return court_class(self.settings)
+
+    # Simulation as it was before tick was simulated, starting from the last keyframe before it.
+    # Played on the recorded court unless another simulation_class is given.
+    def simulation(self, tick=0, simulation_class=None):
+        index = bisect_right(self.keyframe_ticks, tick) - 1
+        keyframe_tick, data = self.keyframes[index]
+        simulation = (simulation_class or self.court_class())()
+        simulation.set_state(unpack_state(data))
+        simulation.beat_clock = self.beat_clock
+
+        # Hits are judged against the song time that was recorded for the tick, recorded paddles are put
+        # where they were
+        playing = [keyframe_tick]
+        simulation.song_clock = lambda: self.times[playing[0]]
+        controllers = [(simulation.paddles[index], simulation.paddles[index].controller)
+                       for index in self.recorded_paddles]
+        for index in self.recorded_paddles:
+            simulation.paddles[index].controller = RecordedController(self.paddle_positions, playing, index)
+        for t in range(keyframe_tick, min(tick, len(self))):
+            playing[0] = t
+            simulation.tick(self.inputs_at(t))
+        simulation.song_clock = None
+        for paddle, controller in controllers:
+            paddle.controller = controller
+        return simulation
+
+    # Simulate the whole game as fast as possible
+    def play(self, simulation_class=None):
+        return self.simulation(len(self), simulation_class)
+
+
+# Puts a paddle where Recorder.record_paddles() saw it during the tick being replayed. Ticks without a
+# record leave it where it is, like a controller that had no input yet.
+class RecordedController:
+    def __init__(self, paddle_positions, playing, paddle):
+        self.paddle_positions = paddle_positions
+        self.playing = playing
+        self.paddle = paddle
+
+    def move_paddle(self, paddle, board_height, board_width):
+        position = self.paddle_positions.get(self.playing[0], {}).get(self.paddle)
+        if position is not None:
+            paddle.x, paddle.y = position
+
+
+if __name__ == '__main__':
+    # python replay.py <recording> [tick]
+    replay = Replay.load(sys.argv[1])
+    tick = int(sys.argv[2]) if len(sys.argv) > 2 else len(replay)
+    start = time.perf_counter()
+    simulation = replay.simulation(tick)
+    elapsed = time.perf_counter() - start
+    print('%d ticks recorded, %d keyframes' % (len(replay), len(replay.keyframes)))
+    print('jumped to tick %d in %.3f s' % (tick, elapsed))
+    print('frame %d, balls %s, game over %s' % (simulation.frame, [(ball.x, ball.y) for ball in simulation.balls],
+                                                simulation.game_over))
@@ -0,0 +1,258 @@
+import time
+import math
+import random
+import struct
+import asyncio
+import threading
+from collections import deque, namedtuple
+
+# One datagram per measurement: player, sensor timestamp in seconds, x and y of the player in court pixels.
+# Several measurements may be packed into one datagram back to back.
+SAMPLE = struct.Struct('<Hdff')
+
+MAX_EXTRAPOLATION = 0.1  # Seconds a track is extrapolated past its last measurement before it stands still
+LATENCY_WINDOW = 1000  # Number of latencies kept for the percentiles
+
+# Smoothed position and velocity of one player. received is the perf_counter() time the measurement
+# behind this track arrived, sample_time is the timestamp the sensor put on it.
+Track = namedtuple('Track', 'x y velocity_x velocity_y received sample_time')
+
+
+# Alpha-beta filter over the measurements of one player: the position is predicted from the velocity,
+# then pulled towards the measurement by ALPHA and the velocity corrected by BETA. Time steps come from
+# the receive times, the sensor timestamps are only used to throw away late and duplicate datagrams.
+class PlayerFilter:
+    ALPHA = 0.5
+    BETA = 0.1
+
+    def __init__(self):
+        self.track = None
+
+    def update(self, x, y, sample_time, received):
+        track = self.track
+        if track is None:
+            self.track = Track(x, y, 0.0, 0.0, received, sample_time)
+            return True
+        if sample_time <= track.sample_time:
+            return False
+
+        dt = max(received - track.received, 1e-3)
+        predicted_x = track.x + track.velocity_x * dt
+        predicted_y = track.y + track.velocity_y * dt
+        residual_x = x - predicted_x
+        residual_y = y - predicted_y
+        self.track = Track(predicted_x + self.ALPHA * residual_x, predicted_y + self.ALPHA * residual_y,
+                           track.velocity_x + self.BETA * residual_x / dt,
+                           track.velocity_y + self.BETA * residual_y / dt, received, sample_time)
+        return True
+
+
+# Receives player positions on a UDP socket from an asyncio loop in a background thread.
+# The loop owns the filters and publishes a new tuple of tracks after every datagram; the game loop
+# only reads self.snapshot, so neither side ever waits for the other. Swapping the reference is atomic,
+# a reader always sees one complete snapshot, either the previous one or the new one.
+class SensorInput:
+    def __init__(self, players, address=('127.0.0.1', 0)):
+        self.players = players
+        self.filters = [PlayerFilter() for _ in range(players)]
+        self.snapshot = (None,) * players
+
+        self.datagrams = 0
+        self.samples = 0
+        self.rejected = 0  # Late, duplicate, malformed or for an unknown player
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # Seconds from receiving a sample to moving a paddle
+
+        self.loop = asyncio.new_event_loop()
+        self.transport = None
+        self.error = None  # Why the socket could not be opened, raised here
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(address,), daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.error is not None:
+            self.thread.join()
+            raise self.error
+        self.address = self.transport.get_extra_info('sockname')
+
+    def run(self, address):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.transport, _ = self.loop.run_until_complete(
+                self.loop.create_datagram_endpoint(lambda: SensorProtocol(self), local_addr=address))
+        except (OSError, ValueError) as error:
+            self.error = error
+            self.loop.close()
+            self.started.set()
+            return
+        self.started.set()
+        self.loop.run_forever()
+        self.transport.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+    def receive(self, data):
+        received = time.perf_counter()
+        self.datagrams += 1
+        snapshot = list(self.snapshot)
+        changed = False
+        for offset in range(0, len(data) - SAMPLE.size + 1, SAMPLE.size):
+            player, sample_time, x, y = SAMPLE.unpack_from(data, offset)
+            self.samples += 1
+            if player >= self.players or not self.filters[player].update(x, y, sample_time, received):
+                self.rejected += 1
+                continue
+            snapshot[player] = self.filters[player].track
+            changed = True
+        if len(data) % SAMPLE.size:
+            self.rejected += 1
+        if changed:
+            self.snapshot = tuple(snapshot)
+
+    # Where the player is now according to its track, or None before the first measurement
+    def position(self, player, now=None):
+        track = self.snapshot[player]
+        if track is None:
+            return None
+        if now is None:
+            now = time.perf_counter()
+        ahead = min(max(now - track.received, 0.0), MAX_EXTRAPOLATION)
+        return track.x + track.velocity_x * ahead, track.y + track.velocity_y * ahead
+
+    # Milliseconds from receiving a sample to the paddle update that first used it
+    def latency_percentiles(self, percentiles=(50, 95, 99)):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {percentile: 0.0 for percentile in percentiles}
+        return {percentile: latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))] * 1000
+                for percentile in percentiles}
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class SensorProtocol(asyncio.DatagramProtocol):
+    def __init__(self, sensor_input):
+        self.sensor_input = sensor_input
+
+    def datagram_received(self, data, address):
+        self.sensor_input.receive(data)
+
+
+# Moves a paddle so its centre follows a tracked player, set it as paddle.controller.
+# The paddle is kept on the board like with the keys.
+class SensorController:
+    def __init__(self, sensor_input, player):
+        self.sensor_input = sensor_input
+        self.player = player
+        self.last_received = None
+
+    def move_paddle(self, paddle, board_height, board_width):
+        now = time.perf_counter()
+        track = self.sensor_input.snapshot[self.player]
+        if track is None:
+            return
+        x, y = self.sensor_input.position(self.player, now)
+        paddle.x = min(max(x - paddle.width / 2, 0), board_width - paddle.width)
+        paddle.y = min(max(y - paddle.height / 2, 0), board_height - paddle.height)
+        if track.received != self.last_received:
+            self.last_received = track.received
+            self.sensor_input.latencies.append(now - track.received)
+
+
+# Stand-in for the tracking system: every player walks a Lissajous figure on its half of the court,
+# measurements get gaussian noise and a share of them is dropped like on a busy network.
+class SimulatedSensorFeed:
+    def __init__(self, address, players, width, height, rate=100, noise=3.0, drop_chance=0.02, seed=None):
+        self.address = address
+        self.players = players
+        self.width = width
+        self.height = height
+        self.rate = rate
+        self.noise = noise
+        self.drop_chance = drop_chance
+        self.random = random.Random(seed)
+        self.sent = 0
+
+    # True position of a player at time t
+    def position(self, player, t):
+        half = self.width / 2
+        left = half * (player % 2)
+        x = left + half / 2 + half / 3 * math.sin(0.7 * t + player)
+        y = self.height / 2 + self.height / 3 * math.sin(1.1 * t + 2 * player)
+        return x, y
+
+    async def run(self, duration):
+        loop = asyncio.get_event_loop()
+        transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=self.address)
+        start = time.perf_counter()
+        tick = 0
+        while True:
+            t = tick / self.rate
+            if t >= duration:
+                break
+            samples = []
+            for player in range(self.players):
+                if self.random.random() < self.drop_chance:
+                    continue
+                x, y = self.position(player, t)
+                samples.append(SAMPLE.pack(player, start + t, x + self.random.gauss(0, self.noise),
+                                           y + self.random.gauss(0, self.noise)))
+            if samples:
+                transport.sendto(b''.join(samples))
+                self.sent += len(samples)
+            tick += 1
+            await asyncio.sleep(max(0.0, start + tick / self.rate - time.perf_counter()))
+        transport.close()
+
+
+if __name__ == '__main__':
+    # python sensors.py [players] [seconds]
+    # Plays headless with every paddle following a simulated player and reports latency and tracking error.
+    import sys
+    from simulation import Simulation, KeyState
+
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+
+    simulation = Simulation(seed=1)
+    for index in range(2, players):
+        simulation.add_paddle(simulation.PADDLE_VELOCITY, 0, 0, 0, 0, 0, 0,
+                              simulation.PADDLE_WIDTH, simulation.PADDLE_HEIGHT)
+    sensor_input = SensorInput(players)
+    for player, paddle in enumerate(simulation.paddles):
+        paddle.controller = SensorController(sensor_input, player)
+
+    feed = SimulatedSensorFeed(sensor_input.address, players, simulation.WIDTH, simulation.HEIGHT, seed=1)
+    feed_thread = threading.Thread(target=lambda: asyncio.run(feed.run(duration)))
+    feed_thread.start()
+
+    errors = []
+    tick_times = []
+    keys = KeyState()
+    start = time.perf_counter()
+    frame = 0
+    while feed_thread.is_alive():
+        before = time.perf_counter()
+        simulation.tick(keys)
+        tick_times.append(time.perf_counter() - before)
+        if simulation.game_over:
+            simulation.game_over = False
+            simulation.balls[0].x, simulation.balls[0].y = simulation.WIDTH // 2, simulation.HEIGHT // 2
+        if frame > 30:
+            t = time.perf_counter() - start
+            for player, paddle in enumerate(simulation.paddles):
+                x, y = feed.position(player, t)
+                errors.append(math.hypot(paddle.centerx - x, paddle.centery - y))
+        frame += 1
+        time.sleep(max(0.0, start + frame * simulation.TICK - time.perf_counter()))
+    feed_thread.join()
+    sensor_input.close()
+
+    latency = sensor_input.latency_percentiles()
+    errors.sort()
+    print('%d players, %d samples sent, %d received in %d datagrams, %d rejected' %
+          (players, feed.sent, sensor_input.samples, sensor_input.datagrams, sensor_input.rejected))
+    print('receipt to paddle update: p50 %.2f ms p95 %.2f ms p99 %.2f ms' % (latency[50], latency[95], latency[99]))
+    print('tracking error: median %.1f px p95 %.1f px' % (errors[len(errors) // 2], errors[int(len(errors) * 0.95)]))
+    print('tick: mean %.3f ms' % (sum(tick_times) / len(tick_times) * 1000))
@@ -0,0 +1,198 @@
+import sys
+import json
+import time
+import pygame
+from concurrent.futures import ThreadPoolExecutor
+from simulation import Simulation, KeyState
+from vector_simulation import VectorSimulation
+from spatial_grid import GridSimulation
+from beat_analysis import load_beat_grid
+from replay import Recorder
+from match_stats import MatchStats
+
+SIMULATIONS = {
+    'objects': Simulation,
+    'vector': VectorSimulation,
+    'grid': GridSimulation,
+}
+
+# Court settings in a config file and the Simulation constants they set
+SETTINGS = {
+    'width': 'WIDTH',
+    'height': 'HEIGHT',
+    'track': 'TRACK',
+    'bpm': 'BPM',
+    'good_beat_phases': 'GOOD_BEAT_PHASES',
+    'good_timing_ms': 'GOOD_TIMING_MS',
+    'continuous_collision': 'CONTINUOUS_COLLISION',
+    'replay_file': 'REPLAY_FILE',
+    'bot_players': 'BOT_PLAYERS',
+    'bot_difficulty': 'BOT_DIFFICULTY',
+}
+
+FRAME_RATE = 60  # Times per second all sessions are stepped
+MAX_FRAME_TIME = 0.25  # Longest real time simulated per frame, so a stall does not cause a burst of ticks
+
+
+# Players in a config file: {"keys": ["w", "s", "a", "d"], "x": 100, "y": 275}, keys are named like the
+# pygame constants without K_, e.g. "UP" for pygame.K_UP
+def player(config):
+    up_key, down_key, left_key, right_key = [getattr(pygame, 'K_' + name) for name in config['keys']]
+    return up_key, down_key, left_key, right_key, config['x'], config['y']
+
+
+# Simulation class for a court in a config file. Settings that are not given keep the class defaults,
+# any other class constant can be set under "constants".
+def court_class(config):
+    base = SIMULATIONS[config.get('simulation', 'objects')]
+    if config.get('display'):
+        from pong_extended import Pong
+        base = type('Display' + base.__name__, (Pong, base), {}) if base is not Simulation else Pong
+
+    constants = {constant: config[setting] for setting, constant in SETTINGS.items() if setting in config}
+    if 'tick_rate' in config:
+        constants['TICK_RATE'] = config['tick_rate']
+        constants['TICK'] = 1 / config['tick_rate']
+    if 'players' in config:
+        constants['PLAYERS'] = [player(player_config) for player_config in config['players']]
+    constants.update(config.get('constants', {}))
+    return type('Court', (base,), constants)
+
+
+# One court: its simulation, where its input comes from and, optionally, a display.
+# "display": true draws it in the window, "display": "offscreen" draws it to a surface of its own
+# (e.g. for the LED output) and without it the court is headless. Hits are added to stats when given.
+class Session:
+    def __init__(self, config, stats=None):
+        self.name = config.get('name', 'court')
+        self.display = config.get('display', False)
+        court = court_class(config)
+        if self.display == 'offscreen':
+            self.court = court(config.get('seed'), pygame.Surface((court.WIDTH, court.HEIGHT)))
+        else:
+            self.court = court(config.get('seed'))
+
+        # Pong loads the beat grid itself, headless courts judge hits against it in game time
+        if not self.display and 'track' in config:
+            beat_grid = load_beat_grid(config['track'])
+            if beat_grid is not None:
+                self.court.beat_clock = beat_grid.beat_clock(court.GOOD_BEAT_PHASES, court.GOOD_TIMING_MS)
+
+        if config.get('replay_file'):
+            Recorder(self.court)
+        if stats is not None:
+            stats.attach(self.court)
+
+        # Keys held on a headless court, set by whatever controls it
+        self.inputs = KeyState()
+        self.finished = False
+        self.ticks = 0
+        self.step_time = 0.0  # Seconds spent in step()
+
+    # Keyboard input for the court in the window, self.inputs for the others
+    def keys_pressed(self):
+        if self.display is True:
+            return pygame.key.get_pressed()
+        return self.inputs
+
+    def start(self):
+        if self.display is True:
+            self.court.start_music()
+
+    def step(self, dt):
+        if self.finished:
+            return 0
+        start = time.perf_counter()
+        ticks = self.court.step(min(dt, MAX_FRAME_TIME), self.keys_pressed())
+        self.step_time += time.perf_counter() - start
+        self.ticks += ticks
+        if self.court.game_over:
+            self.finish()
+        return ticks
+
+    def present(self):
+        if self.display and not self.finished:
+            self.court.present()
+
+    # Stop the court and write out its recording
+    def finish(self):
+        self.finished = True
+        if self.display:
+            self.court.end_session()
+        elif self.court.recorder is not None:
+            self.court.recorder.save(self.court.REPLAY_FILE)
+        if self.court.stats is not None:
+            self.court.stats.flush()
+
+
+# A config file holds one court, or {"sessions": [...]} for several.
+# Courts with the same "stats_path" share one statistics store.
+def load_sessions(path):
+    with open(path) as file:
+        config = json.load(file)
+    stores = {}
+    sessions = []
+    for session_config in config.get('sessions', [config]):
+        stats = None
+        if session_config.get('stats_path'):
+            stats_path = session_config['stats_path']
+            stats = stores.get(stats_path) or stores.setdefault(stats_path, MatchStats(stats_path))
+        sessions.append(Session(session_config, stats))
+    return sessions
+
+
+# Step all sessions in real time until every rally is over, duration seconds have passed or ESC is
+# pressed in the window. Headless courts are stepped one after the other, or on threads when
+# threads is given. The court in the window is always stepped and drawn on this thread.
+def run_sessions(sessions, duration=None, threads=0):
+    if sum(session.display is True for session in sessions) > 1:
+        raise ValueError('Only one session can be shown in the window')
+    headless = [session for session in sessions if not session.display]
+    displayed = [session for session in sessions if session.display]
+    window = [session for session in sessions if session.display is True]
+    pool = ThreadPoolExecutor(threads) if threads else None
+
+    for session in sessions:
+        session.start()
+    start = last = time.perf_counter()
+    frame = 0
+    while not all(session.finished for session in sessions):
+        if duration is not None and last - start >= duration:
+            break
+        if window and not window[0].court.poll_events():
+            break
+
+        now = time.perf_counter()
+        dt = now - last
+        last = now
+        if pool is not None:
+            list(pool.map(lambda session: session.step(dt), headless))
+        else:
+            for session in headless:
+                session.step(dt)
+        for session in displayed:
+            session.step(dt)
+            session.present()
+
+        frame += 1
+        time.sleep(max(0.0, start + frame / FRAME_RATE - time.perf_counter()))
+
+    for session in sessions:
+        if not session.finished:
+            session.finish()
+    if pool is not None:
+        pool.shutdown()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    # python session.py <config.json> [seconds] [threads]
+    sessions = load_sessions(sys.argv[1])
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    elapsed = run_sessions(sessions, duration, threads)
+    for session in sessions:
+        print('%-12s %6d ticks, %.1f us per tick%s' %
+              (session.name, session.ticks, session.step_time / max(session.ticks, 1) * 1e6,
+               ', rally over' if session.court.game_over else ''))
+    print('%d sessions for %.1f s' % (len(sessions), elapsed))
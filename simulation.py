@@ -0,0 +1,549 @@
+import math
+import random
+import pygame
+from beat_clock import BeatClock
+
+
+class KeyState:
+    # Stand-in for pygame.key.get_pressed() when there is no display, indexed by pygame key codes
+    def __init__(self, pressed=()):
+        self.pressed = set(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class Paddle(pygame.Rect):
+    def __init__(self, velocity, up_key, down_key, left_key, right_key, *args, **kwargs):
+        self.velocity = velocity
+        self.up_key = up_key
+        self.down_key = down_key
+        self.left_key = left_key
+        self.right_key = right_key
+        self.controller = None  # Moves the paddle instead of the keys when set, e.g. sensors.SensorController
+        super().__init__(*args, **kwargs)
+
+    def move_paddle(self, board_height, board_width, keys_pressed=None):
+        if self.controller is not None:
+            self.controller.move_paddle(self, board_height, board_width)
+            return
+
+        if keys_pressed is None:
+            keys_pressed = pygame.key.get_pressed()
+
+        if keys_pressed[self.up_key]:
+            if self.y - self.velocity > 0:
+                self.y -= self.velocity
+
+        if keys_pressed[self.down_key]:
+            if self.y + self.velocity < board_height - self.height:
+                self.y += self.velocity
+
+        if keys_pressed[self.left_key]:
+            if self.x + self.velocity > 0:
+                self.x -= self.velocity
+
+        if keys_pressed[self.right_key]:
+            if self.x + self.velocity < board_width - self.width:
+                self.x += self.velocity
+
+
+class Ball(pygame.Rect):
+    def __init__(self, velocity, *args, **kwargs):
+        self.velocity = velocity
+        self.angle = 0
+        super().__init__(*args, **kwargs)
+
+    def move_ball(self):
+        self.x += self.velocity
+        self.y += round(self.angle)
+
+    # Fraction of a move by (dx, dy) after which the ball first overlaps rect, or None if it does not
+    # hit rect during the move. A ball that already overlaps rect at the start is not counted.
+    def time_of_impact(self, rect, dx, dy):
+        entry = 0.0
+        leave = 1.0
+        for position, size, delta, other, other_size in ((self.x, self.width, dx, rect.x, rect.width),
+                                                        (self.y, self.height, dy, rect.y, rect.height)):
+            if delta > 0:
+                start, end = (other - position - size) / delta, (other + other_size - position) / delta
+            elif delta < 0:
+                start, end = (other + other_size - position) / delta, (other - position - size) / delta
+            elif position < other + other_size and other < position + size:
+                continue
+            else:
+                return None
+            entry = max(entry, start)
+            leave = min(leave, end)
+        if entry >= leave or entry == 0.0 and self.colliderect(rect):
+            return None
+        return entry
+
+    def change_velocity_ball(self, multiplier):
+        self.velocity = self.velocity * multiplier
+
+
+class Bar(pygame.Rect):
+    def __init__(self, velocity, *args, **kwargs):
+        self.velocity = velocity
+        self.angle = 1
+        super().__init__(*args, **kwargs)
+
+    def move_bar(self):
+        self.x += self.angle * self.velocity
+
+
+# Court logic without any drawing, so it can run without a display and faster than real time.
+# All velocities are in pixels per tick, one tick is 1 / TICK_RATE seconds of game time.
+class Simulation:
+    BPM = 120       # Beats per minute
+    GOOD_BEAT_PHASES = [0, 0.5]     # Hits on the beat and half way between beats are good
+    GOOD_TIMING_MS = 50     # How far off the beat a hit may be and still be good
+    frame = -2
+
+    TICK_RATE = 60
+    TICK = 1 / TICK_RATE
+
+    HEIGHT = 600
+    WIDTH = 1200
+
+    PADDLE_WIDTH = 50
+    PADDLE_HEIGHT = 50
+    PADDLE_VELOCITY = 8
+    PLAYERS = None  # (up, down, left, right key, x, y) of every paddle, the two standard players when None
+    BOT_PLAYERS = ()  # Paddles played by the computer, by index, see bot.py
+    BOT_DIFFICULTY = 'medium'  # 'easy', 'medium' or 'hard'
+    BALL_WIDTH = 10
+    BALL_VELOCITY = 5
+    BALL_ANGLE = 0
+    ANGLE_POSITION = 1  # How much hitting the ball away from the middle of the field steers it back
+    ANGLE_RANDOM = 1    # Width of the random change in angle on every hit
+    CONTINUOUS_COLLISION = False  # Sweep balls against the paddles so fast balls cannot pass through them
+    MAX_BOUNCES = 4  # Most paddle hits of one ball within a tick with CONTINUOUS_COLLISION
+
+    BAR_SPEED = 5
+    BAR_X = 0
+
+    CIRCLE_SPEED = 2
+    CIRCLE_MAX_SIZE = 70
+    CIRCLE_MIN_SIZE = 50
+    CIRCLE_SPEED_UP = 1.5  # Change in speed when pressing space; speed = CIRCLE_SPEED_UP * speed
+
+    FADE = 10  # Adjust to change fade out speed, higher is faster
+    RATIO_GOOD = 4  # RATIO_GOOD times more likely to pass a good ball than a bad ball
+    SPEED_SCALE = 15.6  # Speed shown for a ball moving one pixel per tick, the starting speed shows 78
+
+    def __init__(self, seed=None):
+        # Game time not yet simulated, see step()
+        self.accumulator = 0.0
+        self.game_over = False
+
+        # All randomness comes from here, so a game can be played again from the same seed
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # Gets every tick's input before it is simulated, see replay.Recorder
+        self.recorder = None
+
+        # Gets every hit, see match_stats.MatchStats
+        self.stats = None
+
+        # Gets every hit and the state after every tick, see spectator.SpectatorFeed
+        self.spectators = None
+
+        # Saves the state after every tick for a standby process, see checkpoint.Checkpointer
+        self.checkpoints = None
+
+        # Judges the timing of hits. song_clock returns the position in the song in seconds,
+        # when it is None the game time is used so games without a display stay reproducible.
+        self.beat_clock = BeatClock(self.BPM, self.GOOD_BEAT_PHASES, self.GOOD_TIMING_MS)
+        self.song_clock = None
+        self.tick_time = self.song_time()
+
+        # Pointers around players
+        self.circle_size = self.CIRCLE_MIN_SIZE
+        self.circle_direction = 1
+
+        # Create the player objects.
+        self.paddles = []
+        self.balls = []
+        self.add_players()
+
+        self.add_ball(
+            self.BALL_VELOCITY,
+            self.WIDTH / 2 - self.BALL_WIDTH / 2,
+            self.HEIGHT / 2 - self.BALL_WIDTH / 2,
+            self.BALL_WIDTH,
+            self.BALL_WIDTH
+        )
+
+        if self.BOT_PLAYERS:
+            from bot import BotController
+            for player in self.BOT_PLAYERS:
+                self.paddles[player].controller = BotController(self, player, self.BOT_DIFFICULTY)
+
+        # Colours of a lit up side for every tick of the fade out, for a good and a bad hit
+        self.fade_palettes = {
+            True: self.fade_palette((255, 255, 255), (self.FADE, self.FADE, self.FADE)),
+            False: self.fade_palette((255, 0, 0), (self.FADE, 0, 0)),
+        }
+
+        # For lighting up right side of the field
+        self.light_up_right = 0
+        self.light_up_colour_right = (255, 255, 255)
+        self.light_up_palette_right = self.fade_palettes[True]
+        self.light_up_step_right = 0
+
+        # For lighting up left side of the field
+        self.light_up_left = 0
+        self.light_up_colour_left = (255, 0, 0)
+        self.light_up_palette_left = self.fade_palettes[False]
+        self.light_up_step_left = 0
+
+        # Keys for adjusting speed, helps to only apply once, not continuously
+        self.space_pressed = False
+        self.c_pressed = False
+
+        # Hits on and off the beat so far
+        self.good_hits = 0
+        self.bad_hits = 0
+
+        # Speed shown on each side of the field
+        self.speed_left = 78
+        self.speed_right = 75
+        self.speed_multiplier_for_text = 1
+
+    def add_players(self):
+        players = self.PLAYERS
+        if players is None:
+            players = [
+                # The left paddle
+                (pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d,
+                 100, self.HEIGHT / 2 - self.PADDLE_HEIGHT / 2),
+                # The right paddle
+                (pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT,
+                 self.WIDTH - self.PADDLE_WIDTH - 100, self.HEIGHT / 2 - self.PADDLE_HEIGHT / 2),
+            ]
+        for up_key, down_key, left_key, right_key, x, y in players:
+            self.add_paddle(self.PADDLE_VELOCITY, up_key, down_key, left_key, right_key, x, y,
+                            self.PADDLE_WIDTH, self.PADDLE_HEIGHT)
+
+    def add_paddle(self, velocity, up_key, down_key, left_key, right_key, x, y, width, height):
+        paddle = Paddle(velocity, up_key, down_key, left_key, right_key, x, y, width, height)
+        self.paddles.append(paddle)
+        return paddle
+
+    def add_ball(self, velocity, x, y, width, height):
+        ball = Ball(velocity, x, y, width, height)
+        self.balls.append(ball)
+        return ball
+
+    def check_ball_hits_wall(self):
+        for ball in self.balls:
+            if ball.x > self.WIDTH or ball.x < 0:
+                self.game_over = True
+
+            if ball.y > self.HEIGHT - self.BALL_WIDTH or ball.y < 0:
+                self.game_over = True
+                # ball.angle = -ball.angle
+
+    def check_ball_hits_paddle(self):
+        for ball in self.balls:
+            for paddle in self.paddles:
+                if ball.colliderect(paddle):
+                    self.hit_ball(ball, paddle)
+                    break
+
+    # Bounce the ball off the paddle and light up the field
+    def hit_ball(self, ball, paddle):
+        ball.velocity = -ball.velocity
+        if self.CONTINUOUS_COLLISION:
+            # Put the ball against the side of the paddle it leaves from
+            if ball.velocity > 0:
+                ball.x = paddle.x + paddle.width
+            else:
+                ball.x = paddle.x - ball.width
+        else:
+            ball.x += ball.velocity * 10
+            paddle.x -= ball.velocity * 10
+        ball.angle = (self.ANGLE_POSITION * ((self.HEIGHT / 2 - ball.y) / (self.HEIGHT / 2)) +
+                      self.ANGLE_RANDOM * (self.random.random() - 0.5)) * abs(ball.velocity)
+
+        good = self.beat_clock.is_good(self.tick_time)
+        if good:
+            self.good_hits += 1
+        else:
+            self.bad_hits += 1
+        if self.stats is not None:
+            self.stats.record_hit(self, ball, paddle, good)
+        if self.spectators is not None:
+            self.spectators.record_hit(self, ball, paddle, good)
+
+        if ball.x > self.WIDTH / 2 and not self.light_up_right:
+            self.start_light_up_right(good)
+            self.update_speed_left(ball)
+        elif not self.light_up_left:
+            self.start_light_up_left(good)
+            self.update_speed_right(ball)
+
+    # Colours from start to the first colour that has faded out, lowering by fade every tick
+    @staticmethod
+    def fade_palette(start, fade):
+        if fade[0] <= 0:
+            raise ValueError('FADE must be positive, otherwise a lit up side never fades out')
+        palette = [tuple(start)]
+        while palette[-1][0] >= 0:
+            palette.append(tuple(x1 - x2 for x1, x2 in zip(palette[-1], fade)))
+        return palette
+
+    # Start to light up right side of the field
+    def start_light_up_right(self, good):
+        self.light_up_right = 1
+        self.light_up_palette_right = self.fade_palettes[good]
+        self.light_up_step_right = 0
+        self.light_up_colour_right = self.light_up_palette_right[0]
+
+    # Start to light up left side of the field
+    def start_light_up_left(self, good):
+        self.light_up_left = 1
+        self.light_up_palette_left = self.fade_palettes[good]
+        self.light_up_step_left = 0
+        self.light_up_colour_left = self.light_up_palette_left[0]
+
+    # Update lit up sides of the field
+    def adjust_light_up(self):
+        if self.light_up_right:
+            self.light_up_step_right += 1
+            self.light_up_colour_right = self.light_up_palette_right[self.light_up_step_right]
+            if self.light_up_colour_right[0] < 0:
+                self.light_up_right = 0
+            return False
+        if self.light_up_left:
+            self.light_up_step_left += 1
+            self.light_up_colour_left = self.light_up_palette_left[self.light_up_step_left]
+            if self.light_up_colour_left[0] < 0:
+                self.light_up_left = 0
+            return False
+
+    # Speed of a ball as shown on the court, from how far it moves every tick
+    def hit_speed(self, ball):
+        return int(math.hypot(ball.velocity, round(ball.angle)) * self.SPEED_SCALE)
+
+    def update_speed_left(self, ball):
+        self.speed_left = self.hit_speed(ball)
+
+    def update_speed_right(self, ball):
+        self.speed_right = self.hit_speed(ball)
+
+    # Control circle and ball speed, keys_pressed is indexed like pygame.key.get_pressed()
+    def check_speed_keys(self, keys_pressed):
+        if not self.space_pressed and keys_pressed[pygame.K_SPACE]:
+            self.CIRCLE_SPEED = self.CIRCLE_SPEED * self.CIRCLE_SPEED_UP
+            self.change_velocity_balls(self.CIRCLE_SPEED_UP)
+            self.speed_multiplier_for_text = self.speed_multiplier_for_text * self.CIRCLE_SPEED_UP
+            self.space_pressed = True
+        elif self.space_pressed and not keys_pressed[pygame.K_SPACE]:
+            self.space_pressed = False
+
+        if not self.c_pressed and keys_pressed[pygame.K_c]:
+            self.CIRCLE_SPEED = self.CIRCLE_SPEED / self.CIRCLE_SPEED_UP
+            self.change_velocity_balls(1 / self.CIRCLE_SPEED_UP)
+            self.speed_multiplier_for_text = self.speed_multiplier_for_text / self.CIRCLE_SPEED_UP
+            self.c_pressed = True
+        elif self.c_pressed and not keys_pressed[pygame.K_c]:
+            self.c_pressed = False
+
+    def change_velocity_balls(self, multiplier):
+        for ball in self.balls:
+            ball.change_velocity_ball(multiplier)
+
+    def move_paddles(self, keys_pressed):
+        for paddle in self.paddles:
+            paddle.move_paddle(self.HEIGHT, self.WIDTH, keys_pressed)
+
+    def move_balls(self):
+        if self.CONTINUOUS_COLLISION:
+            for ball in self.balls:
+                self.sweep_ball(ball)
+            return
+        for ball in self.balls:
+            ball.move_ball()
+
+    # Move a ball by one tick, hitting the first paddle in its way at the time of impact and going on
+    # from there with the rest of the tick. Without a hit the ball ends up where move_ball() puts it.
+    def sweep_ball(self, ball):
+        remaining = 1.0
+        for _ in range(self.MAX_BOUNCES):
+            dx = ball.velocity * remaining
+            dy = round(ball.angle) * remaining
+            first_time, first_paddle = None, None
+            for paddle in self.paddles:
+                time = ball.time_of_impact(paddle, dx, dy)
+                if time is not None and (first_time is None or time < first_time):
+                    first_time, first_paddle = time, paddle
+            if first_paddle is None:
+                break
+            ball.y += dy * first_time
+            self.hit_ball(ball, first_paddle)
+            remaining *= 1 - first_time
+        ball.x += ball.velocity * remaining
+        ball.y += round(ball.angle) * remaining
+
+    # Everything that changes during a game, set_state() puts it back
+    def get_state(self):
+        return {
+            'frame': self.frame,
+            'accumulator': self.accumulator,
+            'game_over': self.game_over,
+            'good_hits': self.good_hits,
+            'bad_hits': self.bad_hits,
+            'circle_size': self.circle_size,
+            'circle_direction': self.circle_direction,
+            'circle_speed': self.CIRCLE_SPEED,
+            'space_pressed': self.space_pressed,
+            'c_pressed': self.c_pressed,
+            'speed_left': self.speed_left,
+            'speed_right': self.speed_right,
+            'speed_multiplier_for_text': self.speed_multiplier_for_text,
+            'light_up_right': self.light_up_right,
+            'light_up_good_right': self.light_up_palette_right is self.fade_palettes[True],
+            'light_up_step_right': self.light_up_step_right,
+            'light_up_left': self.light_up_left,
+            'light_up_good_left': self.light_up_palette_left is self.fade_palettes[True],
+            'light_up_step_left': self.light_up_step_left,
+            'paddles': [(paddle.x, paddle.y, paddle.velocity) for paddle in self.paddles],
+            'balls': [(ball.x, ball.y, ball.velocity, ball.angle) for ball in self.balls],
+            'random': self.random.getstate(),
+        }
+
+    def set_state(self, state):
+        if len(state['paddles']) != len(self.paddles):
+            raise ValueError('State has %d players, the court has %d' % (len(state['paddles']), len(self.paddles)))
+        if len(state['balls']) < len(self.balls):
+            raise ValueError('State has %d balls, the court has %d' % (len(state['balls']), len(self.balls)))
+        while len(self.balls) < len(state['balls']):
+            self.add_ball(0, 0, 0, self.BALL_WIDTH, self.BALL_WIDTH)
+
+        self.frame = state['frame']
+        self.accumulator = state['accumulator']
+        self.game_over = state['game_over']
+        self.good_hits = state['good_hits']
+        self.bad_hits = state['bad_hits']
+        self.circle_size = state['circle_size']
+        self.circle_direction = state['circle_direction']
+        self.CIRCLE_SPEED = state['circle_speed']
+        self.space_pressed = state['space_pressed']
+        self.c_pressed = state['c_pressed']
+        self.speed_left = state['speed_left']
+        self.speed_right = state['speed_right']
+        self.speed_multiplier_for_text = state['speed_multiplier_for_text']
+
+        self.light_up_right = state['light_up_right']
+        self.light_up_palette_right = self.fade_palettes[state['light_up_good_right']]
+        self.light_up_step_right = state['light_up_step_right']
+        self.light_up_colour_right = self.light_up_palette_right[self.light_up_step_right]
+        self.light_up_left = state['light_up_left']
+        self.light_up_palette_left = self.fade_palettes[state['light_up_good_left']]
+        self.light_up_step_left = state['light_up_step_left']
+        self.light_up_colour_left = self.light_up_palette_left[self.light_up_step_left]
+
+        for paddle, (x, y, velocity) in zip(self.paddles, state['paddles']):
+            paddle.x, paddle.y, paddle.velocity = x, y, velocity
+        for ball, (x, y, velocity, angle) in zip(self.balls, state['balls']):
+            ball.x, ball.y, ball.velocity, ball.angle = x, y, velocity, angle
+
+        self.random.setstate(state['random'])
+        self.tick_time = self.song_time()
+
+    def song_time(self):
+        if self.song_clock is not None:
+            return self.song_clock()
+        return self.frame * self.TICK
+
+    # Position within the current beat of the tick being simulated, from 0 up to 1
+    def beat_phase(self):
+        return self.beat_clock.phase(self.tick_time)
+
+    # Keys the game reacts to, in a fixed order
+    def input_keys(self):
+        keys = []
+        for paddle in self.paddles:
+            keys.extend([paddle.up_key, paddle.down_key, paddle.left_key, paddle.right_key])
+        keys.extend([pygame.K_SPACE, pygame.K_c])
+        return sorted(set(keys))
+
+    # Advance the court by exactly one fixed tick
+    def tick(self, keys_pressed):
+        self.tick_time = self.song_time()
+        if self.recorder is not None:
+            self.recorder.record(self, keys_pressed)
+
+        self.check_ball_hits_paddle()
+
+        self.check_ball_hits_wall()
+        if self.game_over:
+            if self.spectators is not None:
+                self.spectators.publish(self)
+            if self.checkpoints is not None:
+                self.checkpoints.save(self)
+            return
+
+        # Update lit up sides
+        self.adjust_light_up()
+
+        self.check_speed_keys(keys_pressed)
+
+        # Determine new size circle around player
+        if self.circle_size < self.CIRCLE_MIN_SIZE or self.circle_size > self.CIRCLE_MAX_SIZE:
+            self.circle_direction = -self.circle_direction
+        self.circle_size += self.circle_direction * self.CIRCLE_SPEED
+
+        self.move_paddles(keys_pressed)
+        if self.recorder is not None:
+            self.recorder.record_paddles(self)
+
+        # We know we're not ending the game so lets move the ball here.
+        self.move_balls()
+
+        self.frame += 1
+        if self.spectators is not None:
+            self.spectators.publish(self)
+        if self.checkpoints is not None:
+            self.checkpoints.save(self)
+
+    # Advance the court by dt seconds of real time. Whole ticks are simulated and the remainder is
+    # kept for the next call, so the game plays the same whatever rate step() is called at.
+    # Returns the number of ticks that were simulated.
+    def step(self, dt, inputs):
+        self.accumulator += dt
+        ticks = 0
+        while self.accumulator >= self.TICK and not self.game_over:
+            self.tick(inputs)
+            self.accumulator -= self.TICK
+            ticks += 1
+        return ticks
+
+    # Run ticks until the ball leaves the field or max_ticks is reached, as fast as possible.
+    # Returns the number of ticks the rally lasted.
+    def run_rally(self, inputs=None, max_ticks=100000):
+        if inputs is None:
+            inputs = KeyState()
+        ticks = 0
+        while not self.game_over and ticks < max_ticks:
+            self.tick(inputs)
+            ticks += 1
+        return ticks
+
+
+if __name__ == '__main__':
+    import time
+
+    # Run headless rallies as fast as possible
+    rallies = 1000
+    start = time.perf_counter()
+    total_ticks = 0
+    for _ in range(rallies):
+        total_ticks += Simulation().run_rally()
+    elapsed = time.perf_counter() - start
+    print('%d rallies, %d ticks in %.2f s (%.0f rallies/s, %.0f ticks/s)' %
+          (rallies, total_ticks, elapsed, rallies / elapsed, total_ticks / elapsed))
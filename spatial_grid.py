@@ -0,0 +1,109 @@
+from simulation import Simulation
+
+
+# Uniform grid over the court. Every key is stored in each cell its rect overlaps, so two rects
+# can only collide if they share a cell.
+class SpatialGrid:
+    def __init__(self, width, height, columns, rows):
+        self.columns = columns
+        self.rows = rows
+        self.cell_width = width / columns
+        self.cell_height = height / rows
+        self.cells = {}         # (column, row) -> keys in that cell
+        self.key_bounds = {}    # key -> (first column, first row, last column, last row)
+
+    # Range of cells covered by rect, rects outside the court are clamped to the border cells
+    def bounds(self, rect):
+        first_column = min(max(int(rect.x // self.cell_width), 0), self.columns - 1)
+        last_column = min(max(int((rect.x + rect.width - 1) // self.cell_width), 0), self.columns - 1)
+        first_row = min(max(int(rect.y // self.cell_height), 0), self.rows - 1)
+        last_row = min(max(int((rect.y + rect.height - 1) // self.cell_height), 0), self.rows - 1)
+        return first_column, first_row, last_column, last_row
+
+    def cells_of(self, key):
+        first_column, first_row, last_column, last_row = self.key_bounds[key]
+        return [(column, row) for column in range(first_column, last_column + 1)
+                for row in range(first_row, last_row + 1)]
+
+    # Move key to the cells of rect, nothing changes while it stays within the same cells.
+    # Returns True if the key changed cells.
+    def update(self, key, rect):
+        bounds = self.bounds(rect)
+        if self.key_bounds.get(key) == bounds:
+            return False
+        self.remove(key)
+        self.key_bounds[key] = bounds
+        for cell in self.cells_of(key):
+            self.cells.setdefault(cell, set()).add(key)
+        return True
+
+    def remove(self, key):
+        if key in self.key_bounds:
+            for cell in self.cells_of(key):
+                self.cells[cell].discard(key)
+            del self.key_bounds[key]
+
+    # All keys in any of the given cells
+    def nearby(self, cells):
+        keys = set()
+        for cell in cells:
+            keys.update(self.cells.get(cell, ()))
+        return keys
+
+
+# Simulation that only tests balls against paddles in the same grid cells.
+# The central line and the third lines split the court in six columns, with rows of the same size.
+class GridSimulation(Simulation):
+    GRID_COLUMNS = 6
+    GRID_ROWS = 3
+
+    def __init__(self, seed=None):
+        self.paddle_grid = SpatialGrid(self.WIDTH, self.HEIGHT, self.GRID_COLUMNS, self.GRID_ROWS)
+        self.ball_grid = SpatialGrid(self.WIDTH, self.HEIGHT, self.GRID_COLUMNS, self.GRID_ROWS)
+        self.pair_tests = 0     # Number of colliderect calls, for comparing against testing every pair
+        super().__init__(seed)
+
+    def add_paddle(self, velocity, up_key, down_key, left_key, right_key, x, y, width, height):
+        paddle = super().add_paddle(velocity, up_key, down_key, left_key, right_key, x, y, width, height)
+        self.paddle_grid.update(len(self.paddles) - 1, paddle)
+        return paddle
+
+    def add_ball(self, velocity, x, y, width, height):
+        ball = super().add_ball(velocity, x, y, width, height)
+        self.ball_grid.update(len(self.balls) - 1, ball)
+        return ball
+
+    def set_state(self, state):
+        super().set_state(state)
+        for index, paddle in enumerate(self.paddles):
+            self.paddle_grid.update(index, paddle)
+        for index, ball in enumerate(self.balls):
+            self.ball_grid.update(index, ball)
+
+    def check_ball_hits_paddle(self):
+        for ball_index, ball in enumerate(self.balls):
+            # Paddles are tried in the same order as Simulation so the first hit is the same
+            for paddle_index in sorted(self.paddle_grid.nearby(self.ball_grid.cells_of(ball_index))):
+                paddle = self.paddles[paddle_index]
+                self.pair_tests += 1
+                if ball.colliderect(paddle):
+                    self.hit_ball(ball, paddle)
+                    self.ball_grid.update(ball_index, ball)
+                    self.paddle_grid.update(paddle_index, paddle)
+                    break
+
+    def move_paddles(self, keys_pressed):
+        for index, paddle in enumerate(self.paddles):
+            paddle.move_paddle(self.HEIGHT, self.WIDTH, keys_pressed)
+            self.paddle_grid.update(index, paddle)
+
+    def move_balls(self):
+        if self.CONTINUOUS_COLLISION:
+            # A fast ball crosses many cells in one tick, so it is swept against every paddle
+            super().move_balls()
+            for index, ball in enumerate(self.balls):
+                self.ball_grid.update(index, ball)
+            return
+        for index, ball in enumerate(self.balls):
+            ball.move_ball()
+            self.ball_grid.update(index, ball)
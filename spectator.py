@@ -0,0 +1,446 @@
+import os
+import sys
+import time
+import base64
+import socket
+import struct
+import asyncio
+import hashlib
+import multiprocessing
+from collections import deque
+
+# Every message starts with a header followed by records. A record starts with its kind and the index
+# of the paddle, ball or side it is about; its size follows from the kind. Keyframes hold every record,
+# deltas only the records that changed since the message before and the hits since then. Keyframes also
+# hold the last HIT_HISTORY hits, so a display that was sent a keyframe instead of deltas still sees them;
+# a hit is told apart from the same hit seen before by its frame.
+HEADER = struct.Struct('<BidfH')  # message type, frame, send time (time.time()), beat phase, record count
+KEYFRAME = 1
+DELTA = 2
+STOP = 3  # From the game to the server only
+
+PADDLE = 1
+BALL = 2
+LIGHT = 3
+SPEED = 4
+SCORE = 5
+CIRCLE = 6
+HIT = 7  # Event, in the delta of the tick it happened and in keyframes while it is recent
+RECORDS = {
+    PADDLE: struct.Struct('<BHhh'),         # x, y
+    BALL: struct.Struct('<BHhhff'),         # x, y, velocity, angle
+    LIGHT: struct.Struct('<BHBBBB'),        # side (0 left, 1 right): lit up, red, green, blue
+    SPEED: struct.Struct('<BHH'),           # side: speed shown
+    SCORE: struct.Struct('<BHIIB'),         # good hits, bad hits, game over
+    CIRCLE: struct.Struct('<BHf'),          # size of the pulse rings
+    HIT: struct.Struct('<BHHBi'),           # ball: paddle, good, frame of the hit
+}
+KEY_SIZE = 3  # Kind and index, records with the same key replace each other
+HIT_HISTORY = 16  # Recent hits sent in every state and keyframe
+
+CLIENT_QUEUE = 60  # Messages waiting for a client, about a second, before it is sent a keyframe instead
+SEND_BUFFER = 2048  # Unsent bytes the system keeps for a client before its sender waits
+SERVER_NICE = 5  # The server process runs at a lower priority, so it does not take the CPU from the game
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+# Publishes the state of a court to spectator displays over WebSocket. The game only packs the state
+# of every tick into one datagram and sends it to a server process on this machine, which never
+# blocks the game; the server works out what changed and sends it to every display.
+# Attach it to a Simulation with attach(), it then publishes after every tick.
+class SpectatorFeed:
+    def __init__(self, address=('127.0.0.1', 0), queue_size=CLIENT_QUEUE):
+        ready = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(address, queue_size, ready, self.results),
+                                               daemon=True)
+        self.process.start()
+        self.state_address, self.address = ready.get(timeout=10)  # The WebSocket address, with the real port
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.hits = deque(maxlen=HIT_HISTORY)  # Sent with every state, so a dropped datagram loses no hit
+        self.published = 0
+        self.dropped = 0
+        self.publish_time = 0.0
+        self.server_stats = None  # Known after close()
+
+    def attach(self, simulation):
+        simulation.spectators = self
+
+    # Called by Simulation.hit_ball
+    def record_hit(self, simulation, ball, paddle, good):
+        ball_index = next(index for index, other in enumerate(simulation.balls) if other is ball)
+        paddle_index = next(index for index, other in enumerate(simulation.paddles) if other is paddle)
+        self.hits.append(RECORDS[HIT].pack(HIT, ball_index, paddle_index, good, simulation.frame))
+
+    # Called by Simulation.tick after every tick
+    def publish(self, simulation):
+        start = time.perf_counter()
+        records = state_records(simulation) + list(self.hits)
+        data = HEADER.pack(KEYFRAME, simulation.frame, time.time(), simulation.beat_phase(), len(records))
+        try:
+            self.socket.sendto(data + b''.join(records), self.state_address)
+            self.published += 1
+        except OSError:
+            self.dropped += 1
+        self.publish_time += time.perf_counter() - start
+
+    def close(self):
+        self.socket.sendto(HEADER.pack(STOP, 0, 0.0, 0.0, 0), self.state_address)
+        self.server_stats = self.results.get(timeout=10)
+        self.process.join()
+        self.socket.close()
+
+
+# Records of everything displays show, except hits
+def state_records(simulation):
+    records = [RECORDS[PADDLE].pack(PADDLE, index, paddle.x, paddle.y)
+               for index, paddle in enumerate(simulation.paddles)]
+    records += [RECORDS[BALL].pack(BALL, index, ball.x, ball.y, ball.velocity, ball.angle)
+                for index, ball in enumerate(simulation.balls)]
+    for side, lit, colour, speed in ((0, simulation.light_up_left, simulation.light_up_colour_left,
+                                      simulation.speed_left),
+                                     (1, simulation.light_up_right, simulation.light_up_colour_right,
+                                      simulation.speed_right)):
+        records.append(RECORDS[LIGHT].pack(LIGHT, side, bool(lit), *(min(max(value, 0), 255) for value in colour)))
+        records.append(RECORDS[SPEED].pack(SPEED, side, min(max(speed, 0), 65535)))
+    records.append(RECORDS[SCORE].pack(SCORE, 0, simulation.good_hits, simulation.bad_hits, simulation.game_over))
+    records.append(RECORDS[CIRCLE].pack(CIRCLE, 0, simulation.circle_size))
+    return records
+
+
+# Split the records of a message into (key, record) pairs
+def split_records(data, count, offset=HEADER.size):
+    records = []
+    for _ in range(count):
+        size = RECORDS[data[offset]].size
+        records.append((data[offset:offset + KEY_SIZE], data[offset:offset + size]))
+        offset += size
+    return records
+
+
+# A binary WebSocket frame from the server, servers do not mask their frames
+def websocket_frame(payload, opcode=0x2):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+# Opcode and payload of the next WebSocket frame, masked or not; (None, b'') when the connection closed
+async def read_frame(reader):
+    try:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7f
+        if length == 126:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await reader.readexactly(8))[0]
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None, b''
+    if mask is not None:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return first & 0x0f, payload
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest()).decode()
+
+
+# One display. Messages wait in a bounded queue and are written by the client's own task, so a slow
+# display only holds up itself. When its queue is full the waiting deltas are thrown away and it is
+# sent a keyframe of the current state instead.
+class SpectatorConnection:
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.queue = asyncio.Queue(queue_size)
+        self.resyncs = 0
+        self.sent = 0
+
+    def offer(self, frame, keyframe):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(keyframe())
+            self.resyncs += 1
+
+    async def send(self):
+        while True:
+            frames = [await self.queue.get()]
+            while not self.queue.empty():
+                frames.append(self.queue.get_nowait())
+            self.writer.writelines(frames)
+            self.sent += len(frames)
+            await self.writer.drain()
+
+
+# Runs in the server process: receives states from the game and sends the changes to every display
+class SpectatorServer:
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.connections = set()
+        self.records = {}  # Key -> record of the last state sent
+        self.hits = deque(maxlen=HIT_HISTORY)  # Hit records sent most recently
+        self.header = None  # Frame, send time and beat phase of the last state
+        self.keyframe_message = None
+        self.stopped = asyncio.Event()
+        self.states = 0
+        self.bytes_sent = 0
+        self.connected = 0
+        self.resyncs = 0
+
+    # Keyframe of the last state as a WebSocket frame, made when a display needs one
+    def keyframe(self):
+        if self.keyframe_message is None:
+            frame, sent, phase = self.header or (0, 0.0, 0.0)
+            self.keyframe_message = websocket_frame(
+                HEADER.pack(KEYFRAME, frame, sent, phase, len(self.records) + len(self.hits)) +
+                b''.join(self.records.values()) + b''.join(self.hits))
+        return self.keyframe_message
+
+    def receive(self, data):
+        kind, frame, sent, phase, count = HEADER.unpack_from(data)
+        if kind == STOP:
+            self.stopped.set()
+            return
+        changed = []
+        for key, record in split_records(data, count):
+            if record[0] == HIT:
+                if record not in self.hits:
+                    self.hits.append(record)
+                    changed.append(record)
+            elif self.records.get(key) != record:
+                self.records[key] = record
+                changed.append(record)
+        self.header = (frame, sent, phase)
+        self.keyframe_message = None
+        self.states += 1
+
+        message = websocket_frame(HEADER.pack(DELTA, frame, sent, phase, len(changed)) + b''.join(changed))
+        for connection in self.connections:
+            connection.offer(message, self.keyframe)
+        self.bytes_sent += len(message) * len(self.connections)
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        headers = dict(line.split(b':', 1) for line in request.split(b'\r\n')[1:] if b':' in line)
+        key = {name.strip().lower(): value.strip() for name, value in headers.items()}.get(b'sec-websocket-key')
+        if key is None:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            writer.close()
+            return
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: %s\r\n\r\n' % accept_key(key)).encode())
+        # The sender waits as soon as the system stops taking data, messages then pile up in its queue
+        writer.transport.set_write_buffer_limits(0)
+        sock = writer.get_extra_info('socket')
+        if hasattr(socket, 'TCP_NOTSENT_LOWAT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, SEND_BUFFER)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+
+        connection = SpectatorConnection(writer, self.queue_size)
+        connection.offer(self.keyframe(), self.keyframe)
+        self.connections.add(connection)
+        self.connected += 1
+        sender = asyncio.ensure_future(connection.send())
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode is None or opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    writer.write(websocket_frame(payload, 0xa))
+        finally:
+            self.connections.discard(connection)
+            self.resyncs += connection.resyncs
+            sender.cancel()
+            writer.close()
+
+    async def run(self, address, ready):
+        loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle, *address, backlog=1024)
+        state_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        state_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        state_socket.bind(('127.0.0.1', 0))
+        transport, _ = await loop.create_datagram_endpoint(lambda: StateProtocol(self), sock=state_socket)
+        ready.put((state_socket.getsockname(), server.sockets[0].getsockname()[:2]))
+
+        await self.stopped.wait()
+        server.close()
+        for connection in list(self.connections):
+            connection.writer.write(websocket_frame(b'', 0x8))
+            connection.writer.close()
+        transport.close()
+
+
+class StateProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, address):
+        self.server.receive(data)
+
+
+# Server process started by SpectatorFeed
+def serve(address, queue_size, ready, results):
+    if hasattr(os, 'nice'):
+        os.nice(SERVER_NICE)
+    server = SpectatorServer(queue_size)
+    asyncio.run(server.run(address, ready))
+    results.put({'states': server.states, 'connected': server.connected, 'bytes_sent': server.bytes_sent,
+                 'resyncs': server.resyncs + sum(connection.resyncs for connection in server.connections)})
+
+
+# State of the court as a display sees it, kept up to date from the messages of the feed
+class SpectatorState:
+    def __init__(self):
+        self.records = {}
+        self.frame = None
+        self.sent = 0.0
+        self.beat_phase = 0.0
+        self.hits = []  # (ball, paddle, good, frame) of every hit seen
+        self.keyframes = 0
+
+    def apply(self, message):
+        kind, self.frame, self.sent, self.beat_phase, count = HEADER.unpack_from(message)
+        if kind == KEYFRAME:
+            self.records = {}
+            self.keyframes += 1
+        for key, record in split_records(message, count):
+            if record[0] == HIT:
+                hit = RECORDS[HIT].unpack(record)[1:]
+                if hit not in self.hits[-HIT_HISTORY:]:
+                    self.hits.append(hit)
+            else:
+                self.records[key] = record
+
+    # Fields of every record of a kind by index, e.g. values(BALL)[0] == (x, y, velocity, angle)
+    def values(self, kind):
+        return {index: fields for _, index, *fields in (RECORDS[kind].unpack(record)
+                                                       for key, record in self.records.items() if key[0] == kind)}
+
+
+# Open a WebSocket connection to the feed. With a small buffer a slow client does not read far ahead
+# of what it has handled, like a display that cannot keep up.
+async def connect(host, port, buffer=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (host, port))
+    if buffer:
+        reader, writer = await asyncio.open_connection(sock=sock, limit=buffer)
+    else:
+        reader, writer = await asyncio.open_connection(sock=sock)
+    key = base64.b64encode(hashlib.sha1(str(time.perf_counter()).encode()).digest()[:16])
+    writer.write(b'GET / HTTP/1.1\r\nHost: %s:%d\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                 b'Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n' % (host.encode(), port, key))
+    response = await reader.readuntil(b'\r\n\r\n')
+    if not response.startswith(b'HTTP/1.1 101') or accept_key(key).encode() not in response:
+        raise ConnectionError('%s:%d is not a spectator feed' % (host, port))
+    return reader, writer
+
+
+# Load test: clients displays that each keep a SpectatorState for `seconds`. Slow clients stop reading
+# for `stall` seconds after every `stall` seconds of reading, like a display that hangs now and then.
+# Returns per client the messages, keyframes after the first and latencies.
+async def load_test(host, port, clients, seconds, slow=0, stall=3.0):
+    async def client(slow_client):
+        reader, writer = await connect(host, port, 1024 if slow_client else None)
+        state = SpectatorState()
+        latencies = []
+        messages = 0
+        end = time.perf_counter() + seconds
+        next_stall = time.perf_counter() + stall
+        while time.perf_counter() < end:
+            try:
+                opcode, payload = await asyncio.wait_for(read_frame(reader), max(end - time.perf_counter(), 0.001))
+            except asyncio.TimeoutError:
+                break
+            if opcode != 0x2:
+                break
+            state.apply(payload)
+            latencies.append(time.time() - state.sent)
+            messages += 1
+            if slow_client and time.perf_counter() > next_stall:
+                await asyncio.sleep(stall)
+                next_stall = time.perf_counter() + stall
+        writer.write(bytes([0x88, 0x80]) + bytes(4))  # Masked close frame
+        writer.close()
+        return {'slow': slow_client, 'messages': messages, 'resyncs': state.keyframes - 1, 'latencies': latencies,
+                'hits': len(state.hits), 'state': state}
+
+    return await asyncio.gather(*(client(index < slow) for index in range(clients)))
+
+
+def run_load_test(host, port, clients, seconds, slow, results):
+    outcome = asyncio.run(load_test(host, port, clients, seconds, slow))
+    results.put([{name: value for name, value in result.items() if name != 'state'} for result in outcome])
+
+
+if __name__ == '__main__':
+    # python spectator.py [clients] [seconds] [slow clients]
+    # Plays a headless court of two bots at 60 ticks per second with the feed attached, while a load
+    # test in another process connects the clients, and reports what the feed costs the game loop.
+    import numpy as np
+    from simulation import Simulation, KeyState
+
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    slow = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    court = type('Court', (Simulation,), {'BOT_PLAYERS': (0, 1), 'BOT_DIFFICULTY': 'hard'})
+
+    feed = SpectatorFeed()
+    results = multiprocessing.Queue()
+    tester = multiprocessing.Process(target=run_load_test, args=(*feed.address, clients, seconds, slow, results))
+    tester.start()
+
+    simulation = court(seed=1)
+    feed.attach(simulation)
+    late = []
+    start = time.perf_counter()
+    tick = 0
+    while tick < (seconds + 2) * 60:
+        simulation.tick(KeyState())
+        if simulation.game_over:
+            simulation = court(seed=tick)
+            feed.attach(simulation)
+        tick += 1
+        wait = start + tick / 60 - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        else:
+            late.append(-wait)
+    outcome = results.get()
+    tester.join()
+    feed.close()
+
+    print('%d clients (%d slow) for %.0f s' % (clients, slow, seconds))
+    for slow_client, name in ((False, 'normal'), (True, 'slow')):
+        group = [result for result in outcome if result['slow'] == slow_client]
+        if not group:
+            continue
+        latencies = np.concatenate([result['latencies'] for result in group]) * 1000
+        print('%-6s messages per client %.0f, keyframes after the first %.1f, hits seen %.1f, '
+              'latency p50 %.2f ms p99 %.2f ms' %
+              (name, np.mean([result['messages'] for result in group]),
+               np.mean([result['resyncs'] for result in group]), np.mean([result['hits'] for result in group]),
+               np.percentile(latencies, 50), np.percentile(latencies, 99)))
+    print('server: %(states)d states, %(connected)d connections, %(resyncs)d keyframes for slow clients, '
+          '%(bytes_sent)d bytes' % feed.server_stats)
+    print('game loop: publish() %.1f us per tick, %d datagrams dropped, %d of %d ticks late' %
+          (feed.publish_time / max(feed.published, 1) * 1e6, feed.dropped, len(late), tick))
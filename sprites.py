@@ -0,0 +1,36 @@
+import pygame
+
+
+# Circles drawn once per radius and blitted afterwards, gives the same pixels as pygame.draw.circle
+class CircleSprites:
+    def __init__(self, colour, width=0):
+        self.colour = colour
+        self.width = width
+        self.sprites = {}   # radius -> (surface, offset of its top left corner from the centre)
+
+    def render(self, radius):
+        size = 2 * radius + 2
+        surface = pygame.Surface((size, size))
+        colour_key = (0, 0, 0) if self.colour != (0, 0, 0) else (255, 255, 255)
+        surface.fill(colour_key)
+        rect = pygame.draw.circle(surface, self.colour, (radius + 1, radius + 1), radius, self.width)
+        sprite = surface.subsurface(rect).copy()
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()   # Same pixel format as the screen makes blitting cheaper
+        sprite.set_colorkey(colour_key, pygame.RLEACCEL)
+        return sprite, (rect.x - radius - 1, rect.y - radius - 1)
+
+    def get(self, radius):
+        sprite = self.sprites.get(radius)
+        if sprite is None:
+            sprite = self.sprites[radius] = self.render(radius)
+        return sprite
+
+    def warm(self, radii):
+        for radius in radii:
+            self.get(radius)
+
+    # Blit the circle around centre, returns the rect that was drawn on like pygame.draw.circle
+    def draw(self, surface, centre, radius):
+        sprite, (dx, dy) = self.get(radius)
+        return surface.blit(sprite, (centre[0] + dx, centre[1] + dy))
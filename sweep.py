@@ -0,0 +1,122 @@
+import os
+import csv
+import sys
+import json
+import time
+import random
+import itertools
+import pygame
+import numpy as np
+from multiprocessing import Pool
+from simulation import Simulation, KeyState
+
+# Simulation constants to try, every combination is one row of the results.
+# Give a JSON file with the same layout as the second argument to sweep other values.
+GRID = {
+    'BALL_VELOCITY': [4, 5, 7],
+    'CIRCLE_SPEED_UP': [1.25, 1.5],
+    'PADDLE_VELOCITY': [6, 8, 10],
+    'ANGLE_POSITION': [0.5, 1],
+    'ANGLE_RANDOM': [0.5, 1],
+}
+
+RALLIES = 50            # Rallies played for every combination
+MAX_TICKS = 20000       # A rally is stopped after this many ticks, counted as a timeout
+REACTION = 0.8          # Chance per tick that a scripted player follows the ball
+SPEED_UP_CHANCE = 0.002     # Chance per tick that SPACE is pressed, so CIRCLE_SPEED_UP has an effect
+SEED = 0
+
+COLUMNS = ['rallies', 'timeouts', 'mean_rally_seconds', 'max_rally_seconds', 'hits_per_rally',
+           'hits_per_minute', 'good_ratio', 'bad_ratio']
+
+
+# Scripted players: each one moves up or down towards the ball when it comes their way
+def scripted_inputs(simulation, rng):
+    pressed = []
+    for paddle in simulation.paddles:
+        ball = min(simulation.balls, key=lambda b: abs(b.centerx - paddle.centerx))
+        coming = (ball.velocity > 0) == (ball.centerx < paddle.centerx)
+        if coming and rng.random() < REACTION:
+            if ball.centery < paddle.centery - paddle.height / 4:
+                pressed.append(paddle.up_key)
+            elif ball.centery > paddle.centery + paddle.height / 4:
+                pressed.append(paddle.down_key)
+    if rng.random() < SPEED_UP_CHANCE:
+        pressed.append(pygame.K_SPACE)
+    return KeyState(pressed)
+
+
+# Play RALLIES rallies with the constants in params, returns params and the aggregated results
+def run_task(task):
+    index, params = task
+    simulation_class = type('SweepSimulation', (Simulation,), dict(params))
+    rng = random.Random(SEED * 1000003 + index)
+    ticks = []
+    good_hits = 0
+    bad_hits = 0
+    timeouts = 0
+    for rally in range(RALLIES):
+        simulation = simulation_class(seed=rng.getrandbits(32))
+        tick = 0
+        while not simulation.game_over and tick < MAX_TICKS:
+            simulation.tick(scripted_inputs(simulation, rng))
+            tick += 1
+        ticks.append(tick)
+        timeouts += not simulation.game_over
+        good_hits += simulation.good_hits
+        bad_hits += simulation.bad_hits
+
+    seconds = np.array(ticks) * Simulation.TICK
+    hits = good_hits + bad_hits
+    results = {
+        'rallies': RALLIES,
+        'timeouts': timeouts,
+        'mean_rally_seconds': seconds.mean(),
+        'max_rally_seconds': seconds.max(),
+        'hits_per_rally': hits / RALLIES,
+        'hits_per_minute': hits / seconds.sum() * 60,
+        'good_ratio': good_hits / hits if hits else 0.0,
+        'bad_ratio': bad_hits / hits if hits else 0.0,
+    }
+    return params, results
+
+
+def tasks(grid):
+    names = list(grid)
+    for index, values in enumerate(itertools.product(*(grid[name] for name in names))):
+        yield index, list(zip(names, values))
+
+
+# Run the sweep on all cores, every row is written to path as soon as its worker finishes
+def sweep(path, grid=GRID, processes=None):
+    names = list(grid)
+    count = 0
+    with open(path, 'w', newline='') as file, Pool(processes) as pool:
+        writer = csv.writer(file)
+        writer.writerow(names + COLUMNS)
+        for params, results in pool.imap_unordered(run_task, tasks(grid)):
+            writer.writerow([value for _, value in params] + [results[column] for column in COLUMNS])
+            file.flush()
+            count += 1
+    return count
+
+
+# Same table as a compressed NPZ file with one array per column
+def csv_to_npz(csv_path, npz_path):
+    with open(csv_path, newline='') as file:
+        rows = list(csv.reader(file))
+    header, values = rows[0], np.array(rows[1:], dtype=float).reshape(-1, len(rows[0]))
+    np.savez_compressed(npz_path, **{name: values[:, column] for column, name in enumerate(header)})
+
+
+if __name__ == '__main__':
+    # python sweep.py <results.csv> [grid.json]
+    path = sys.argv[1]
+    grid = GRID
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as file:
+            grid = json.load(file)
+    start = time.perf_counter()
+    count = sweep(path, grid)
+    csv_to_npz(path, os.path.splitext(path)[0] + '.npz')
+    print('%d combinations in %.1f s, written to %s' % (count, time.perf_counter() - start, path))
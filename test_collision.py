@@ -0,0 +1,62 @@
+import random
+import pygame
+import pytest
+from simulation import Simulation, KeyState
+from vector_simulation import VectorSimulation
+from spatial_grid import GridSimulation
+from benchmark_collision import fire
+
+# Swept collision (CONTINUOUS_COLLISION) at 1x, 5x and 20x the normal ball speed, and the claim the
+# vector and grid simulations rest on: they play exactly the same game as Simulation.
+# python -m pytest test_collision.py
+
+TRIALS = 50
+SIMULATIONS = [Simulation, VectorSimulation, GridSimulation]
+
+
+# Balls fired at the right paddle from random distances and heights where they must hit it
+@pytest.mark.parametrize('simulation_class', SIMULATIONS)
+@pytest.mark.parametrize('multiplier', [1, 5, 20])
+def test_swept_ball_hits_paddle(simulation_class, multiplier):
+    rng = random.Random(multiplier)
+    missed = [trial for trial in range(TRIALS) if not fire(simulation_class, True, multiplier, rng)[0]]
+    assert missed == []
+
+
+# Without sweeping a fast ball passes through the paddle, otherwise the test above proves nothing
+def test_discrete_ball_passes_through_at_20x():
+    rng = random.Random(20)
+    assert not all(fire(Simulation, False, 20, rng)[0] for _ in range(TRIALS))
+
+
+# A court played by bots, with extra balls and the circle speed key pressed now and then. Positions are
+# whole pixels, like everywhere in the game.
+def play(simulation_class, seed, continuous, extra_balls, ball_speed, ticks=2000):
+    court = type(simulation_class.__name__, (simulation_class,),
+                 {'CONTINUOUS_COLLISION': continuous, 'BOT_PLAYERS': (0, 1), 'BOT_DIFFICULTY': 'hard'})(seed)
+    rng = random.Random(seed)
+    for ball in court.balls:
+        ball.velocity *= ball_speed
+    for _ in range(extra_balls):
+        ball = court.add_ball(rng.choice([-1, 1]) * rng.randint(3, 6) * ball_speed, rng.randint(300, 900),
+                              rng.randint(100, 500), court.BALL_WIDTH, court.BALL_WIDTH)
+        ball.angle = rng.randint(-2, 2)
+    states = []
+    for _ in range(ticks):
+        if court.game_over:
+            break
+        court.tick(KeyState([pygame.K_SPACE] if rng.random() < 0.05 else []))
+        states.append(court.get_state())
+    return states
+
+
+@pytest.mark.parametrize('simulation_class', [VectorSimulation, GridSimulation])
+@pytest.mark.parametrize('continuous', [False, True])
+@pytest.mark.parametrize('extra_balls, ball_speed', [(0, 1), (2, 1), (0, 5), (2, 5)])
+def test_same_game_as_simulation(simulation_class, continuous, extra_balls, ball_speed):
+    for seed in range(3):
+        expected = play(Simulation, seed, continuous, extra_balls, ball_speed)
+        states = play(simulation_class, seed, continuous, extra_balls, ball_speed)
+        assert len(states) == len(expected)
+        for tick, (state, reference) in enumerate(zip(states, expected)):
+            assert state == reference, 'tick %d of seed %d' % (tick, seed)
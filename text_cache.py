@@ -0,0 +1,108 @@
+import os
+import json
+import tempfile
+import threading
+import pygame
+from collections import OrderedDict
+
+# Font files found for system font names, delete it after installing fonts
+FONT_CACHE = os.path.join(tempfile.gettempdir(), 'pong_font_paths.json')
+
+
+# Font of a system font by name, like pygame.font.SysFont. Looking a name up scans every installed
+# font, which is slow on some machines, so the file found is kept in cache_path for the next start.
+# None is kept too when the font is not installed, pygame's default font is used then.
+def load_font(name, size, cache_path=FONT_CACHE):
+    try:
+        with open(cache_path) as file:
+            paths = json.load(file)
+    except (OSError, ValueError):
+        paths = {}
+    if name not in paths or (paths[name] is not None and not os.path.exists(paths[name])):
+        paths[name] = pygame.font.match_font(name)
+        try:
+            with open(cache_path, 'w') as file:
+                json.dump(paths, file)
+        except OSError:
+            pass  # Found again on the next start
+    return pygame.font.Font(paths[name], size)
+
+
+# Bounded LRU cache of rendered and rotated numbers, since rendering a big font and rotating it is slow.
+# Surfaces can be rendered ahead of time with warm(), also from a background thread; the font is
+# only used while holding the lock so it is never used by two threads at once. warm_in_background()
+# keeps one warming thread, keys handed over while it is busy replace the ones still waiting.
+class SpeedTextCache:
+    def __init__(self, font, size=64):
+        self.font = font
+        self.size = size
+        self.surfaces = OrderedDict()   # (value, colour, rotation) -> surface, least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.warmed = 0
+        self.pending = None  # Keys waiting for the warming thread
+        self.warmer = None
+
+    def render(self, value, colour, rotation):
+        surface = self.font.render(str(value), False, colour)
+        return pygame.transform.rotate(surface, rotation)
+
+    def store(self, key, surface):
+        self.surfaces[key] = surface
+        self.surfaces.move_to_end(key)
+        while len(self.surfaces) > self.size:
+            self.surfaces.popitem(last=False)
+
+    def get(self, value, colour, rotation):
+        key = (value, tuple(colour), rotation)
+        with self.lock:
+            surface = self.surfaces.get(key)
+            if surface is not None:
+                self.surfaces.move_to_end(key)
+                self.hits += 1
+                return surface
+            self.misses += 1
+            surface = self.render(*key)
+            self.store(key, surface)
+            return surface
+
+    # Render every (value, colour, rotation) in keys that is not cached yet, does not count as a miss.
+    # Keys that are cached already count as just used, so rendering the others does not throw them out.
+    def warm(self, keys):
+        for value, colour, rotation in keys:
+            key = (value, tuple(colour), rotation)
+            with self.lock:
+                if key in self.surfaces:
+                    self.surfaces.move_to_end(key)
+                else:
+                    self.store(key, self.render(*key))
+                    self.warmed += 1
+
+    def warm_in_background(self, keys):
+        with self.lock:
+            self.pending = list(keys)
+            if self.warmer is None:
+                self.warmer = threading.Thread(target=self.warm_pending, daemon=True)
+                self.warmer.start()
+            return self.warmer
+
+    def warm_pending(self):
+        while True:
+            with self.lock:
+                keys, self.pending = self.pending, None
+                if keys is None:
+                    self.warmer = None
+                    return
+            self.warm(keys)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'warmed': self.warmed,
+                'size': len(self.surfaces),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
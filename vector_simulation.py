@@ -0,0 +1,288 @@
+import pygame
+import numpy as np
+from simulation import Simulation, Ball
+
+
+# pygame.Rect rounds coordinates half away from zero, do the same so both simulations agree
+def round_rect(values):
+    return np.trunc(values + np.copysign(0.5, values)).astype(np.int64)
+
+
+# Positions, sizes, velocities and angles of all balls and paddles, one array per field
+class CourtState:
+    BALL_FIELDS = {'ball_x': np.int64, 'ball_y': np.int64, 'ball_width': np.int64, 'ball_height': np.int64,
+                   'ball_velocity': np.float64, 'ball_angle': np.float64}
+    PADDLE_FIELDS = {'paddle_x': np.int64, 'paddle_y': np.int64, 'paddle_width': np.int64,
+                     'paddle_height': np.int64, 'paddle_velocity': np.float64}
+
+    def __init__(self, capacity=16):
+        self.ball_count = 0
+        self.paddle_count = 0
+        self.paddle_keys = []  # (up, down, left, right) key codes for every paddle
+        self.paddle_controllers = []  # Controller of every paddle, None for paddles moved by keys
+        for name, dtype in {**self.BALL_FIELDS, **self.PADDLE_FIELDS}.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    # Double the size of the arrays when they are full, views keep working since they look up by index
+    def grow(self, fields, count):
+        for name in fields:
+            array = getattr(self, name)
+            if count == len(array):
+                grown = np.zeros(2 * len(array), dtype=array.dtype)
+                grown[:count] = array
+                setattr(self, name, grown)
+
+    def add_ball(self, velocity, x, y, width, height):
+        self.grow(self.BALL_FIELDS, self.ball_count)
+        index = self.ball_count
+        self.ball_x[index] = round_rect(x)
+        self.ball_y[index] = round_rect(y)
+        self.ball_width[index] = width
+        self.ball_height[index] = height
+        self.ball_velocity[index] = velocity
+        self.ball_angle[index] = 0
+        self.ball_count += 1
+        return index
+
+    def add_paddle(self, velocity, up_key, down_key, left_key, right_key, x, y, width, height):
+        self.grow(self.PADDLE_FIELDS, self.paddle_count)
+        index = self.paddle_count
+        self.paddle_x[index] = round_rect(x)
+        self.paddle_y[index] = round_rect(y)
+        self.paddle_width[index] = width
+        self.paddle_height[index] = height
+        self.paddle_velocity[index] = velocity
+        self.paddle_keys.append((up_key, down_key, left_key, right_key))
+        self.paddle_controllers.append(None)
+        self.paddle_count += 1
+        return index
+
+    # Same as Ball.move_ball for every ball
+    def move_balls(self):
+        n = self.ball_count
+        self.ball_x[:n] = round_rect(self.ball_x[:n] + self.ball_velocity[:n])
+        self.ball_y[:n] += np.round(self.ball_angle[:n]).astype(np.int64)
+
+    # Same as Paddle.move_paddle for every paddle moved by keys, each direction is applied in turn like the
+    # original. Paddles with a controller are left alone.
+    def move_paddles(self, board_height, board_width, keys_pressed):
+        n = self.paddle_count
+        if n == 0:
+            return
+        pressed = np.array([[keys_pressed[key] and controller is None for key in keys]
+                            for keys, controller in zip(self.paddle_keys, self.paddle_controllers)], dtype=bool)
+        x = self.paddle_x[:n]
+        y = self.paddle_y[:n]
+        velocity = self.paddle_velocity[:n]
+
+        move = pressed[:, 0] & (y - velocity > 0)
+        y[move] = round_rect(y[move] - velocity[move])
+        move = pressed[:, 1] & (y + velocity < board_height - self.paddle_height[:n])
+        y[move] = round_rect(y[move] + velocity[move])
+        move = pressed[:, 2] & (x + velocity > 0)
+        x[move] = round_rect(x[move] - velocity[move])
+        move = pressed[:, 3] & (x + velocity < board_width - self.paddle_width[:n])
+        x[move] = round_rect(x[move] + velocity[move])
+
+    # Mask of balls that left the field
+    def balls_out(self, board_height, board_width, ball_width):
+        n = self.ball_count
+        x = self.ball_x[:n]
+        y = self.ball_y[:n]
+        return (x > board_width) | (x < 0) | (y > board_height - ball_width) | (y < 0)
+
+    # AABB test of every ball against every paddle, same rules as pygame.Rect.colliderect.
+    # Returns the indices of the balls that hit a paddle and the first paddle each of them hit.
+    def collisions(self):
+        n = self.ball_count
+        m = self.paddle_count
+        bx = self.ball_x[:n, None]
+        by = self.ball_y[:n, None]
+        px = self.paddle_x[None, :m]
+        py = self.paddle_y[None, :m]
+        overlap = (bx < px + self.paddle_width[None, :m]) & (px < bx + self.ball_width[:n, None]) & \
+                  (by < py + self.paddle_height[None, :m]) & (py < by + self.ball_height[:n, None])
+        hit = overlap.any(axis=1)
+        return np.flatnonzero(hit), overlap.argmax(axis=1)[hit]
+
+
+# Ball stored in a CourtState, can be used like Ball and drawn with pygame.draw.rect
+class BallView:
+    __slots__ = ('state', 'index')
+
+    def __init__(self, state, index):
+        self.state = state
+        self.index = index
+
+    @property
+    def x(self):
+        return int(self.state.ball_x[self.index])
+
+    @x.setter
+    def x(self, value):
+        self.state.ball_x[self.index] = round_rect(value)
+
+    @property
+    def y(self):
+        return int(self.state.ball_y[self.index])
+
+    @y.setter
+    def y(self, value):
+        self.state.ball_y[self.index] = round_rect(value)
+
+    @property
+    def width(self):
+        return int(self.state.ball_width[self.index])
+
+    @property
+    def height(self):
+        return int(self.state.ball_height[self.index])
+
+    @property
+    def velocity(self):
+        return float(self.state.ball_velocity[self.index])
+
+    @velocity.setter
+    def velocity(self, value):
+        self.state.ball_velocity[self.index] = value
+
+    @property
+    def angle(self):
+        return float(self.state.ball_angle[self.index])
+
+    @angle.setter
+    def angle(self, value):
+        self.state.ball_angle[self.index] = value
+
+    @property
+    def rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
+
+    def colliderect(self, other):
+        return self.rect.colliderect(other)
+
+    def move_ball(self):
+        self.x += self.velocity
+        self.y += round(self.angle)
+
+    def change_velocity_ball(self, multiplier):
+        self.velocity = self.velocity * multiplier
+
+    time_of_impact = Ball.time_of_impact
+
+
+# Paddle stored in a CourtState, can be used like Paddle and drawn with pygame.draw.rect
+class PaddleView:
+    __slots__ = ('state', 'index')
+
+    def __init__(self, state, index):
+        self.state = state
+        self.index = index
+
+    @property
+    def x(self):
+        return int(self.state.paddle_x[self.index])
+
+    @x.setter
+    def x(self, value):
+        self.state.paddle_x[self.index] = round_rect(value)
+
+    @property
+    def y(self):
+        return int(self.state.paddle_y[self.index])
+
+    @y.setter
+    def y(self, value):
+        self.state.paddle_y[self.index] = round_rect(value)
+
+    @property
+    def width(self):
+        return int(self.state.paddle_width[self.index])
+
+    @property
+    def height(self):
+        return int(self.state.paddle_height[self.index])
+
+    @property
+    def velocity(self):
+        return float(self.state.paddle_velocity[self.index])
+
+    @velocity.setter
+    def velocity(self, value):
+        self.state.paddle_velocity[self.index] = value
+
+    @property
+    def controller(self):
+        return self.state.paddle_controllers[self.index]
+
+    @controller.setter
+    def controller(self, value):
+        self.state.paddle_controllers[self.index] = value
+
+    @property
+    def up_key(self):
+        return self.state.paddle_keys[self.index][0]
+
+    @property
+    def down_key(self):
+        return self.state.paddle_keys[self.index][1]
+
+    @property
+    def left_key(self):
+        return self.state.paddle_keys[self.index][2]
+
+    @property
+    def right_key(self):
+        return self.state.paddle_keys[self.index][3]
+
+    @property
+    def rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
+
+    def colliderect(self, other):
+        return self.rect.colliderect(other)
+
+
+# Simulation that moves and collides all balls and paddles at once with NumPy.
+# self.balls and self.paddles hold views, so code written against Simulation keeps working.
+# Collisions are found against the paddle positions at the start of the tick, hits are then
+# handled one by one in ball order like in Simulation.
+class VectorSimulation(Simulation):
+    def __init__(self, seed=None):
+        self.state = CourtState()
+        super().__init__(seed)
+
+    def add_paddle(self, velocity, up_key, down_key, left_key, right_key, x, y, width, height):
+        paddle = PaddleView(self.state, self.state.add_paddle(velocity, up_key, down_key, left_key, right_key,
+                                                              x, y, width, height))
+        self.paddles.append(paddle)
+        return paddle
+
+    def add_ball(self, velocity, x, y, width, height):
+        ball = BallView(self.state, self.state.add_ball(velocity, x, y, width, height))
+        self.balls.append(ball)
+        return ball
+
+    def check_ball_hits_wall(self):
+        if self.state.balls_out(self.HEIGHT, self.WIDTH, self.BALL_WIDTH).any():
+            self.game_over = True
+
+    def check_ball_hits_paddle(self):
+        for ball_index, paddle_index in zip(*self.state.collisions()):
+            self.hit_ball(self.balls[ball_index], self.paddles[paddle_index])
+
+    def change_velocity_balls(self, multiplier):
+        self.state.ball_velocity[:self.state.ball_count] *= multiplier
+
+    def move_paddles(self, keys_pressed):
+        self.state.move_paddles(self.HEIGHT, self.WIDTH, keys_pressed)
+        for paddle, controller in zip(self.paddles, self.state.paddle_controllers):
+            if controller is not None:
+                controller.move_paddle(paddle, self.HEIGHT, self.WIDTH)
+
+    # Swept balls are moved one by one, hits within a tick depend on each other
+    def move_balls(self):
+        if self.CONTINUOUS_COLLISION:
+            super().move_balls()
+            return
+        self.state.move_balls()